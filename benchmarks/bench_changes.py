@@ -0,0 +1,100 @@
+"""
+Fan-out of /api/products/changes to many open dashboards in one worker, on
+the in-memory Firestore stand-in.
+
+Opens --streams anonymous event streams, then writes --writes products one
+after another and reports how long each event took from the write to every
+stream (p50/p99), plus events delivered and CPU time used per stream.
+
+Usage:
+    python benchmarks/bench_changes.py [--streams 200] [--writes 50] [--interval 0.02]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Change stream fan-out")
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between product writes")
+    args = parser.parse_args()
+
+    os.environ["STORE_BACKEND"] = "memory"
+    os.environ["ALLOW_MEMORY_BACKEND"] = "1"
+    os.environ["CHANGES_MAX_STREAMS"] = str(args.streams)
+    os.environ.setdefault("CHANGES_HEARTBEAT", "1")
+    logging.disable(logging.ERROR)
+    import main as app_main
+
+    app = app_main.create_app()
+    latencies = []
+    delivered = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+    connected = threading.Barrier(args.streams + 1)
+
+    def reader():
+        resp = app.test_client().get("/api/products/changes", buffered=False)
+        chunks = iter(resp.response)
+        next(chunks)   # retry + initial id
+        connected.wait()
+        try:
+            for chunk in chunks:
+                now = time.perf_counter()
+                text = chunk.decode() if isinstance(chunk, bytes) else chunk
+                for line in text.splitlines():
+                    if line.startswith("data: "):
+                        sent = json.loads(line[6:]).get("name", "")
+                        if sent.startswith("bench "):
+                            with lock:
+                                latencies.append(now - float(sent[6:]))
+                                delivered[0] += 1
+                if stop.is_set():
+                    return
+        finally:
+            resp.close()
+
+    app_main.product_changes.ensure_started()
+    app_main.product_changes.ready.wait(5)
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(args.streams)]
+    for t in threads:
+        t.start()
+    connected.wait()
+
+    client = app.test_client()
+    headers = {"Authorization": "Bearer bench-user"}
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for _ in range(args.writes):
+        client.post("/api/products", json={"name": f"bench {time.perf_counter()!r}", "price": 1, "quantity": 1},
+                    headers=headers)
+        time.sleep(args.interval)
+    deadline = time.monotonic() + 10
+    while delivered[0] < args.streams * args.writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    stop.set()
+
+    print(f"streams: {args.streams}  writes: {args.writes}  events delivered: {delivered[0]}"
+          f"/{args.streams * args.writes}")
+    print(f"delivery latency  p50 {percentile(latencies, 0.5) * 1000:.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"CPU {cpu:.2f}s over {elapsed:.2f}s  ({cpu / max(1, delivered[0]) * 1e6:.0f} us per delivered event)")
+
+
+if __name__ == "__main__":
+    main()
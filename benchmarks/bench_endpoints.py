@@ -0,0 +1,220 @@
+"""
+Offline benchmark of every route in main.py.
+
+Runs the app in-process on the in-memory Firestore stand-in
+(STORE_BACKEND=memory, see fake_firestore.py) and the fake AI model, so it
+needs no credentials or network and can run in CI. For each route it
+reports throughput, p50/p95/p99 latency and Firestore operations per
+request.
+
+Usage:
+    python benchmarks/bench_endpoints.py [--products 500] [--requests 200]
+        [--scan-requests 5] [--latency 0.002] [--concurrency 1] [--only products] [--json]
+
+--latency simulates the Firestore round trip (seconds per RPC). Routes that
+read the whole products collection (FULL_SCANS) run only --scan-requests
+times, since the collection grows to thousands of products during the run.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+ADMIN = "bench-admin"
+USER = "bench-user"
+FULL_SCANS = {"POST /api/admin/analytics/rebuild", "GET /api/admin/products/export"}
+
+
+def auth(uid):
+    return {"Authorization": f"Bearer {uid}"}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Bench:
+    def __init__(self, main, args):
+        self.main = main
+        self.db = main.db
+        self.args = args
+        self.app = main.create_app()
+        self.client = self.app.test_client()
+        self.counter = itertools.count()
+
+    # --- setup helpers (not timed) ---------------------------------------
+    def seed(self):
+        self.db.collection("users").document(ADMIN).set({"email": "admin@example.com", "role": "admin", "active": True})
+        self.db.collection("users").document(USER).set({"email": "user@example.com", "role": "publisher", "active": True})
+        for i in range(self.args.products):
+            owner = USER if i % 2 else None
+            self.new_product(owner, name=f"منتج {i}")
+
+    def new_product(self, owner=USER, name=None, status="available"):
+        data = {
+            "name": name or f"product {next(self.counter)}",
+            "price": 10.0,
+            "quantity": 5,
+            "description": "وصف المنتج " * 20,
+            "image_url": "https://example.com/p.png",
+            "creator_uid": owner,
+            "added_by": "user@example.com",
+            "status": status,
+            "created_at": self.main.firestore.SERVER_TIMESTAMP,
+        }
+        _, ref = self.db.collection("products").add(data)
+        return ref.id
+
+    def new_job(self):
+        resp = self.client.post("/api/admin/jobs", json={"action": "mark_out_of_stock_unavailable"}, headers=auth(ADMIN))
+        return resp.get_json()["job_id"]
+
+    def new_reservation(self):
+        product_id = self.new_product()
+        resp = self.client.post(f"/api/products/{product_id}/reserve", json={"quantity": 1}, headers=auth(USER))
+        return product_id, resp.get_json()["reservation_id"]
+
+    def new_user(self):
+        _, ref = self.db.collection("users").add({"email": f"u{next(self.counter)}@example.com", "role": "viewer", "active": True})
+        return ref.id
+
+    def wait_background(self):
+        """Let rollup writes, jobs and listener callbacks finish before reading counters."""
+        for executor in (self.main.rollup_executor, self.main.job_executor, self.main.ai_executor):
+            executor.submit(lambda: None).result()
+        self.db.flush_listeners()
+
+    # --- scenarios -------------------------------------------------------
+    def scenarios(self):
+        ndjson = "\n".join(json.dumps({"name": f"imported {i}", "price": "3", "quantity": 2}) for i in range(10))
+        ai_names = [f"منتج {i}" for i in range(10)]
+        return [
+            # (name, method, prepare() -> (path, kwargs))
+            ("GET /", "GET", lambda: ("/", {})),
+            ("GET /api/products (anonymous)", "GET", lambda: ("/api/products", {})),
+            ("POST /api/products", "POST", lambda: ("/api/products", {"json": {"name": "bench", "price": 5, "quantity": 3}, "headers": auth(USER)})),
+            ("GET /api/products/<id>", "GET", lambda: (f"/api/products/{self.new_product()}", {"headers": auth(USER)})),
+            ("POST /api/products:batchGet", "POST", lambda: ("/api/products:batchGet", {"json": {"ids": [self.new_product() for _ in range(20)]}, "headers": auth(USER)})),
+            ("PUT /api/products/<id>", "PUT", lambda: (f"/api/products/{self.new_product()}", {"json": {"quantity": 7}, "headers": auth(USER)})),
+            ("DELETE /api/products/<id>", "DELETE", lambda: (f"/api/products/{self.new_product()}", {"headers": auth(USER)})),
+            ("POST /api/products/<id>/approve", "POST", lambda: (f"/api/products/{self.new_product(status='pending')}/approve", {"headers": auth(ADMIN)})),
+            ("POST /api/products/<id>/reject", "POST", lambda: (f"/api/products/{self.new_product()}/reject", {"json": {"reason": "bench"}, "headers": auth(ADMIN)})),
+            ("GET /api/products/<id>/stock", "GET", lambda: (f"/api/products/{self.new_product()}/stock", {"headers": auth(USER)})),
+            ("POST /api/products/<id>/reserve", "POST", lambda: (f"/api/products/{self.new_product()}/reserve", {"json": {"quantity": 1}, "headers": auth(USER)})),
+            ("POST /api/products/<id>/release", "POST", lambda: (lambda p, r: (f"/api/products/{p}/release", {"json": {"reservation_id": r}, "headers": auth(USER)}))(*self.new_reservation())),
+            ("PUT /api/products/<id>/stock/shards", "PUT", lambda: (f"/api/products/{self.new_product()}/stock/shards", {"json": {"shards": 4}, "headers": auth(ADMIN)})),
+            ("GET /api/my/products", "GET", lambda: ("/api/my/products", {"headers": auth(USER)})),
+            ("GET /api/public/products", "GET", lambda: ("/api/public/products", {})),
+            ("GET /api/public/products/search", "GET", lambda: ("/api/public/products/search?q=منت", {})),
+            ("GET /api/products/search", "GET", lambda: ("/api/products/search?q=منتج 1", {"headers": auth(USER)})),
+            ("GET /api/_test_cors", "GET", lambda: ("/api/_test_cors", {})),
+            ("GET /api/analytics", "GET", lambda: ("/api/analytics", {"headers": auth(USER)})),
+            ("POST /api/admin/analytics/rebuild", "POST", lambda: ("/api/admin/analytics/rebuild", {"headers": auth(ADMIN)})),
+            ("POST /api/generate-description", "POST", lambda: ("/api/generate-description", {"json": {"product_name": ai_names[next(self.counter) % len(ai_names)]}, "headers": auth(USER)})),
+            ("GET /api/generate-description/<job_id>", "GET", lambda: (f"/api/generate-description/{self.main.ai_cache_key(ai_names[0])}", {"headers": auth(USER)})),
+            ("POST /api/admin/create_user", "POST", lambda: ("/api/admin/create_user", {"json": {"email": f"new{next(self.counter)}@example.com", "role": "viewer"}, "headers": auth(ADMIN)})),
+            ("GET /api/admin/users", "GET", lambda: ("/api/admin/users", {"headers": auth(ADMIN)})),
+            ("GET /api/admin/users?role=", "GET", lambda: ("/api/admin/users?role=viewer&active=true", {"headers": auth(ADMIN)})),
+            ("POST /api/admin/users/bulk", "POST", lambda: ("/api/admin/users/bulk", {"json": {"users": [{"email": f"bulk{next(self.counter)}@example.com", "role": "viewer"} for _ in range(20)]}, "headers": auth(ADMIN)})),
+            ("PUT /api/admin/users/<uid>", "PUT", lambda: (f"/api/admin/users/{self.new_user()}", {"json": {"role": "publisher"}, "headers": auth(ADMIN)})),
+            ("GET /api/admin/cache_stats", "GET", lambda: ("/api/admin/cache_stats", {"headers": auth(ADMIN)})),
+            ("GET /metrics", "GET", lambda: ("/metrics", {"headers": auth(ADMIN)})),
+            ("POST /api/cleanup-old-products", "POST", lambda: ("/api/cleanup-old-products", {"headers": auth(ADMIN)})),
+            ("POST /api/admin/jobs", "POST", lambda: ("/api/admin/jobs", {"json": {"action": "mark_out_of_stock_unavailable"}, "headers": auth(ADMIN)})),
+            ("GET /api/admin/jobs/<id>", "GET", lambda: (f"/api/admin/jobs/{self.new_job()}", {"headers": auth(ADMIN)})),
+            ("POST /api/admin/jobs/<id>/resume", "POST", lambda: (f"/api/admin/jobs/{self.new_job()}/resume", {"headers": auth(ADMIN)})),
+            ("POST /api/admin/products/import", "POST", lambda: ("/api/admin/products/import", {"data": ndjson, "headers": {**auth(ADMIN), "Content-Type": "application/x-ndjson"}})),
+            ("GET /api/admin/products/export", "GET", lambda: ("/api/admin/products/export", {"headers": auth(ADMIN)})),
+        ]
+
+    def request(self, method, path, kwargs):
+        client = self.app.test_client()
+        start = time.perf_counter()
+        resp = client.open(path, method=method, **kwargs)
+        resp.get_data()   # drain streamed bodies
+        elapsed = time.perf_counter() - start
+        resp.close()
+        return elapsed, resp.status_code
+
+    def run(self, name, method, prepare):
+        n = min(self.args.requests, self.args.scan_requests) if name in FULL_SCANS else self.args.requests
+        prepared = [prepare() for _ in range(n)]
+        self.wait_background()
+        before = self.db.stats.snapshot()
+        verifications_before = self.main.firebase_auth.verifications
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            results = list(pool.map(lambda p: self.request(method, p[0], p[1]), prepared))
+        wall = time.perf_counter() - start
+        self.wait_background()
+        after = self.db.stats.snapshot()
+        latencies = sorted(r[0] for r in results)
+        statuses = sorted({r[1] for r in results})
+        return {
+            "route": name,
+            "requests": n,
+            "rps": n / wall if wall else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "reads_per_req": (after["reads"] - before["reads"]) / n,
+            "writes_per_req": (after["writes"] + after["deletes"] - before["writes"] - before["deletes"]) / n,
+            "rpcs_per_req": (after["rpcs"] - before["rpcs"]) / n,
+            "token_verifications_per_req": (self.main.firebase_auth.verifications - verifications_before) / n,
+            "statuses": statuses,
+            "errors": sum(1 for r in results if r[1] >= 500),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of every route in main.py")
+    parser.add_argument("--products", type=int, default=500, help="products seeded before the run")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--scan-requests", type=int, default=5, help="requests per full-collection route")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Firestore RPC latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent clients")
+    parser.add_argument("--only", default=None, help="only routes whose name contains this text")
+    parser.add_argument("--json", action="store_true", help="print JSON lines instead of a table")
+    args = parser.parse_args()
+
+    os.environ["STORE_BACKEND"] = "memory"
+    os.environ["ALLOW_MEMORY_BACKEND"] = "1"
+    os.environ["AI_FAKE_MODEL"] = "1"
+    os.environ["FAKE_FIRESTORE_LATENCY"] = str(args.latency)
+    os.environ.setdefault("ROLLUP_RECONCILE_SECONDS", "0")   # background recounts would skew the per-route reads
+    os.environ.setdefault("ROLLUP_SETTLE_SECONDS", "0")      # nothing else writes while a rebuild runs here
+    os.environ.setdefault("ROLLUP_STATE_TTL", "0")           # so the first analytics request bootstraps at once
+    os.environ.setdefault("STOCK_MAX_HELD", "0")             # one bench user holds hundreds of reservations
+    import logging
+    logging.disable(logging.ERROR)   # statuses are reported per route instead
+    import main as app_main
+
+    bench = Bench(app_main, args)
+    bench.seed()
+    if not args.json:
+        print(f"{'route':<42} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'reads':>7} {'writes':>7} {'rpcs':>6}  status")
+    failed = False
+    for name, method, prepare in bench.scenarios():
+        if args.only and args.only not in name:
+            continue
+        r = bench.run(name, method, prepare)
+        failed = failed or r["errors"] > 0
+        if args.json:
+            print(json.dumps(r))
+        else:
+            print(f"{r['route']:<42} {r['rps']:>8.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                  f"{r['reads_per_req']:>7.1f} {r['writes_per_req']:>7.1f} {r['rpcs_per_req']:>6.1f}  {r['statuses']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
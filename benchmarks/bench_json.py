@@ -0,0 +1,107 @@
+"""
+Encode time and bytes on the wire for product catalogs of various sizes.
+
+Compares Flask's default JSON provider (stdlib json, sorted keys, ASCII
+escapes, created_at converted by hand beforehand as the handlers used to)
+with encoding.FastJSONProvider on both backends, then gzip and brotli as
+negotiated by compress_response.
+
+Usage:
+    python benchmarks/bench_json.py [--sizes 1000,10000,100000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+import encoding
+from encoding import FastJSONProvider, compress_bytes
+
+WORDS = ["منتج", "عالي", "الجودة", "مصنوع", "من", "مواد", "طبيعية", "مناسب", "للاستخدام", "اليومي",
+         "تصميم", "أنيق", "وعملي", "يدوم", "طويلا", "سعر", "ممتاز", "ضمان", "لمدة", "سنة"]
+
+
+def make_products(n, seed=1):
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    products = []
+    for i in range(n):
+        created = base + timedelta(seconds=rng.randint(0, 60 * 86400))
+        # AI descriptions are two to three paragraphs
+        description = "\n\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(35, 60)))
+                                  for _ in range(rng.randint(2, 3)))
+        products.append({
+            "id": f"p{i:07d}",
+            "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            "price": round(rng.uniform(5, 500), 2),
+            "quantity": rng.randint(0, 100),
+            "description": description,
+            "image_url": f"https://example.com/images/{i}.png",
+            "creator_uid": f"uid{rng.randint(1, 50)}",
+            "added_by": f"user{rng.randint(1, 50)}@example.com",
+            "status": rng.choice(["available", "available", "pending", "unavailable"]),
+            "created_at": DatetimeWithNanoseconds.from_rfc3339(created.strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
+        })
+    return products
+
+
+def legacy_encode(provider, products):
+    out = []
+    for p in products:
+        item = dict(p)
+        try:
+            item["created_at"] = item["created_at"].timestamp()
+        except Exception:
+            pass
+        out.append(item)
+    return provider.dumps(out).encode()
+
+
+def best_of(repeat, fn):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    default_provider = DefaultJSONProvider(Flask("default"))
+    std_app = Flask("std")
+    std_app.config["JSON_ENCODER"] = "json"
+    encoders = [
+        ("flask default", lambda products: legacy_encode(default_provider, products)),
+        ("fast (json)", lambda products, p=FastJSONProvider(std_app): p.dumps_bytes(products)),
+    ]
+    if encoding.orjson is not None:
+        encoders.append(("fast (orjson)", lambda products, p=FastJSONProvider(Flask("fast")): p.dumps_bytes(products)))
+
+    print(f"{'products':>9} {'encoder':<15} {'encode ms':>10} {'bytes':>12} {'gzip':>11} {'gzip ms':>8} "
+          f"{'br':>11} {'br ms':>8}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        products = make_products(n)
+        for name, encode in encoders:
+            seconds, body = best_of(args.repeat, lambda: encode(products))
+            row = f"{n:>9} {name:<15} {seconds * 1000:>10.1f} {len(body):>12,}"
+            for coding in encoding.supported_encodings()[::-1]:
+                c_seconds, compressed = best_of(1, lambda: compress_bytes(body, coding))
+                row += f" {len(compressed):>11,} {c_seconds * 1000:>8.1f}"
+            print(row, flush=True)
+            del body
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Worker startup time: import main, create_app() and the first request, each
+measured in a fresh interpreter, against STARTUP_TARGET_SECONDS.
+
+Runs offline on the in-memory backend by default. --backend firebase
+measures the real import path; with lazy clients it needs no credentials
+until the first Firestore call, so the first request is skipped there.
+Also reports whether google.generativeai was imported during startup (it
+should not be: the AI model is created on the first AI request).
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--backend memory|firebase] [--target 2]
+Exit status is 1 when the median import + boot time misses the target.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+CHILD = r"""
+import json, sys, time, logging
+t0 = time.perf_counter()
+logging.disable(logging.CRITICAL)
+import main
+t1 = time.perf_counter()
+app = main.create_app()
+t2 = time.perf_counter()
+first = None
+if main.STORE_BACKEND == "memory":
+    resp = app.test_client().get("/api/public/products?limit=1")
+    resp.get_data()
+    first = time.perf_counter() - t2
+print(json.dumps({"import": t1 - t0, "boot": t2 - t1, "first_request": first,
+                  "genai_imported": "google.generativeai" in sys.modules}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="memory", choices=["memory", "firebase"])
+    parser.add_argument("--target", type=float, default=float(os.getenv("STARTUP_TARGET_SECONDS", "2")))
+    args = parser.parse_args()
+
+    env = dict(os.environ, STORE_BACKEND=args.backend, ALLOW_MEMORY_BACKEND="1")
+    # configure Gemini so a regression to eager AI imports shows up
+    env.setdefault("GEMINI_API_KEY", "unused")
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    def median(key):
+        values = [r[key] for r in results if r[key] is not None]
+        return statistics.median(values) if values else None
+
+    total = median("import") + median("boot")
+    print(f"runs: {args.runs}  backend: {args.backend}")
+    print(f"import main      {median('import') * 1000:8.1f} ms")
+    print(f"create_app()     {median('boot') * 1000:8.1f} ms")
+    if median("first_request") is not None:
+        print(f"first request    {median('first_request') * 1000:8.1f} ms")
+    print(f"google.generativeai imported at startup: {any(r['genai_imported'] for r in results)}")
+    print(f"import + boot    {total * 1000:8.1f} ms  (target {args.target * 1000:.0f} ms)"
+          f"  {'OK' if total <= args.target else 'MISSED'}")
+    sys.exit(0 if total <= args.target else 1)
+
+
+if __name__ == "__main__":
+    main()
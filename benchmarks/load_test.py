@@ -0,0 +1,84 @@
+"""
+HTTP load test: fires requests at a running server from many concurrent
+clients and reports throughput and p50/p95/p99 latency.
+
+Use it to size gunicorn's threads per worker (GUNICORN_THREADS, see
+gunicorn.conf.py) against a real backend, e.g. the Firestore emulator via
+FIRESTORE_EMULATOR_HOST:
+
+    GUNICORN_THREADS=32 gunicorn --workers 3 --bind 127.0.0.1:8080
+    python benchmarks/load_test.py --url http://127.0.0.1:8080 --concurrency 1,8,32,128
+
+Authenticated routes need --token (a Firebase ID token).
+"""
+import time
+import argparse
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def fetch(url, token):
+    req = urllib.request.Request(url)
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            ok = resp.status < 500
+    except urllib.error.HTTPError as e:
+        ok = e.code < 500
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run(urls, token, concurrency, requests):
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        jobs = [pool.submit(fetch, urls[i % len(urls)], token) for i in range(requests)]
+        for job in jobs:
+            latency, ok = job.result()
+            latencies.append(latency)
+            errors += 0 if ok else 1
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test for the store API")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--paths", default="/api/public/products,/api/products",
+                        help="comma separated paths, requested round-robin")
+    parser.add_argument("--token", default=None, help="Firebase ID token for authenticated paths")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma separated client counts")
+    parser.add_argument("--requests", type=int, default=500, help="requests per concurrency level")
+    args = parser.parse_args()
+
+    urls = [args.url.rstrip("/") + p for p in args.paths.split(",")]
+    print(f"{'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        r = run(urls, args.token, concurrency, args.requests)
+        print(f"{r['concurrency']:>8} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
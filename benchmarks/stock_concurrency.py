@@ -0,0 +1,159 @@
+"""
+Parallel buyers against one product on the in-memory Firestore stand-in:
+checks that reserve/release never oversells or loses units, and compares a
+single stock document with sharded counters.
+
+Each round seeds a product with --stock units, then --threads buyers call
+POST /api/products/<id>/reserve (1-3 units each) until it answers "Not
+enough stock", retrying on 503. Afterwards every successful reservation must
+add up to exactly --stock, the stock must read 0, and releasing every
+reservation in parallel must restore --stock. Simulated latency (--latency,
+seconds per RPC) makes transactions overlap so conflicts actually happen.
+
+Usage:
+    python benchmarks/stock_concurrency.py [--stock 300] [--threads 32] [--shards 0,10] [--latency 0.002]
+Exit status is 1 if any invariant is violated.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+ADMIN = "bench-admin"
+BUYERS = [f"buyer{i}" for i in range(8)]
+
+
+def auth(uid):
+    return {"Authorization": f"Bearer {uid}"}
+
+
+def load_app(latency):
+    os.environ["STORE_BACKEND"] = "memory"
+    os.environ["ALLOW_MEMORY_BACKEND"] = "1"
+    os.environ["MAIN_ADMIN_UID"] = ADMIN
+    os.environ["FAKE_FIRESTORE_LATENCY"] = str(latency)
+    os.environ.setdefault("STOCK_SYNC_DELAY", "0.05")
+    os.environ.setdefault("STOCK_MAX_HELD", "0")   # a few buyers take the whole stock
+    logging.disable(logging.ERROR)
+    import main
+    return main
+
+
+def run_parallel(threads, work):
+    errors = []
+
+    def target(i):
+        try:
+            work(i)
+        except Exception as e:   # surfaced as a failed check below
+            errors.append(e)
+
+    pool = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - start, errors
+
+
+def round_trip(main, args, shards):
+    app = main.create_app()
+    client = app.test_client()
+    resp = client.post("/api/products", json={"name": "hot product", "price": 1, "quantity": args.stock},
+                       headers=auth(BUYERS[0]))
+    product_id = resp.get_json()["product"]["id"]
+    if shards:
+        client.put(f"/api/products/{product_id}/stock/shards", json={"shards": shards}, headers=auth(ADMIN))
+    store = main.metrics.unwrap(main.db)._store
+    store.stats.reset()
+
+    reservations = []   # (reservation id, buyer, quantity)
+    counts = {"retries": 0}
+    lock = threading.Lock()
+
+    def buyer(i):
+        c = app.test_client()
+        uid = BUYERS[i % len(BUYERS)]
+        rng = random.Random(i)
+        while True:
+            quantity = rng.randint(1, 3)
+            while True:
+                r = c.post(f"/api/products/{product_id}/reserve", json={"quantity": quantity}, headers=auth(uid))
+                if r.status_code != 503:
+                    break
+                with lock:
+                    counts["retries"] += 1
+            if r.status_code == 201:
+                with lock:
+                    reservations.append((r.get_json()["reservation_id"], uid, quantity))
+            elif r.status_code == 409:
+                if quantity == 1:
+                    return
+            else:
+                raise AssertionError(f"reserve -> {r.status_code} {r.get_data(as_text=True)}")
+
+    seconds, errors = run_parallel(args.threads, buyer)
+    stats = store.stats.snapshot()
+    reserved = sum(q for _, _, q in reservations)
+    main.stock_cache.clear()
+    left = client.get(f"/api/products/{product_id}/stock", headers=auth(ADMIN)).get_json()["quantity"]
+
+    def releaser(i):
+        c = app.test_client()
+        for reservation_id, uid, _ in reservations[i::args.threads]:
+            while True:
+                r = c.post(f"/api/products/{product_id}/release", json={"reservation_id": reservation_id},
+                           headers=auth(uid))
+                if r.status_code != 503:
+                    break
+            if r.status_code != 200:
+                raise AssertionError(f"release -> {r.status_code} {r.get_data(as_text=True)}")
+
+    release_seconds, release_errors = run_parallel(args.threads, releaser)
+    main.stock_cache.clear()
+    restored = client.get(f"/api/products/{product_id}/stock", headers=auth(ADMIN)).get_json()["quantity"]
+    main.stock_executor.submit(lambda: None).result()
+    time.sleep(float(os.environ["STOCK_SYNC_DELAY"]) * 4)
+    main.stock_executor.submit(lambda: None).result()
+    synced = client.get(f"/api/products/{product_id}", headers=auth(ADMIN)).get_json()["quantity"]
+
+    checks = [
+        ("no errors", not errors and not release_errors, errors + release_errors),
+        ("reserved == stock", reserved == args.stock, reserved),
+        ("stock left == 0", left == 0, left),
+        ("released back to stock", restored == args.stock, restored),
+        ("product quantity synced", synced == args.stock, synced),
+    ]
+    print(f"shards={shards:<3} reservations={len(reservations):<4} reserve {len(reservations) / seconds:7.1f}/s  "
+          f"release {len(reservations) / release_seconds:7.1f}/s  aborted commits={stats['aborts']:<5} "
+          f"503 retries={counts['retries']}")
+    ok = True
+    for name, passed, value in checks:
+        if not passed:
+            ok = False
+            print(f"  FAILED: {name} ({value})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent stock reservation check")
+    parser.add_argument("--stock", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--shards", default="0,10")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated Firestore RPC latency in seconds")
+    args = parser.parse_args()
+
+    app_main = load_app(args.latency)
+    ok = all([round_trip(app_main, args, int(s)) for s in args.shards.split(",")])
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
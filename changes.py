@@ -0,0 +1,82 @@
+import threading
+from collections import deque, namedtuple
+
+Change = namedtuple("Change", "seq time item")
+
+
+class ChangeLog:
+    """
+    Bounded in-memory log of change events, shared by every subscriber in the
+    process. Each subscriber only keeps a position in the log, so a slow or
+    idle client costs nothing but its position; one that falls further behind
+    than the log holds is told to start over instead of being buffered for.
+
+    Events carry a time (any ordered value, e.g. the listener's read time)
+    that means the same thing in every process, so a client can resume from
+    the last time it saw on whichever worker it reconnects to.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._events = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self.generation = 0
+        self.started_at = None   # the log is complete from this time on
+        self._evicted_at = None  # time of the newest event dropped from the log
+
+    def reset(self, started_at):
+        """Start over (e.g. a new listener); subscribers of the old log are told to reload."""
+        with self._cond:
+            self._events.clear()
+            self.generation += 1
+            self.started_at = started_at
+            self._evicted_at = None
+            self._cond.notify_all()
+
+    def append(self, time, items):
+        with self._cond:
+            for item in items:
+                if len(self._events) == self._events.maxlen:
+                    self._evicted_at = self._events[0].time
+                self._seq += 1
+                self._events.append(Change(self._seq, time, item))
+            self._cond.notify_all()
+
+    def head(self):
+        """(position, time) of the newest event, for a subscriber starting live."""
+        with self._cond:
+            return self._seq, self._events[-1].time if self._events else self.started_at
+
+    def position(self, since):
+        """
+        Position to read from to resume at `since`: events at exactly `since`
+        are replayed, so clients must apply them idempotently. None when the
+        log no longer covers `since`.
+        """
+        with self._cond:
+            if self.started_at is None or since < self.started_at:
+                return None
+            if self._evicted_at is not None and since <= self._evicted_at:
+                return None
+            for change in self._events:
+                if change.time >= since:
+                    return change.seq - 1
+            return self._seq
+
+    def read(self, position, generation, timeout, limit=100):
+        """
+        Up to `limit` events after `position`, waiting up to `timeout` seconds
+        for one. Returns [] on timeout and None when the subscriber must start
+        over (log reset, or its events were already dropped).
+        """
+        with self._cond:
+            if position == self._seq and generation == self.generation:
+                self._cond.wait(timeout)
+            if generation != self.generation:
+                return None
+            if not self._events:
+                return []
+            start = position + 1 - self._events[0].seq
+            if start < 0:
+                return None
+            return [self._events[i] for i in range(start, min(start + limit, len(self._events)))]
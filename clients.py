@@ -0,0 +1,41 @@
+import os
+import time
+import threading
+
+
+class ProcessLocal:
+    """
+    Object built by `factory()` on first use in each process, with attribute
+    access forwarded to it. Importing the app therefore needs no credentials,
+    and a gunicorn worker never reuses a client (gRPC channel, HTTP
+    connection pool) created in the master before the fork.
+    """
+    def __init__(self, factory, name=None):
+        self.name = name or factory.__name__
+        self.init_seconds = None
+        self._factory = factory
+        self._pid = None
+        self._value = None
+        self._lock = threading.Lock()
+        # a lock held by another thread at fork time would never be released in the child
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._pid == os.getpid()
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    start = time.perf_counter()
+                    self._value = self._factory()
+                    self.init_seconds = time.perf_counter() - start
+                    self._pid = os.getpid()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
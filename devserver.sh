@@ -1,3 +1,3 @@
 #!/bin/sh
 source .venv/bin/activate
-python -u -m flask --app main run --debug -p ${PORT:-8080}
\ No newline at end of file
+python -u -m flask --app 'main:create_app()' run --debug -p ${PORT:-8080}
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+import zlib
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+def encode_default(value):
+    """Types JSON lacks. Datetimes (Firestore timestamps included) become epoch seconds."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+def json_backend(name="orjson"):
+    """The backend used for JSON_ENCODER=`name`: "orjson" when requested and installed, else "json"."""
+    return "orjson" if orjson is not None and name == "orjson" else "json"
+
+
+def dumps_bytes(obj, backend, indent=False):
+    if backend == "orjson":
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=encode_default, option=option)
+    return dumps(obj, backend, indent=2 if indent else None).encode()
+
+
+def dumps(obj, backend, **kwargs):
+    """Encode `obj` like FastJSONProvider does, for code running outside an app context."""
+    if backend == "orjson" and not kwargs.get("indent"):
+        return dumps_bytes(obj, backend).decode()
+    kwargs.setdefault("default", encode_default)
+    kwargs.setdefault("ensure_ascii", False)
+    kwargs.setdefault("sort_keys", False)
+    if not kwargs.get("indent"):
+        kwargs["separators"] = (",", ":")
+    return json.dumps(obj, **kwargs)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider used for every response. Backed by orjson when it is
+    installed and app.config["JSON_ENCODER"] is "orjson" (the default),
+    otherwise by the json module with the same output: compact UTF-8, keys
+    in insertion order, datetimes as epoch seconds.
+    """
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(encode_default)
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.backend = json_backend(app.config.get("JSON_ENCODER", "orjson"))
+
+    def dumps_bytes(self, obj, indent=False):
+        return dumps_bytes(obj, self.backend, indent)
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, self.backend, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.backend == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+# ---------------- Response compression ----------------
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "image/svg+xml", "text/")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5   # 11 is far too slow for per-request compression
+
+
+def supported_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _compressor(coding):
+    """(compress, finish) functions for one response."""
+    if coding == "br":
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        return c.process, c.finish
+    c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)   # wbits=31: gzip container
+    return c.compress, c.flush
+
+
+def compress_bytes(data, coding):
+    compress, finish = _compressor(coding)
+    return compress(data) + finish()
+
+
+def _compress_stream(chunks, coding, charset):
+    # the compressor emits output as its window fills, so small chunks (one
+    # NDJSON line each) still compress well and large streams still flow
+    compress, finish = _compressor(coding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            out = compress(chunk)
+            if out:
+                yield out
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def encoded_etag(etag, coding):
+    """Strong ETag of the `coding`-encoded representation of a body tagged `etag`."""
+    return f"{etag}-{coding}"
+
+
+def etag_variants(etag):
+    """`etag` plus the tags compress_response gives its encoded representations."""
+    return [etag] + [encoded_etag(etag, coding) for coding in ("br", "gzip")]
+
+
+def matching_etag(etags, etag):
+    """The tag in `etags` (an If-Match/If-None-Match set) naming any representation of `etag`, or None."""
+    for tag in etag_variants(etag):
+        if etags.contains(tag):
+            return tag
+    return None
+
+
+def compress_response(response, accept_encodings, min_size):
+    """
+    Compress `response` with the best encoding the client accepts (brotli or
+    gzip). Buffered bodies are compressed when at least `min_size` bytes;
+    streamed bodies are compressed on the fly. A strong ETag gets the coding
+    appended, since the encoded bytes are a different representation; match
+    conditional headers with matching_etag. Call from after_request.
+    """
+    if (min_size <= 0 or response.direct_passthrough or response.status_code in (204, 206, 304)
+            or response.status_code < 200 or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+            or response.mimetype == "text/event-stream"):   # events must not wait in the compressor
+        return response
+    response.vary.add("Accept-Encoding")
+    coding = accept_encodings.best_match(supported_encodings())
+    if coding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, coding, "utf-8")
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        response.set_data(compress_bytes(body, coding))
+    response.headers["Content-Encoding"] = coding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(encoded_etag(etag, coding))
+    return response
@@ -0,0 +1,809 @@
+"""
+In-memory stand-in for the Firestore and Firebase Auth clients used by
+main.py, selected with STORE_BACKEND=memory. It supports the calls the app
+makes (collection/document refs, where/order_by/limit/start_after/select,
+stream, count, add/set/update/delete/create with preconditions, batches,
+transactions, get_all, on_snapshot listeners and the SERVER_TIMESTAMP / Increment /
+ArrayUnion / ArrayRemove / DELETE_FIELD transforms), counts every RPC and can
+simulate network latency, so routes can be benchmarked offline.
+"""
+import copy
+import time
+import queue
+import random
+import string
+import threading
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_client import BaseClient
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+DIRECTION_DESCENDING = "DESCENDING"
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _auto_id():
+    return "".join(random.choices(string.ascii_letters + string.digits, k=20))
+
+
+def _type_rank(value):
+    # Firestore orders values of different types by type first
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    return 5
+
+
+def _sort_value(value):
+    if isinstance(value, FakeDocumentReference):
+        value = value.id
+    rank = _type_rank(value)
+    if rank in (0, 5):
+        return (rank, 0)
+    return (rank, value)
+
+
+_MISSING = object()
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _apply_value(current, value, now):
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, transforms.ArrayUnion):
+        base = list(current) if isinstance(current, list) else []
+        return base + [v for v in value.values if v not in base]
+    if isinstance(value, transforms.ArrayRemove):
+        base = list(current) if isinstance(current, list) else []
+        return [v for v in base if v not in value.values]
+    if isinstance(value, dict):
+        return {k: _apply_value(_MISSING, v, now) for k, v in value.items()
+                if v is not transforms.DELETE_FIELD}
+    return copy.deepcopy(value)
+
+
+def _merge(target, data, now):
+    """set(merge=True): nested maps are merged key by key."""
+    for key, value in data.items():
+        if value is transforms.DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value, now)
+        else:
+            target[key] = _apply_value(target.get(key, _MISSING), value, now)
+
+
+def _update(target, data, now):
+    """update(): keys are field paths, a.b updates a nested field."""
+    for field_path, value in data.items():
+        parts = field_path.split(".")
+        node = target
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is transforms.DELETE_FIELD:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = _apply_value(node.get(parts[-1], _MISSING), value, now)
+
+
+def _matches(data, field_path, op, value):
+    actual = _get_field(data, field_path)
+    if op == "==":
+        return actual is not _MISSING and actual == value
+    if op == "!=":
+        return actual is not _MISSING and actual is not None and actual != value
+    if op == "in":
+        return actual is not _MISSING and actual in value
+    if op == "not-in":
+        return actual is not _MISSING and actual is not None and actual not in value
+    if op == "array_contains":
+        return isinstance(actual, list) and value in actual
+    if op == "array_contains_any":
+        return isinstance(actual, list) and any(v in actual for v in value)
+    if actual is _MISSING or _type_rank(actual) != _type_rank(value):
+        return False
+    if op == "<":
+        return actual < value
+    if op == "<=":
+        return actual <= value
+    if op == ">":
+        return actual > value
+    if op == ">=":
+        return actual >= value
+    raise ValueError(f"Unsupported operator {op!r}")
+
+
+class FakeStats:
+    """RPC counters; `reads` counts documents read, like Firestore billing."""
+    FIELDS = ("reads", "writes", "deletes", "queries", "gets", "commits", "aborts", "aggregations", "rpcs")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            for name in self.FIELDS:
+                setattr(self, name, 0)
+
+    def add(self, **counts):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class FakeWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = _now()
+        if data is not None and field_paths is not None:
+            data = {k: v for k, v in data.items() if k in field_paths}
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class _ChangeType:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeDocumentChange:
+    def __init__(self, type_name, document, old_index=-1, new_index=-1):
+        self.type = _ChangeType(type_name)
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class FakeWatch:
+    def __init__(self, store, listener):
+        self._store = store
+        self._listener = listener
+
+    def unsubscribe(self):
+        self._store.remove_listener(self._listener)
+
+
+class FakeDocumentReference:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._store, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._store, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        snapshot = self._store.get(self, field_paths)
+        if transaction is not None:
+            transaction._read(snapshot)
+        return snapshot
+
+    def create(self, document_data):
+        return self._store.write([("create", self, document_data, None)])[0]
+
+    def set(self, document_data, merge=False):
+        return self._store.write([("set_merge" if merge else "set", self, document_data, None)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._store.write([("update", self, field_updates, option)])[0]
+
+    def delete(self, option=None):
+        return self._store.write([("delete", self, None, option)])[0].update_time
+
+    def on_snapshot(self, callback):
+        return self._store.add_listener(self.parent._query().where("__name__", "==", self.id), callback)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class FakeAggregationResult:
+    def __init__(self, value, alias="field_1"):
+        self.value = value
+        self.alias = alias
+
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self, transaction=None):
+        count = len(self._query._run(count_reads=False))
+        self._query._store.stats.add(aggregations=1, reads=max(1, count // 1000), rpcs=1)
+        self._query._store.pause()
+        return [[FakeAggregationResult(count)]]
+
+
+class FakeQuery:
+    def __init__(self, store, collection_path, filters=(), orders=(), limit=None,
+                 start=None, projection=None):
+        self._store = store
+        self._path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start = start
+        self._projection = projection
+
+    def _copy(self, **changes):
+        args = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                    start=self._start, projection=self._projection)
+        args.update(changes)
+        return FakeQuery(self._store, self._path, **args)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            if not isinstance(filter, FieldFilter):
+                raise NotImplementedError("Only FieldFilter filters are supported")
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, True))
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self)
+
+    def stream(self, transaction=None):
+        for snapshot in self._run():
+            if transaction is not None:
+                transaction._read(snapshot)
+            yield snapshot
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    def on_snapshot(self, callback):
+        return self._store.add_listener(self, callback)
+
+    def _matches(self, doc_id, data):
+        for field_path, op, value in self._filters:
+            if field_path == "__name__":
+                target = value.id if isinstance(value, FakeDocumentReference) else value
+                if op != "==" or doc_id != target:
+                    return False
+            elif not _matches(data, field_path, op, value):
+                return False
+        for field_path, _ in self._orders:
+            if field_path != "__name__" and _get_field(data, field_path) is _MISSING:
+                return False
+        return True
+
+    def _order_values(self, doc_id, data):
+        return [_sort_value(doc_id if f == "__name__" else _get_field(data, f)) for f, _ in self._orders]
+
+    def _cursor_values(self):
+        fields, _ = self._start
+        if isinstance(fields, FakeDocumentSnapshot):
+            data, doc_id = fields.to_dict() or {}, fields.id
+            return [_sort_value(doc_id if f == "__name__" else _get_field(data, f)) for f, _ in self._orders]
+        values = []
+        for field_path, _ in self._orders[:len(fields)]:
+            values.append(_sort_value(fields[field_path] if field_path in fields else _get_field(fields, field_path)))
+        return values
+
+    def _after_cursor(self, values, cursor, inclusive):
+        for (_, direction), value, bound in zip(self._orders, values, cursor):
+            if value == bound:
+                continue
+            if direction == DIRECTION_DESCENDING:
+                return value < bound
+            return value > bound
+        return inclusive
+
+    def _matching(self):
+        """(id, data, create_time, update_time) rows matching filters, in query order."""
+        rows = [row for row in self._store.rows(self._path) if self._matches(row[0], row[1])]
+        orders = self._orders
+        if not any(f == "__name__" for f, _ in orders):
+            # implicit final ordering by document id, in the direction of the last order
+            orders = orders + (("__name__", orders[-1][1] if orders else "ASCENDING"),)
+        for field_path, direction in reversed(orders):
+            rows.sort(key=lambda row: _sort_value(row[0] if field_path == "__name__" else _get_field(row[1], field_path)),
+                      reverse=direction == DIRECTION_DESCENDING)
+        if self._start is not None:
+            if not self._orders:
+                raise ValueError("Cursors require order_by")
+            cursor = self._cursor_values()
+            inclusive = self._start[1]
+            rows = [row for row in rows
+                    if self._after_cursor(self._order_values(row[0], row[1]), cursor, inclusive)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def _run(self, count_reads=True):
+        rows = self._matching()
+        if count_reads:
+            self._store.stats.add(queries=1, reads=max(1, len(rows)), rpcs=1)
+            self._store.pause()
+        return [FakeDocumentSnapshot(FakeDocumentReference(self._store, f"{self._path}/{doc_id}"),
+                                     data, create_time, update_time, self._projection)
+                for doc_id, data, create_time, update_time in rows]
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store, path):
+        super().__init__(store, path)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def _query(self):
+        return FakeQuery(self._store, self.path)
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._store, f"{self.path}/{document_id or _auto_id()}")
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        result = ref.create(document_data)
+        return result.update_time, ref
+
+    def list_documents(self):
+        return [FakeDocumentReference(self._store, f"{self.path}/{doc_id}") for doc_id, *_ in self._store.rows(self.path)]
+
+
+class FakeWriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def create(self, reference, document_data):
+        self._ops.append(("create", reference, document_data, None))
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set_merge" if merge else "set", reference, document_data, None))
+        return self
+
+    def update(self, reference, field_updates, option=None):
+        self._ops.append(("update", reference, field_updates, option))
+        return self
+
+    def delete(self, reference, option=None):
+        self._ops.append(("delete", reference, None, option))
+        return self
+
+    def commit(self, **kwargs):
+        if len(self._ops) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        ops, self._ops = self._ops, []
+        return self._store.write(ops) if ops else []
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Works with firestore.transactional. Concurrency control is optimistic:
+    the commit aborts (and the decorator retries) when a document read in the
+    transaction has changed since, which is the outcome the server's locks
+    guarantee too.
+    """
+
+    def __init__(self, store, max_attempts=5, read_only=False):
+        super().__init__(store)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._reads = {}   # path -> update_time seen (None: did not exist)
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+    def _read(self, snapshot):
+        self._reads.setdefault(snapshot.reference.path, snapshot.update_time)
+
+    def _clean_up(self):
+        self._ops = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        if self.in_progress:
+            raise ValueError("Transaction already in progress")
+        self._id = _auto_id()
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        if not self.in_progress:
+            raise ValueError("No transaction in progress")
+        ops, reads = self._ops, self._reads
+        self._clean_up()
+        return self._store.write(ops, reads)
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
+
+
+class _Listener:
+    def __init__(self, query, callback):
+        self.query = query
+        self.callback = callback
+        self.seen = None   # doc id -> update_time delivered so far
+
+
+class FakeStore:
+    """State behind the fake client: documents, stats and listeners."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.stats = FakeStats()
+        self._lock = threading.RLock()
+        self._docs = {}   # collection path -> {doc id: (data, create_time, update_time)}
+        self._last_write = datetime.min.replace(tzinfo=timezone.utc)
+        self._listeners = []
+        self._events = queue.Queue()
+        self._dispatcher = None
+
+    def pause(self):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+    def rows(self, collection_path):
+        with self._lock:
+            docs = self._docs.get(collection_path, {})
+            return [(doc_id, copy.deepcopy(data), ct, ut) for doc_id, (data, ct, ut) in docs.items()]
+
+    def get(self, ref, field_paths=None):
+        collection_path, doc_id = ref.path.rsplit("/", 1)
+        with self._lock:
+            entry = self._docs.get(collection_path, {}).get(doc_id)
+            data, ct, ut = (copy.deepcopy(entry[0]), entry[1], entry[2]) if entry else (None, None, None)
+        self.stats.add(gets=1, reads=1, rpcs=1)
+        self.pause()
+        return FakeDocumentSnapshot(ref, data, ct, ut, field_paths)
+
+    def get_all(self, refs, field_paths=None):
+        refs = list(refs)
+        snapshots = []
+        with self._lock:
+            for ref in refs:
+                collection_path, doc_id = ref.path.rsplit("/", 1)
+                entry = self._docs.get(collection_path, {}).get(doc_id)
+                data, ct, ut = (copy.deepcopy(entry[0]), entry[1], entry[2]) if entry else (None, None, None)
+                snapshots.append(FakeDocumentSnapshot(ref, data, ct, ut, field_paths))
+        self.stats.add(gets=1, reads=max(1, len(refs)), rpcs=1)
+        self.pause()
+        return snapshots
+
+    def _check_option(self, ref, entry, option):
+        if option is None:
+            return
+        last_update_time = getattr(option, "_last_update_time", None)
+        if last_update_time is not None and (entry is None or entry[2] != last_update_time):
+            raise FailedPrecondition(f"{ref.path} was modified")
+        exists = getattr(option, "_exists", None)
+        if exists is not None and (entry is not None) != exists:
+            raise FailedPrecondition(f"{ref.path} exists={entry is not None}")
+
+    def write(self, ops, reads=None):
+        """
+        Apply writes atomically; returns one FakeWriteResult per op. `reads`
+        ({path: update_time}) makes it a transaction commit that aborts if any
+        of those documents changed.
+        """
+        changed = []
+        with self._lock:
+            # update times are unique per document version, as on the server
+            now = max(_now(), self._last_write + timedelta(microseconds=1))
+            self._last_write = now
+            for path, update_time in (reads or {}).items():
+                collection_path, doc_id = path.rsplit("/", 1)
+                entry = self._docs.get(collection_path, {}).get(doc_id)
+                if (entry[2] if entry else None) != update_time:
+                    self.stats.add(rpcs=1, aborts=1)
+                    raise Aborted(f"{path} changed during the transaction")
+            # validate everything before touching the data (a batch is all or nothing)
+            for kind, ref, data, option in ops:
+                collection_path, doc_id = ref.path.rsplit("/", 1)
+                entry = self._docs.get(collection_path, {}).get(doc_id)
+                if kind == "create" and entry is not None:
+                    raise AlreadyExists(f"{ref.path} already exists")
+                if kind == "update" and entry is None:
+                    raise NotFound(f"No document to update: {ref.path}")
+                self._check_option(ref, entry, option)
+            results = []
+            for kind, ref, data, option in ops:
+                collection_path, doc_id = ref.path.rsplit("/", 1)
+                docs = self._docs.setdefault(collection_path, {})
+                entry = docs.get(doc_id)
+                if kind == "delete":
+                    docs.pop(doc_id, None)
+                else:
+                    current = copy.deepcopy(entry[0]) if entry else {}
+                    if kind in ("create", "set"):
+                        current = {}
+                        _merge(current, data, now)
+                    elif kind == "set_merge":
+                        _merge(current, data, now)
+                    else:
+                        _update(current, data, now)
+                    docs[doc_id] = (current, entry[1] if entry else now, now)
+                changed.append(collection_path)
+                results.append(FakeWriteResult(now))
+        deletes = sum(1 for kind, *_ in ops if kind == "delete")
+        self.stats.add(writes=len(ops) - deletes, deletes=deletes, commits=1, rpcs=1)
+        self.pause()
+        if self._listeners:
+            self._events.put(set(changed))
+        return results
+
+    # --- listeners -------------------------------------------------------
+    def add_listener(self, query, callback):
+        listener = _Listener(query, callback)
+        with self._lock:
+            self._listeners.append(listener)
+            self._ensure_dispatcher()
+        self._events.put({query._path})
+        return FakeWatch(self, listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name="fake-firestore-watch", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        # listeners are notified on a background thread, like the real Watch
+        while True:
+            paths = self._events.get()
+            try:
+                with self._lock:
+                    listeners = [l for l in self._listeners if l.query._path in paths]
+                for listener in listeners:
+                    self._notify(listener)
+            except Exception:
+                pass
+            finally:
+                self._events.task_done()
+
+    def _notify(self, listener):
+        snapshots = listener.query._run(count_reads=False)
+        first = listener.seen is None
+        seen = listener.seen or {}
+        current = {s.id: s.update_time for s in snapshots}
+        changes = []
+        for doc_id in seen.keys() - current.keys():
+            ref = FakeDocumentReference(self, f"{listener.query._path}/{doc_id}")
+            changes.append(FakeDocumentChange("REMOVED", FakeDocumentSnapshot(ref, None)))
+        for index, snapshot in enumerate(snapshots):
+            if snapshot.id not in seen:
+                changes.append(FakeDocumentChange("ADDED", snapshot, new_index=index))
+            elif seen[snapshot.id] != snapshot.update_time:
+                changes.append(FakeDocumentChange("MODIFIED", snapshot, new_index=index))
+        listener.seen = current
+        if not changes and not first:
+            return
+        self.stats.add(reads=max(1, len(changes)))
+        listener.callback(snapshots, changes, _now())
+
+    def flush_listeners(self, timeout=5.0):
+        """Wait until queued listener notifications have been delivered."""
+        deadline = time.monotonic() + timeout
+        while self._events.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+
+class FakeFirestore:
+    """Drop-in for firestore.client()."""
+
+    write_option = staticmethod(BaseClient.write_option)
+
+    def __init__(self, latency=0.0, store=None):
+        self._store = store or FakeStore(latency)
+
+    @property
+    def stats(self):
+        return self._store.stats
+
+    def pause(self):
+        """Sleep for the simulated round-trip latency."""
+        self._store.pause()
+
+    def collection(self, path):
+        return FakeCollectionReference(self._store, path)
+
+    def document(self, path):
+        return FakeDocumentReference(self._store, path)
+
+    def batch(self):
+        return FakeWriteBatch(self._store)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return FakeTransaction(self._store, max_attempts, read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for snapshot in self._store.get_all(references, field_paths):
+            if transaction is not None:
+                transaction._read(snapshot)
+            yield snapshot
+
+    def flush_listeners(self, timeout=5.0):
+        self._store.flush_listeners(timeout)
+
+
+# --- auth ----------------------------------------------------------------
+class FakeUserRecord:
+    def __init__(self, uid, email=None):
+        self.uid = uid
+        self.email = email
+
+
+class FakeUserImportResult:
+    def __init__(self, success_count, errors):
+        self.success_count = success_count
+        self.failure_count = len(errors)
+        self.errors = errors
+
+
+class FakeGetUsersResult:
+    def __init__(self, users, not_found):
+        self.users = users
+        self.not_found = not_found
+
+
+class FakeImportError:
+    def __init__(self, index, reason):
+        self.index = index
+        self.reason = reason
+
+
+class FakeAuth:
+    """
+    Drop-in for firebase_admin.auth. An ID token is simply the uid it
+    authenticates ("invalid" and empty tokens are rejected).
+    """
+
+    def __init__(self, pause=None):
+        self._pause = pause
+        self._users = {}
+        self._lock = threading.Lock()
+        self.verifications = 0
+
+    def verify_id_token(self, id_token, app=None, check_revoked=False, clock_skew_seconds=0):
+        self.verifications += 1
+        if self._pause is not None:
+            self._pause()
+        if not id_token or id_token == "invalid":
+            raise ValueError("Invalid fake ID token")
+        user = self._users.get(id_token)
+        return {
+            "uid": id_token,
+            "sub": id_token,
+            "email": user.email if user else f"{id_token}@example.com",
+            "exp": int(time.time()) + 3600,
+            "iat": int(time.time()),
+        }
+
+    def create_user(self, uid=None, email=None, password=None, **kwargs):
+        with self._lock:
+            if email and any(u.email == email for u in self._users.values()):
+                raise ValueError(f"Email already exists: {email}")
+            record = FakeUserRecord(uid or _auto_id(), email)
+            self._users[record.uid] = record
+        return record
+
+    def import_users(self, users, hash_alg=None, app=None):
+        errors = []
+        with self._lock:
+            for index, user in enumerate(users):
+                if user.uid in self._users:
+                    errors.append(FakeImportError(index, "uid already exists"))
+                    continue
+                # like Firebase, import does not check that emails are unique
+                self._users[user.uid] = FakeUserRecord(user.uid, getattr(user, "email", None))
+        return FakeUserImportResult(len(users) - len(errors), errors)
+
+    def get_users(self, identifiers, app=None):
+        with self._lock:
+            users, not_found = [], []
+            for identifier in identifiers:
+                email = getattr(identifier, "email", None)
+                uid = getattr(identifier, "uid", None)
+                match = [u for u in self._users.values()
+                         if (email is not None and (u.email or "").lower() == email.lower()) or u.uid == uid]
+                if match:
+                    users.extend(match)
+                else:
+                    not_found.append(identifier)
+        return FakeGetUsersResult(users, not_found)
+
+    def delete_users(self, uids, app=None):
+        with self._lock:
+            for uid in uids:
+                self._users.pop(uid, None)
+        return FakeUserImportResult(len(uids), [])
+
+    def generate_password_reset_link(self, email, action_code_settings=None, app=None):
+        with self._lock:
+            if not any((u.email or "").lower() == email.lower() for u in self._users.values()):
+                raise ValueError(f"No user record found for email {email}")
+        return f"https://example.com/reset?email={email}&oobCode={_auto_id()}"
+
+    def get_user(self, uid, app=None):
+        user = self._users.get(uid)
+        if user is None:
+            raise NotFound(f"No user record found for uid {uid}")
+        return user
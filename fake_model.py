@@ -0,0 +1,31 @@
+import time
+import threading
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Local stand-in for google.generativeai.GenerativeModel.
+    generate_content() sleeps for `latency` seconds and returns a
+    deterministic description; `calls` counts upstream calls.
+    """
+    def __init__(self, latency=0.0, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("fake model failure")
+        return FakeResponse(f"وصف تجريبي ({len(prompt)}): {prompt[:80]}")
@@ -0,0 +1,25 @@
+# Loaded automatically by gunicorn from the working directory.
+import os
+
+# Application factory (see create_app in main.py)
+wsgi_app = "main:create_app()"
+
+# The master imports the app and its heavy client libraries once and workers
+# fork from it, so a worker (re)start costs a fork instead of a full import.
+# Firestore, Auth and AI clients are still created per worker after the fork
+# (clients.ProcessLocal), which keeps preloading safe for gRPC.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+if preload_app:
+    os.environ.setdefault("PRELOAD_MODULES", "1")
+
+# Threaded workers: an open /api/products/changes stream holds a thread, not
+# a whole worker (main.py caps streams at CHANGES_MAX_STREAMS per worker, so
+# keep GUNICORN_THREADS above it to leave room for ordinary requests).
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+
+def post_worker_init(worker):
+    # build this worker's clients in the background; it accepts requests meanwhile
+    import main
+    main.warm_clients_in_background()
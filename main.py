@@ -1,12 +1,35 @@
 import os
+import re
 import json
+import base64
 import logging
+import time
+import hashlib
+import bisect
+import random
+import threading
 import traceback
+import io
+import hmac
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from urllib.parse import urlparse
-from flask import Flask, request, jsonify
+
+IMPORT_STARTED = time.perf_counter()   # startup timing, reported by create_app()
+
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
 from flask_cors import CORS
+import firebase_admin
 from firebase_admin import credentials, initialize_app, firestore, auth as firebase_auth
 from dotenv import load_dotenv
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from cache import TTLCache
+from changes import ChangeLog
+from clients import ProcessLocal
+import encoding
+from encoding import FastJSONProvider, compress_response, matching_etag
+from search import SearchIndex
+import metrics
 
 # ------------------------------------------------------
 # تحميل المتغيرات والتهيئة
@@ -16,8 +39,20 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("store-api")
 
 STATIC_FOLDER = os.getenv("STATIC_FOLDER", "src")
-app = Flask(__name__, static_folder=STATIC_FOLDER, static_url_path="/")
-app.secret_key = os.getenv("SECRET_KEY", os.urandom(24))
+SECRET_KEY = os.getenv("SECRET_KEY") or os.urandom(24)
+# routes and request hooks live on this blueprint; create_app() builds the app
+api = Blueprint("api", __name__)
+
+# JSON responses go through encoding.FastJSONProvider (orjson when installed,
+# JSON_ENCODER=json for the standard library). Bodies of at least
+# COMPRESS_MIN_SIZE bytes are sent brotli/gzip-compressed when the client
+# accepts it (0 disables compression).
+JSON_ENCODER = os.getenv("JSON_ENCODER", "orjson").lower()
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+@api.after_app_request
+def compress(response):
+    return compress_response(response, request.accept_encodings, COMPRESS_MIN_SIZE)
 
 # ------------------------------------------------------
 # إعداد CORS (الإصلاح النهائي)
@@ -25,13 +60,7 @@ app.secret_key = os.getenv("SECRET_KEY", os.urandom(24))
 # دومين موقعك على Netlify:
 NETLIFY_ORIGIN = os.getenv("NETLIFY_ORIGIN", "https://md-market.netlify.app")
 
-CORS(
-    app,
-    resources={r"/api/*": {"origins": [NETLIFY_ORIGIN, "http://localhost:5500", "http://127.0.0.1:5500"]}},
-    supports_credentials=True,
-)
-
-@app.after_request
+@api.after_app_request
 def add_cors_headers(response):
     """
     يضيف رؤوس CORS لضمان عمل الطلبات من المتصفح
@@ -47,13 +76,12 @@ def add_cors_headers(response):
     response.headers["Access-Control-Allow-Credentials"] = "true"
     response.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,DELETE,OPTIONS"
     response.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization"
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor,ETag"
     return response
 
-logger.info(f"CORS enabled for {NETLIFY_ORIGIN}")
-
 
 # --- Ensure robust CORS headers on every response (extra safety) ---
-@app.after_request
+@api.after_app_request
 def add_cors_headers(response):
     """
     Add Access-Control-Allow-* headers robustly.
@@ -89,51 +117,197 @@ def add_cors_headers(response):
         logger.exception("after_request CORS header set failed: %s", e)
     return response
 
-# Firebase Admin initialization (expects FIREBASE_SERVICE_ACCOUNT_JSON env var)
-FIREBASE_SA_JSON = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
-if not FIREBASE_SA_JSON:
-    logger.error("FIREBASE_SERVICE_ACCOUNT_JSON env var missing")
-    raise RuntimeError("FIREBASE_SERVICE_ACCOUNT_JSON not set")
-
-try:
-    sa_obj = json.loads(FIREBASE_SA_JSON)
-    cred = credentials.Certificate(sa_obj)
-    initialize_app(cred)
-    db = firestore.client()
-    logger.info("Initialized Firebase Admin SDK")
-except Exception as e:
-    logger.exception("Failed to initialize Firebase Admin SDK: %s", e)
-    raise
-
-# Optional AI config (not required)
-try:
-    import google.generativeai as genai
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    if GEMINI_API_KEY:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        logger.info("Gemini configured")
-    else:
-        model = None
-except Exception:
-    model = None
-    logger.warning("google.generativeai not available or failed to configure")
+# Storage backend: "firebase" (default) or "memory", the in-memory stand-in
+# from fake_firestore.py for tests and offline benchmarks. Its FakeAuth takes
+# any bearer string as a uid, so the app refuses to start with it unless
+# ALLOW_MEMORY_BACKEND is set as well.
+STORE_BACKEND = os.getenv("STORE_BACKEND", "firebase").lower()
+if STORE_BACKEND == "memory":
+    if os.getenv("ALLOW_MEMORY_BACKEND", "").lower() not in ("1", "true", "yes"):
+        raise RuntimeError("STORE_BACKEND=memory accepts any bearer token as a user id and is for tests "
+                           "and benchmarks only; set ALLOW_MEMORY_BACKEND=1 to use it")
+    logger.warning("STORE_BACKEND=memory: in-memory data and fake auth that trusts any bearer token "
+                   "(tests and benchmarks only, never expose this server)")
+    from fake_firestore import FakeAuth, FakeFirestore
+    db = FakeFirestore(latency=float(os.getenv("FAKE_FIRESTORE_LATENCY", "0")))
+    firebase_auth = FakeAuth(pause=db.pause)
+    LAZY_CLIENTS = []
+    logger.info("Using in-memory Firestore stand-in")
+else:
+    # Firebase Admin, Firestore and Auth are created on first use in each
+    # process (clients.ProcessLocal): the module imports without credentials
+    # and workers never share connections created before gunicorn forks.
+    FIREBASE_SA_JSON = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
+
+    def create_firebase_app():
+        """Firebase Admin initialization (expects FIREBASE_SERVICE_ACCOUNT_JSON env var)."""
+        if not FIREBASE_SA_JSON:
+            logger.error("FIREBASE_SERVICE_ACCOUNT_JSON env var missing")
+            raise RuntimeError("FIREBASE_SERVICE_ACCOUNT_JSON not set")
+        try:
+            # an app initialized before the fork carries the parent's HTTP sessions
+            firebase_admin.delete_app(firebase_admin.get_app())
+        except ValueError:
+            pass
+        try:
+            sa_obj = json.loads(FIREBASE_SA_JSON)
+            cred = credentials.Certificate(sa_obj)
+            fb_app = initialize_app(cred)
+            logger.info("Initialized Firebase Admin SDK in pid %s", os.getpid())
+            return fb_app
+        except Exception as e:
+            logger.exception("Failed to initialize Firebase Admin SDK: %s", e)
+            raise
+
+    def create_firestore_client():
+        # built directly rather than via firestore.client(), which caches the client on the app
+        fb_app = firebase_app.get()
+        return firestore.Client(credentials=fb_app.credential.get_credential(), project=fb_app.project_id)
+
+    def create_auth_client():
+        firebase_app.get()
+        return firebase_auth_module
+
+    firebase_auth_module = firebase_auth
+    firebase_app = ProcessLocal(create_firebase_app, "firebase")
+    db = ProcessLocal(create_firestore_client, "firestore")
+    firebase_auth = ProcessLocal(create_auth_client, "auth")
+    LAZY_CLIENTS = [firebase_app, db, firebase_auth]
+
+# ------------------------------------------------------
+# Request metrics (metrics.py), exported at /metrics
+# ------------------------------------------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+# bearer token for Prometheus scrapers; admins can also read /metrics with their ID token
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# log requests slower than this with a per-call breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+
+if METRICS_ENABLED:
+    db = metrics.TracedFirestore(db)
+    firebase_auth = metrics.TracedAuth(firebase_auth)
+
+    # registered before verify_token so token verification is part of the trace
+    @api.before_app_request
+    def start_request_metrics():
+        metrics.start_trace(keep_spans=SLOW_REQUEST_MS > 0)
+
+    @api.after_app_request
+    def finish_request_metrics(response):
+        trace = metrics.current_trace()
+        if trace is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        method = request.method
+
+        # streamed bodies still read from Firestore here, so finish when the response closes
+        # event streams stay open by design, so they are never reported as slow
+        slow_seconds = 0 if response.mimetype == 'text/event-stream' else SLOW_REQUEST_MS / 1000
+
+        def finish():
+            metrics.finish_request(trace, method, route, response.status_code, logger, slow_seconds)
+            metrics.clear_trace()
+        response.call_on_close(finish)
+        return response
+
+# Optional AI config (not required). google.generativeai is a heavy import,
+# so the model is created on the first AI request in each process.
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+AI_FAKE_MODEL = os.getenv("AI_FAKE_MODEL", "").lower() in ("1", "true", "yes")
+
+def create_ai_model():
+    try:
+        if AI_FAKE_MODEL:
+            # local stand-in for development and load tests, no network calls
+            from fake_model import FakeGenerativeModel
+            logger.info("Using fake AI model")
+            return FakeGenerativeModel(latency=float(os.getenv("AI_FAKE_MODEL_LATENCY", "0")))
+        if GEMINI_API_KEY:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            logger.info("Gemini configured")
+            return genai.GenerativeModel('gemini-1.5-flash')
+    except Exception:
+        logger.warning("google.generativeai not available or failed to configure")
+    return None
+
+model = ProcessLocal(create_ai_model, "ai_model")
+LAZY_CLIENTS.append(model)
 
 # Main admin uid (put your UID in Railway env MAIN_ADMIN_UID)
 MAIN_ADMIN_UID = os.getenv("MAIN_ADMIN_UID", "").strip()
 ALLOWED_ROLES = {'admin', 'publisher', 'moderator', 'viewer'}
 
+# ---------------- Caches ----------------
+# users/{uid} documents, looked up by has_role on every authenticated request
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+# push invalidations from Firestore to every worker (one listener per process)
+USER_CACHE_LISTENER = os.getenv("USER_CACHE_LISTENER", "").lower() in ("1", "true", "yes")
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+_user_listener = {"pid": None, "watch": None}
+_user_listener_lock = threading.Lock()
+
+def _on_users_snapshot(col_snapshot, changes, read_time):
+    for change in changes:
+        user_cache.invalidate(change.document.id)
+
+def ensure_user_listener():
+    """Start the users listener once per process (after gunicorn forks)."""
+    if not USER_CACHE_LISTENER or _user_listener["pid"] == os.getpid():
+        return
+    with _user_listener_lock:
+        if _user_listener["pid"] == os.getpid():
+            return
+        try:
+            _user_listener["watch"] = db.collection('users').on_snapshot(_on_users_snapshot)
+            _user_listener["pid"] = os.getpid()
+            logger.info("users cache listener started in pid %s", os.getpid())
+        except Exception:
+            logger.exception("Failed to start users cache listener")
+
+# Verified ID tokens, keyed by a hash of the token and kept until the token's
+# `exp`. The dashboard reuses one token for up to an hour, so most requests
+# skip the signature check entirely.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+# with revocation checks on, cached claims are re-verified at least this often
+TOKEN_CHECK_REVOKED = os.getenv("TOKEN_CHECK_REVOKED", "").lower() in ("1", "true", "yes")
+TOKEN_REVOCATION_TTL = float(os.getenv("TOKEN_REVOCATION_TTL", "300"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_REVOCATION_TTL)
+
+def verify_id_token_cached(id_token):
+    key = hashlib.sha256(id_token.encode()).hexdigest()
+    found, decoded = token_cache.get(key)
+    if found:
+        return decoded
+    decoded = firebase_auth.verify_id_token(id_token, check_revoked=TOKEN_CHECK_REVOKED)
+    ttl = decoded.get('exp', 0) - time.time()
+    if TOKEN_CHECK_REVOKED:
+        ttl = min(ttl, TOKEN_REVOCATION_TTL)
+    if ttl > 0:
+        token_cache.set(key, decoded, ttl)
+    return decoded
+
 # ---------------- Helpers ----------------
 def get_request_user():
     return getattr(request, 'user', None)
 
 def load_user_doc(uid):
+    if not uid:
+        return None
+    ensure_user_listener()
+    found, cached = user_cache.get(uid)
+    if found:
+        return cached
     try:
         doc = db.collection('users').document(uid).get()
-        return doc.to_dict() if doc.exists else None
+        user_doc = doc.to_dict() if doc.exists else None
     except Exception:
         logger.exception("Failed to load user doc")
         return None
+    # missing users are cached too, so unknown uids do not hit Firestore each time
+    user_cache.set(uid, user_doc)
+    return user_doc
 
 def has_role(user, role):
     if not user:
@@ -146,8 +320,1476 @@ def has_role(user, role):
         return False
     return doc.get('role') == role
 
+def build_product_doc(data, user):
+    """Validate and coerce a new product payload; raises ValueError if it is unusable."""
+    if not isinstance(data, dict):
+        raise ValueError("Product must be a JSON object")
+    name = data.get('name')
+    if not name:
+        raise ValueError("Product name required")
+
+    try:
+        quantity = int(data.get('quantity', 0))
+    except Exception:
+        quantity = 0
+    try:
+        price = float(data.get('price', 0.0))
+    except Exception:
+        price = 0.0
+
+    return {
+        'name': name,
+        'price': price,
+        'quantity': quantity,
+        'image_url': data.get('image_url', ''),
+        'description': data.get('description', ''),
+        'creator_uid': user.get('uid'),
+        'added_by': user.get('email'),
+        'status': 'available',    # available immediately
+        'created_at': firestore.SERVER_TIMESTAMP
+    }
+
+def coerce_product_update(update_data):
+    # the stock layout only changes through /stock/shards
+    update_data.pop('stock_shards', None)
+    if 'quantity' in update_data:
+        try:
+            update_data['quantity'] = int(update_data['quantity'])
+        except:
+            update_data['quantity'] = 0
+    return update_data
+
+def version_tag(update_time):
+    """ETag value for a document version (its Firestore update_time, full precision)."""
+    rfc3339 = getattr(update_time, 'rfc3339', None)
+    return rfc3339() if rfc3339 else update_time.isoformat()
+
+def check_if_match(doc):
+    """
+    Optimistic concurrency via If-Match: returns (write option, None) or
+    (None, error response). Without If-Match the write is unconditional.
+    """
+    if not request.if_match:
+        return None, None
+    if not (request.if_match.star_tag or matching_etag(request.if_match, version_tag(doc.update_time))):
+        return None, (jsonify({"msg":"Product was modified","etag": version_tag(doc.update_time)}), 412)
+    return db.write_option(last_update_time=doc.update_time), None
+
+# Product writes always carry the update_time of the version they replace, so
+# the analytics delta (new contribution minus old) is taken against exactly
+# that version even when two writers race. Without If-Match a write that lost
+# the race is retried against a fresh read; with If-Match the client named
+# its version and gets 412 instead.
+PRODUCT_WRITE_ATTEMPTS = int(os.getenv("PRODUCT_WRITE_ATTEMPTS", "5"))
+
+class ProductWriteConflict(Exception):
+    """Concurrent writers won every attempt; the client should retry."""
+
+def guarded_product_write(ref, doc, option, write, field_paths=None):
+    """
+    Call write(product, option) for the version in `doc`, re-reading after a
+    conflict. Returns (replaced product, write result). Raises
+    FailedPrecondition (If-Match no longer holds), NotFound or
+    ProductWriteConflict.
+    """
+    for attempt in range(PRODUCT_WRITE_ATTEMPTS):
+        if attempt:
+            doc = ref.get(field_paths=field_paths)
+            if not doc.exists:
+                raise NotFound("Product not found")
+        product = doc.to_dict() or {}
+        try:
+            return product, write(product, option or db.write_option(last_update_time=doc.update_time))
+        except FailedPrecondition:
+            if option:
+                raise
+    raise ProductWriteConflict()
+
+# ---------------- Pagination ----------------
+# Listing endpoints return one page at a time, ordered by created_at (newest
+# first). The next page is requested with the opaque cursor sent back in the
+# X-Next-Cursor response header.
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+# The old "return every document" behaviour (?all=1) is only honoured when the
+# server explicitly opts in.
+ALLOW_UNBOUNDED_LISTS = os.getenv("ALLOW_UNBOUNDED_LISTS", "").lower() in ("1", "true", "yes")
+
+def encode_cursor(doc_id, created_at):
+    payload = {"id": doc_id, "t": created_at.isoformat() if created_at else None}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        t = payload.get('t')
+        return {
+            'created_at': datetime.fromisoformat(t) if t else None,
+            '__name__': str(payload['id']),
+        }
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_page_args(decode=decode_cursor):
+    """Return (limit, cursor) from the query string; limit is None for an unbounded listing."""
+    if request.args.get('all', '').lower() in ('1', 'true', 'yes'):
+        if not ALLOW_UNBOUNDED_LISTS:
+            raise ValueError("Unbounded listing is disabled")
+        return None, None
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    if limit < 1:
+        raise ValueError("Invalid limit")
+    limit = min(limit, MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    return limit, decode(cursor) if cursor else None
+
+def product_list_query(client, user=None, is_admin=False):
+    """Listing query for the caller: available products when anonymous, everything for admins, own products otherwise."""
+    products_ref = client.collection('products')
+    if not user:
+        # unauthenticated: return only available products
+        query = products_ref.where('status', '==', 'available')
+    elif is_admin:
+        query = products_ref
+    else:
+        # normal user: return only their own products
+        query = products_ref.where('creator_uid', '==', user.get('uid'))
+    return query.order_by('created_at', direction=firestore.Query.DESCENDING)
+
+def page_query(query, limit, cursor):
+    """Query for one page, fetching one extra document to detect the next page."""
+    # tie-break on document id so equal timestamps never skip or repeat rows
+    query = query.order_by('__name__', direction=firestore.Query.DESCENDING)
+    if cursor:
+        query = query.start_after(cursor)
+    return query.limit(limit + 1)
+
+def split_page(docs, limit):
+    """Return (docs, next_cursor) from a page_query result; next_cursor is None on the last page."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last.id, last.get('created_at'))
+
+def fetch_page(query, limit, cursor):
+    """Run an ordered query for one page. Returns (docs, next_cursor)."""
+    if limit is None:
+        # unbounded: hand the live stream to the serializer
+        return query.stream(), None
+    return split_page(list(page_query(query, limit, cursor).stream()), limit)
+
+# Sparse fieldsets: ?fields=name,price,... limits product responses to those
+# fields (id is always included) and is pushed down to Firestore as a
+# select() projection. Lists default to SUMMARY_FIELDS and the detail endpoint
+# to the whole document; "summary" can be combined with other fields
+# (fields=summary,description) and fields=all returns whole documents.
+SUMMARY_FIELDS = ('name', 'price', 'quantity', 'status', 'image_url', 'creator_uid', 'added_by', 'created_at')
+MAX_FIELDS = 30
+FIELD_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,63}$')
+
+def parse_fields(default=None):
+    """Requested fields from ?fields=, or `default`; None means whole documents."""
+    raw = (request.args.get('fields') or '').strip()
+    if not raw:
+        return default
+    if raw in ('all', '*'):
+        return None
+    names = []
+    for name in raw.split(','):
+        name = name.strip()
+        if name == 'summary':
+            names.extend(SUMMARY_FIELDS)
+        elif name and name != 'id':
+            if not FIELD_NAME_RE.match(name):
+                raise ValueError(f"Invalid field: {name}")
+            names.append(name)
+    names = tuple(dict.fromkeys(names))
+    if len(names) > MAX_FIELDS:
+        raise ValueError("Too many fields")
+    return names
+
+def field_paths(fields):
+    """Firestore projection for `fields`; created_at is always read because cursors need it."""
+    if fields is None:
+        return None
+    return list(dict.fromkeys(fields + ('created_at',)))
+
+def select_fields(query, fields):
+    return query if fields is None else query.select(field_paths(fields))
+
+def project_json(item, fields, id_field='id'):
+    if fields is None:
+        return item
+    return {key: item[key] for key in (id_field,) + fields if key in item}
+
+def doc_to_json(data, doc_id, id_field='id', fields=None):
+    """Response shape of a stored document: id added (the JSON provider encodes timestamps as epoch seconds)."""
+    out = dict(data or {})
+    out[id_field] = doc_id
+    return project_json(out, fields, id_field)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_json_list(docs, next_cursor=None, id_field='id', fields=None):
+    """
+    Stream documents as a JSON array, encoding each one as it arrives from
+    .stream() instead of building the whole list and string first.
+    """
+    dumps = current_app.json.dumps   # the body is produced after the app context ends
+
+    def generate():
+        buf = ['[']
+        size = 1
+        first = True
+        try:
+            for doc in docs:
+                item = dumps(doc_to_json(doc.to_dict(), doc.id, id_field, fields))
+                if not first:
+                    item = ',' + item
+                first = False
+                buf.append(item)
+                size += len(item)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield ''.join(buf)
+                    buf, size = [], 0
+        except Exception:
+            # headers are already sent; abort so the client sees a broken body, not a short list
+            logger.exception("Streaming list response aborted")
+            raise
+        buf.append(']')
+        yield ''.join(buf)
+
+    response = Response(generate(), mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+# ---------------- Public catalog ----------------
+# Per-worker materialized copy of the available catalog, kept current by a
+# Firestore listener. Anonymous listings are served from memory: page bodies
+# are serialized once per catalog change and carry a strong ETag, so a
+# matching If-None-Match is answered with 304 without touching Firestore.
+PUBLIC_CATALOG_LISTENER = os.getenv("PUBLIC_CATALOG_LISTENER", "").lower() in ("1", "true", "yes")
+PUBLIC_CATALOG_PAGE_CACHE = int(os.getenv("PUBLIC_CATALOG_PAGE_CACHE", "256"))
+
+class PublicCatalog:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.version = 0
+        self._pid = None
+        self._watch = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._products = {}   # id -> (sort key, created_at, serialized product)
+        self._keys = []       # sort keys, ascending (oldest first)
+        self._rows = []       # (created_at, product) in the same order as _keys
+        self._pages = {}      # (limit, cursor, fields) -> (body, etag, next_cursor)
+
+    def ensure_started(self):
+        """Start the listener once per process (after gunicorn forks)."""
+        if not PUBLIC_CATALOG_LISTENER or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.ready.clear()
+            try:
+                query = db.collection('products').where('status', '==', 'available')
+                self._watch = query.on_snapshot(self._on_snapshot)
+                logger.info("public catalog listener started in pid %s", os.getpid())
+            except Exception:
+                logger.exception("Failed to start public catalog listener")
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == 'REMOVED':
+                    self._products.pop(doc.id, None)
+                    continue
+                data = doc.to_dict() or {}
+                # match the Firestore ordering: documents without created_at are not listed
+                if 'created_at' not in data:
+                    self._products.pop(doc.id, None)
+                    continue
+                created_at = data['created_at']
+                ts = created_at.timestamp() if created_at else float('-inf')
+                self._products[doc.id] = ((ts, doc.id), created_at, doc_to_json(data, doc.id))
+            ordered = sorted(self._products.values(), key=lambda item: item[0])
+            self._keys = [item[0] for item in ordered]
+            self._rows = [(item[1], item[2]) for item in ordered]
+            self._pages = {}
+            self.version += 1
+        self.ready.set()
+        # precompute the default first page, the one almost every visitor asks for
+        self.page(DEFAULT_PAGE_SIZE, None, None, SUMMARY_FIELDS)
+
+    def page(self, limit, cursor, raw_cursor, fields=None):
+        """Return (body, etag, next_cursor) for one page of the catalog, newest first."""
+        page_key = (limit, raw_cursor, fields)
+        with self._lock:
+            cached = self._pages.get(page_key)
+            if cached:
+                return cached
+            keys, rows, version = self._keys, self._rows, self.version
+        if cursor:
+            created_at = cursor['created_at']
+            ts = created_at.timestamp() if created_at else float('-inf')
+            end = bisect.bisect_left(keys, (ts, cursor['__name__']))
+        else:
+            end = len(keys)
+        start = 0 if limit is None else max(0, end - limit)
+        items = [project_json(p, fields) for _, p in reversed(rows[start:end])]
+        next_cursor = None
+        if start > 0:
+            created_at, last = rows[start]
+            next_cursor = encode_cursor(last['id'], created_at)
+        body = current_app.json.dumps(items)
+        etag = hashlib.sha256(body.encode()).hexdigest()[:40]
+        result = (body, etag, next_cursor)
+        with self._lock:
+            if self.version == version and len(self._pages) < PUBLIC_CATALOG_PAGE_CACHE:
+                self._pages[page_key] = result
+        return result
+
+public_catalog = PublicCatalog()
+
+def public_catalog_response(limit, cursor, fields=None):
+    """Serve an anonymous listing from memory, or None while the catalog is not loaded."""
+    public_catalog.ensure_started()
+    if not public_catalog.ready.is_set():
+        return None
+    body, etag, next_cursor = public_catalog.page(limit, cursor, request.args.get('cursor'), fields)
+    matched = matching_etag(request.if_none_match, etag)
+    if matched:
+        # 304 names the representation the client holds (compress_response skips 304s)
+        response = current_app.response_class(status=304)
+        response.set_etag(matched)
+    else:
+        response = current_app.response_class(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# ---------------- Product search ----------------
+# Per-worker inverted index over product name and description (search.py),
+# kept current by a listener on the whole collection. It is built on the
+# first search request, so workers that never search do not hold a copy.
+SEARCH_READY_TIMEOUT = float(os.getenv("SEARCH_READY_TIMEOUT", "5"))
+
+def product_visibility_rule(user=None, is_admin=False):
+    """
+    handle_products' visibility rules as a predicate on (status, creator_uid),
+    or None when everything is visible: available products when anonymous,
+    everything for admins, own products otherwise.
+    """
+    if not user:
+        return lambda visibility: visibility[0] == 'available'
+    if is_admin:
+        return None
+    uid = user.get('uid')
+    return lambda visibility: visibility[1] == uid
+
+def encode_search_cursor(key):
+    score, recency, doc_id = key
+    raw = json.dumps({"s": score, "r": recency, "id": doc_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_search_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (float(payload['s']), float(payload['r']), str(payload['id']))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+class ProductListener:
+    """
+    One on_snapshot listener on the whole products collection per process,
+    shared by the consumers that need it (search index, change stream).
+    Consumers attach on first use and get load(docs, read_time) with the
+    full current state, then apply(changes, read_time) for every later
+    snapshot.
+    """
+    def __init__(self):
+        self._consumers = []
+        self._docs = None
+        self._read_time = None
+        self._lock = threading.Lock()   # orders attach() against callbacks
+        self._pid = None
+        self._watch = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the listener once per process (after gunicorn forks)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._consumers = []
+            self._docs = None
+            try:
+                self._watch = db.collection('products').on_snapshot(self._on_snapshot)
+                logger.info("products listener started in pid %s", os.getpid())
+            except Exception:
+                logger.exception("Failed to start products listener")
+
+    def attach(self, consumer):
+        self.ensure_started()
+        with self._lock:
+            self._consumers.append(consumer)
+            if self._docs is not None:
+                consumer.load(self._docs, self._read_time)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            first = self._docs is None
+            self._docs, self._read_time = docs, read_time
+            for consumer in self._consumers:
+                try:
+                    if first:
+                        consumer.load(docs, read_time)
+                    else:
+                        consumer.apply(changes, read_time)
+                except Exception:
+                    logger.exception("products listener consumer %s failed", type(consumer).__name__)
+
+product_listener = ProductListener()
+
+class ProductSearch:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.index = SearchIndex({'name': 3.0, 'description': 1.0})
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Attach to the products listener once per process (after gunicorn forks)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.ready.clear()
+            self.index.clear()
+            product_listener.attach(self)
+
+    def load(self, docs, read_time):
+        self.index.clear()
+        for doc in docs:
+            self._put(doc.id, doc.to_dict() or {})
+        self.ready.set()
+
+    def apply(self, changes, read_time):
+        for change in changes:
+            if change.type.name == 'REMOVED':
+                self.index.remove(change.document.id)
+            else:
+                self._put(change.document.id, change.document.to_dict() or {})
+        self.ready.set()
+
+    def _put(self, doc_id, data):
+        # like the listings, documents without created_at are never returned
+        if 'created_at' not in data:
+            self.index.remove(doc_id)
+            return
+        created_at = data['created_at']
+        visibility = (data.get('status'), data.get('creator_uid'))
+        self.index.put(doc_id, data, (visibility, doc_to_json(data, doc_id)),
+                       recency=created_at.timestamp() if created_at else float('-inf'))
+
+    def search(self, query, user=None, is_admin=False):
+        """Ranked [(key, product)] visible to the caller, with handle_products' visibility rules."""
+        visible = product_visibility_rule(user, is_admin)
+        predicate = None if visible is None else (lambda payload: visible(payload[0]))
+        return [(key, payload[1]) for key, payload in self.index.search(query, predicate)]
+
+product_search = ProductSearch()
+
+def search_response(user=None, is_admin=False):
+    """One page of search results for ?q=, in the listing response format."""
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"msg": "Missing search query (q)"}), 400
+    try:
+        limit, cursor = parse_page_args(decode_search_cursor)
+        fields = parse_fields(SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    product_search.ensure_started()
+    if not product_search.ready.wait(SEARCH_READY_TIMEOUT):
+        response = jsonify({"msg": "Search index is loading, retry shortly"})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+    results = product_search.search(query, user, is_admin)
+    start = bisect.bisect_right([key for key, _ in results], cursor) if cursor else 0
+    end = len(results) if limit is None else start + limit
+    page = results[start:end]
+    response = current_app.response_class(current_app.json.dumps([project_json(product, fields) for _, product in page]),
+                                  status=200, mimetype='application/json')
+    if end < len(results):
+        response.headers['X-Next-Cursor'] = encode_search_cursor(page[-1][0])
+    return response
+
+# ---------------- Product change stream ----------------
+# GET /api/products/changes is a server-sent events stream of added, modified
+# and removed products, so dashboards update in place instead of refetching
+# the list. Events come from the shared products listener through one
+# bounded ChangeLog per worker (changes.py) and are filtered per client with
+# handle_products' visibility rules; a product leaving a client's view
+# arrives as "removed". Event ids are the listener's read time in
+# microseconds, which every worker agrees on, so a reconnecting client
+# resumes from Last-Event-ID on any worker. When that point is no longer
+# held (or the client is too slow to keep up) it gets a "reset" event and
+# reloads the list. A stream opened without a token gets the anonymous view;
+# a browser EventSource cannot send Authorization, so the dashboard reads the
+# stream with fetch to get its own. Each open stream holds one worker thread
+# (gunicorn.conf.py runs threaded workers), capped at CHANGES_MAX_STREAMS per
+# worker, and is closed after CHANGES_MAX_SECONDS so clients reconnect and
+# spread out.
+CHANGES_BUFFER = int(os.getenv("CHANGES_BUFFER", "2000"))
+CHANGES_MAX_STREAMS = int(os.getenv("CHANGES_MAX_STREAMS", "24"))
+CHANGES_MAX_SECONDS = float(os.getenv("CHANGES_MAX_SECONDS", "300"))
+CHANGES_HEARTBEAT = float(os.getenv("CHANGES_HEARTBEAT", "15"))
+CHANGES_RETRY_MS = int(os.getenv("CHANGES_RETRY_MS", "3000"))
+CHANGES_BATCH = 100
+# events carry what a dashboard card shows: the list summary plus the description
+CHANGE_FIELDS = SUMMARY_FIELDS + ('description',)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def encode_event(data):
+    # bodies are encoded on the listener thread, outside any app context
+    return encoding.dumps(data, encoding.json_backend(JSON_ENCODER))
+
+def event_time(read_time):
+    return (read_time - EPOCH) // timedelta(microseconds=1)
+
+class ProductChangeFeed:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.log = ChangeLog(CHANGES_BUFFER)
+        self._visibility = {}   # product id -> (status, creator_uid) as last seen
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._streams = 0
+        self._streams_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Attach to the products listener once per process (after gunicorn forks)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.ready.clear()
+            self._streams = 0
+            product_listener.attach(self)
+
+    def load(self, docs, read_time):
+        # the initial snapshot is the state clients load from the list endpoints, not events
+        self._visibility = {}
+        for doc in docs:
+            data = doc.to_dict() or {}
+            if 'created_at' in data:
+                self._visibility[doc.id] = (data.get('status'), data.get('creator_uid'))
+        self.log.reset(event_time(read_time))
+        self.ready.set()
+
+    def apply(self, changes, read_time):
+        items = []
+        for change in changes:
+            doc = change.document
+            data = doc.to_dict() or {}
+            old = self._visibility.pop(doc.id, None)
+            new, body = None, None
+            # like the listings, documents without created_at are never returned
+            if change.type.name != 'REMOVED' and 'created_at' in data:
+                new = self._visibility[doc.id] = (data.get('status'), data.get('creator_uid'))
+                body = encode_event(doc_to_json(data, doc.id, fields=CHANGE_FIELDS))
+            if old is not None or new is not None:
+                items.append((doc.id, old, new, body))
+        if items:
+            self.log.append(event_time(read_time), items)
+
+    def open_stream(self):
+        with self._streams_lock:
+            if self._streams >= CHANGES_MAX_STREAMS:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._streams_lock:
+            self._streams -= 1
+
+product_changes = ProductChangeFeed()
+
+def format_change(change, visible):
+    """One SSE event for `change` as seen by a client, or None if it never sees the product."""
+    doc_id, old, new, body = change.item
+    was = old is not None and (visible is None or visible(old))
+    now = new is not None and (visible is None or visible(new))
+    if now:
+        kind = 'modified' if was else 'added'
+    elif was:
+        kind, body = 'removed', encode_event({'id': doc_id})
+    else:
+        return None
+    return f"id: {change.time}\nevent: {kind}\ndata: {body}\n\n"
+
+def product_changes_response(user=None, is_admin=False):
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        since = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"msg": "Invalid Last-Event-ID"}), 400
+    product_changes.ensure_started()
+    if not product_changes.ready.wait(SEARCH_READY_TIMEOUT) or not product_changes.open_stream():
+        response = jsonify({"msg": "Change stream unavailable, retry shortly"})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    visible = product_visibility_rule(user, is_admin)
+    log = product_changes.log
+
+    def generate():
+        try:
+            generation = log.generation
+            position = log.position(since) if since is not None else None
+            reset = position is None and since is not None
+            if position is None:
+                position, cursor_time = log.head()
+            else:
+                cursor_time = since
+            head = f"retry: {CHANGES_RETRY_MS}\n"
+            # a reset tells the client to reload the list; either way it is now current as of cursor_time
+            yield head + (f"id: {cursor_time}\nevent: reset\ndata: {{}}\n\n" if reset else f"id: {cursor_time}\n\n")
+            sent_time = cursor_time
+            deadline = time.monotonic() + CHANGES_MAX_SECONDS
+            last_write = time.monotonic()
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                events = log.read(position, generation, min(CHANGES_HEARTBEAT, remaining), CHANGES_BATCH)
+                if events is None:
+                    # fell behind the buffer, or the listener restarted
+                    generation = log.generation
+                    position, cursor_time = log.head()
+                    sent_time = cursor_time
+                    last_write = time.monotonic()
+                    yield f"id: {cursor_time}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+                out = []
+                for change in events:
+                    event = format_change(change, visible)
+                    if event:
+                        out.append(event)
+                        sent_time = change.time
+                if events:
+                    position, cursor_time = events[-1].seq, events[-1].time
+                if out:
+                    last_write = time.monotonic()
+                    yield ''.join(out)
+                elif time.monotonic() - last_write >= CHANGES_HEARTBEAT:
+                    # an id-only block is a heartbeat that also moves the client's resume point
+                    last_write = time.monotonic()
+                    if cursor_time != sent_time:
+                        sent_time = cursor_time
+                        yield f"id: {cursor_time}\n\n"
+                    else:
+                        yield ": ping\n\n"
+        finally:
+            product_changes.close_stream()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'   # nginx and similar proxies: do not buffer the stream
+    return response
+
+@api.route("/api/products/changes", methods=['GET'])
+def products_changes():
+    user = get_request_user()
+    return product_changes_response(user, bool(user) and has_role(user, 'admin'))
+
+# ---------------- Analytics rollups ----------------
+# Running totals (count, counts by status, inventory value, products created
+# per month) live in analytics/products/shards/{n}: every product write adds
+# its delta with Increment to one random shard, so the totals take
+# ROLLUP_SHARDS times the writes one document sustains (about one per
+# second), and /api/analytics sums the shards in one query. Counts per
+# creator are one small document each in analytics/products/creators, so the
+# totals stay bounded however many publishers there are; the analytics
+# response lists the largest ROLLUP_TOP_CREATORS. The deltas are exact (see
+# guarded_product_write).
+#
+# Increments only start once analytics/products exists, so a deployment that
+# predates the rollup never serves partial totals: the first /api/analytics
+# request creates that document and starts a rebuild job (see Background
+# jobs) that recounts the products, and until the rebuild has finished
+# (rebuilt_at is set) analytics is served from aggregation queries. Admins
+# can start the same job with POST /api/admin/analytics/rebuild to repair
+# drift (writes made outside this API, a rollup write that failed). Setting
+# ROLLUP_RECONCILE_SECONDS also rebuilds on that interval; it is off by
+# default because every rebuild reads the whole products collection.
+PRODUCT_STATUSES = ('available', 'unavailable', 'pending', 'rejected')
+ARABIC_MONTHS = ["يناير","فبراير","مارس","أبريل","مايو","يونيو","يوليو","أغسطس","سبتمبر","أكتوبر","نوفمبر","ديسمبر"]
+ROLLUP_SHARDS = max(1, int(os.getenv("ROLLUP_SHARDS", "10")))
+ROLLUP_TOP_CREATORS = int(os.getenv("ROLLUP_TOP_CREATORS", "20"))
+ROLLUP_RECONCILE_SECONDS = float(os.getenv("ROLLUP_RECONCILE_SECONDS", "0"))
+ROLLUP_SETTLE_SECONDS = float(os.getenv("ROLLUP_SETTLE_SECONDS", "1"))
+ROLLUP_STATE_TTL = float(os.getenv("ROLLUP_STATE_TTL", "10"))   # how long a worker trusts "no rollup yet"
+ROLLUP_TOTAL_FIELDS = ['total', 'inventory_value', 'by_status', 'created_by_month']
+ROLLUP_WRITE_BATCH = 500   # Firestore batch limit
+
+def rollup_ref():
+    """analytics/products: parent of the shards; records the running rebuild job and when the last one finished."""
+    return db.collection('analytics').document('products')
+
+def rollup_shards_ref():
+    return rollup_ref().collection('shards')
+
+def creator_counts_ref():
+    return rollup_ref().collection('creators')
+
+def product_rollup_delta(product, sign=1):
+    """Rollup contribution of one product; sign=-1 removes it."""
+    try:
+        value = float(product.get('price') or 0) * int(product.get('quantity') or 0)
+    except (TypeError, ValueError):
+        value = 0.0
+    created_at = product.get('created_at')
+    if not isinstance(created_at, datetime):
+        # new documents carry SERVER_TIMESTAMP, i.e. "now"
+        created_at = datetime.now(timezone.utc)
+    return {
+        'total': sign,
+        'inventory_value': sign * value,
+        'by_status': {str(product.get('status') or 'unknown'): sign},
+        'by_creator': {str(product.get('creator_uid') or 'unknown'): sign},
+        'created_by_month': {created_at.strftime('%Y-%m'): sign},
+    }
+
+def merge_rollup_deltas(deltas):
+    merged = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            if isinstance(value, dict):
+                bucket = merged.setdefault(key, {})
+                for k, v in value.items():
+                    bucket[k] = bucket.get(k, 0) + v
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+# rollup writes are commutative increments, so they are sent off the request path
+rollup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rollup")
+# checks whether a rebuild is due; the rebuild itself runs as a job
+reconcile_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rollup-reconcile")
+_reconcile_due = [0.0]
+_rollup_started = {"exists": False, "checked": None}
+
+def rollup_started():
+    """Whether analytics/products exists. Cached for good once true, for ROLLUP_STATE_TTL while false."""
+    checked = _rollup_started["checked"]
+    if _rollup_started["exists"] or (checked is not None and time.monotonic() - checked < ROLLUP_STATE_TTL):
+        return _rollup_started["exists"]
+    _rollup_started["exists"] = rollup_ref().get().exists
+    _rollup_started["checked"] = time.monotonic()
+    return _rollup_started["exists"]
+
+def apply_rollup(*deltas):
+    """Add deltas to the rollup in the background. Failures are logged, never raised."""
+    payload, creators = {}, {}
+    for key, value in merge_rollup_deltas(deltas).items():
+        if key == 'by_creator':
+            creators = {k: v for k, v in value.items() if v}
+        elif isinstance(value, dict):
+            nested = {k: firestore.Increment(v) for k, v in value.items() if v}
+            if nested:
+                payload[key] = nested
+        elif value:
+            payload[key] = firestore.Increment(value)
+    if payload or creators:
+        rollup_executor.submit(_write_rollup, payload, creators)
+    maybe_reconcile_rollups()
+
+def _write_rollup(payload, creators):
+    try:
+        if not rollup_started():
+            # not bootstrapped yet: the first rebuild counts this write
+            return
+        batch = db.batch()
+        if payload:
+            shard = rollup_shards_ref().document(str(random.randrange(ROLLUP_SHARDS)))
+            batch.set(shard, {**payload, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+        for creator, change in creators.items():
+            batch.set(creator_counts_ref().document(creator), {'total': firestore.Increment(change)}, merge=True)
+        batch.commit()
+    except Exception:
+        logger.exception("Failed to update analytics rollup")
+
+def read_rollup(all_creators=False):
+    """Summed shard totals plus the top creators (or all); None before the first rollup write."""
+    shards = list(rollup_shards_ref().select(ROLLUP_TOTAL_FIELDS).stream())
+    if not shards and not all_creators:
+        return None
+    rollup = merge_rollup_deltas(
+        {k: v for k, v in (doc.to_dict() or {}).items() if k in ROLLUP_TOTAL_FIELDS} for doc in shards)
+    creators = creator_counts_ref()
+    if not all_creators:
+        creators = creators.order_by('total', direction=firestore.Query.DESCENDING).limit(ROLLUP_TOP_CREATORS)
+    rollup['by_creator'] = {doc.id: (doc.to_dict() or {}).get('total', 0) for doc in creators.stream()}
+    return rollup
+
+def _commit_in_batches(writes):
+    """writes: callables staging one write on a batch each."""
+    for i in range(0, len(writes), ROLLUP_WRITE_BATCH):
+        batch = db.batch()
+        for stage in writes[i:i + ROLLUP_WRITE_BATCH]:
+            stage(batch)
+        batch.commit()
+
+def rebuild_rollups(attempts=3, heartbeat=lambda: None):
+    """
+    Recount every product and add the difference from the stored rollup as
+    increments, so rollup writes made meanwhile are never overwritten. The
+    rollup is read before the count and again ROLLUP_SETTLE_SECONDS after
+    it (time for in-flight increments to land); if it moved, a product write
+    raced with the count and the rebuild is tried again. rebuilt_at is only
+    written with the correction. Returns the recounted rollup.
+    """
+    fields = ['price', 'quantity', 'status', 'creator_uid', 'created_at']
+
+    def count(docs):
+        for doc in docs:
+            heartbeat()
+            yield product_rollup_delta(doc.to_dict() or {})
+
+    for _ in range(attempts):
+        before = read_rollup(all_creators=True)
+        counted = merge_rollup_deltas(count(db.collection('products').select(fields).stream()))
+        time.sleep(ROLLUP_SETTLE_SECONDS)
+        after = read_rollup(all_creators=True)
+        if before == after:
+            break
+    else:
+        raise RuntimeError("Products kept changing during the rebuild, retry later")
+    stale = merge_rollup_deltas([counted, {k: ({c: -n for c, n in v.items()} if isinstance(v, dict) else -v)
+                                           for k, v in after.items()}])
+    shard = rollup_shards_ref().document('0')
+    correction = {}
+    for key in ROLLUP_TOTAL_FIELDS:
+        value = stale.get(key)
+        if isinstance(value, dict):
+            nested = {k: firestore.Increment(v) for k, v in value.items() if v}
+            if nested:
+                correction[key] = nested
+        elif value:
+            correction[key] = firestore.Increment(value)
+    writes = []
+    if correction:
+        writes.append(lambda b: b.set(shard, correction, merge=True))
+    writes += [lambda b, c=c, n=n: b.set(creator_counts_ref().document(c), {'total': firestore.Increment(n)}, merge=True)
+               for c, n in stale.get('by_creator', {}).items() if n]
+    # also releases the rebuild claim and clears the single-document rollup of older versions
+    writes.append(lambda b: b.set(rollup_ref(), {'rebuilt_at': firestore.SERVER_TIMESTAMP}))
+    _commit_in_batches(writes)
+    return {
+        'total': counted.get('total', 0),
+        'inventory_value': counted.get('inventory_value', 0.0),
+        'by_status': counted.get('by_status', {}),
+        'by_creator': counted.get('by_creator', {}),
+        'created_by_month': counted.get('created_by_month', {}),
+    }
+
+def rollup_needs_rebuild(state):
+    """state: analytics/products as a dict. True before the first rebuild finished or when a reconcile is due."""
+    rebuilt_at = state.get('rebuilt_at')
+    if not isinstance(rebuilt_at, datetime):
+        return True
+    return ROLLUP_RECONCILE_SECONDS > 0 and \
+        datetime.now(timezone.utc) - rebuilt_at >= timedelta(seconds=ROLLUP_RECONCILE_SECONDS)
+
+def start_rollup_rebuild(user=None, doc=None):
+    """
+    Start a rebuild_analytics job unless one is already queued or running and
+    return the job id. The job id is claimed on analytics/products first
+    (created, or updated with a last_update_time precondition), so workers
+    racing here start a single rebuild; creating that document is also what
+    switches increments on, see rollup_started().
+    """
+    ref = rollup_ref()
+    for _ in range(3):
+        doc = doc if doc is not None else ref.get()
+        claimed = (doc.to_dict() or {}).get('rebuild_job') if doc.exists else None
+        if claimed:
+            job = jobs_ref().document(claimed).get()
+            if job.exists and (job.to_dict() or {}).get('status') in ('queued', 'running') \
+                    and not job_is_stale(job.to_dict() or {}):
+                return claimed
+        job_ref = jobs_ref().document()
+        try:
+            if doc.exists:
+                ref.update({'rebuild_job': job_ref.id}, option=db.write_option(last_update_time=doc.update_time))
+            else:
+                ref.create({'rebuild_job': job_ref.id})
+        except (FailedPrecondition, AlreadyExists):
+            doc = None   # another worker claimed it; return its job
+            continue
+        # a new rollup: wait until every worker has seen the document before counting
+        start_job('rebuild_analytics', {'bootstrap': not doc.exists}, user, ref=job_ref)
+        return job_ref.id
+    raise RuntimeError("Analytics rebuild is contended, retry later")
+
+def maybe_reconcile_rollups(bootstrap=False):
+    """
+    Check in the background, at most once a minute per worker, whether a
+    rebuild is due: always when bootstrap is set (no finished rebuild yet),
+    otherwise only with ROLLUP_RECONCILE_SECONDS.
+    """
+    if (ROLLUP_RECONCILE_SECONDS <= 0 and not bootstrap) or time.monotonic() < _reconcile_due[0]:
+        return
+    _reconcile_due[0] = time.monotonic() + 60
+    reconcile_executor.submit(_reconcile_rollups)
+
+def _reconcile_rollups():
+    try:
+        doc = rollup_ref().get()
+        if rollup_needs_rebuild((doc.to_dict() or {}) if doc.exists else {}):
+            job_id = start_rollup_rebuild(doc=doc)
+            logger.info("analytics rollup rebuild: job %s", job_id)
+    except Exception:
+        logger.exception("Failed to start analytics rollup rebuild")
+
+def aggregate_count(query):
+    result = query.count().get()
+    return int(result[0][0].value)
+
+def monthly_series(created_by_month, months=6):
+    now = datetime.now(timezone.utc)
+    labels, values = [], []
+    for i in range(months - 1, -1, -1):
+        year, month = divmod(now.year * 12 + now.month - 1 - i, 12)
+        labels.append(ARABIC_MONTHS[month])
+        values.append(int(created_by_month.get(f"{year:04d}-{month + 1:02d}", 0)))
+    return {"labels": labels, "values": values}
+
+# ---------------- Stock ----------------
+# Buyers change quantity through reserve/release, never by writing the field:
+# a reservation checks and decrements stock in one transaction, so parallel
+# reservations cannot oversell, and release adds its units back with
+# Increment. A product taking more writes than one document sustains (about
+# one per second) can split its stock over products/{id}/stock_shards/{n}; a
+# reservation then locks a single random shard. The product's own quantity
+# field is then a copy of the shard total, written back at most once per
+# STOCK_SYNC_DELAY per worker, so lists, search and analytics keep reading one
+# plain field; /stock serves the total from a short-lived cache.
+#
+# A reservation holds its units for STOCK_HOLD_SECONDS (expires_at). Expired
+# reservations are released with the same transaction as /release, marked
+# "expired", by a sweep each worker starts at most every STOCK_SWEEP_SECONDS
+# from reserve and /stock requests (it queries reservations on status and
+# expires_at, which needs a composite index). A user holds at most
+# STOCK_MAX_HELD reservations at a time.
+STOCK_TX_ATTEMPTS = int(os.getenv("STOCK_TX_ATTEMPTS", "10"))
+STOCK_MAX_SHARDS = int(os.getenv("STOCK_MAX_SHARDS", "50"))
+STOCK_MAX_RESERVE = int(os.getenv("STOCK_MAX_RESERVE", "1000"))
+STOCK_CACHE_TTL = float(os.getenv("STOCK_CACHE_TTL", "2"))
+STOCK_SYNC_DELAY = float(os.getenv("STOCK_SYNC_DELAY", "2"))
+STOCK_HOLD_SECONDS = float(os.getenv("STOCK_HOLD_SECONDS", "900"))
+STOCK_MAX_HELD = int(os.getenv("STOCK_MAX_HELD", "20"))
+STOCK_SWEEP_SECONDS = float(os.getenv("STOCK_SWEEP_SECONDS", "60"))
+STOCK_SWEEP_BATCH = 200
+stock_cache = TTLCache(int(os.getenv("STOCK_CACHE_SIZE", "1024")), STOCK_CACHE_TTL)
+stock_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stock")
+_stock_sync_pending = set()
+_stock_sync_lock = threading.Lock()
+_stock_sweep_due = [0.0]
+
+class StockError(Exception):
+    def __init__(self, msg, status=409):
+        super().__init__(msg)
+        self.status = status
+
+class StockLayoutChanged(Exception):
+    """The product was (un)sharded while reserving; retry with the new layout."""
+
+def stock_rollup_delta(product, quantity_change):
+    try:
+        return {'inventory_value': float(product.get('price') or 0) * quantity_change}
+    except (TypeError, ValueError):
+        return {}
+
+def stock_shard_refs(product_ref, shards):
+    shard_col = product_ref.collection('stock_shards')
+    return [shard_col.document(str(i)) for i in range(shards)]
+
+def split_stock(total, shards):
+    base, extra = divmod(total, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+def snapshot_quantity(snapshot):
+    try:
+        return int((snapshot.to_dict() or {}).get('quantity') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+@firestore.transactional
+def _reserve_unsharded(transaction, product_ref, quantity, reservation_ref, reservation):
+    snapshot = product_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise StockError("Product not found", 404)
+    product = snapshot.to_dict() or {}
+    if product.get('stock_shards'):
+        raise StockLayoutChanged()
+    if product.get('status') != 'available':
+        raise StockError("Product is not available")
+    if snapshot_quantity(snapshot) < quantity:
+        raise StockError("Not enough stock")
+    transaction.update(product_ref, {'quantity': firestore.Increment(-quantity)})
+    transaction.create(reservation_ref, {**reservation, 'shards': None})
+
+@firestore.transactional
+def _reserve_from_shard(transaction, shard_ref, quantity, reservation_ref, reservation):
+    snapshot = shard_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise StockLayoutChanged()
+    if snapshot_quantity(snapshot) < quantity:
+        return False
+    transaction.update(shard_ref, {'quantity': firestore.Increment(-quantity)})
+    transaction.create(reservation_ref, {**reservation, 'shards': {shard_ref.id: quantity}})
+    return True
+
+@firestore.transactional
+def _reserve_across_shards(transaction, shard_refs, quantity, reservation_ref, reservation):
+    # locks every shard: only used when no single shard holds enough
+    snapshots = {s.id: s for s in db.get_all(shard_refs, transaction=transaction)}
+    if len(snapshots) < len(shard_refs) or not all(s.exists for s in snapshots.values()):
+        raise StockLayoutChanged()
+    if sum(snapshot_quantity(s) for s in snapshots.values()) < quantity:
+        raise StockError("Not enough stock")
+    taken, remaining = {}, quantity
+    for ref in shard_refs:
+        n = min(remaining, snapshot_quantity(snapshots[ref.id]))
+        if n > 0:
+            transaction.update(ref, {'quantity': firestore.Increment(-n)})
+            taken[ref.id] = n
+            remaining -= n
+        if not remaining:
+            break
+    transaction.create(reservation_ref, {**reservation, 'shards': taken})
+
+def reserve_stock(product_id, quantity, user):
+    """
+    Take `quantity` units and record who holds them; returns the reservation id.
+    Raises StockError (not found, unavailable, not enough stock) or ValueError
+    when the transaction still conflicts after STOCK_TX_ATTEMPTS tries.
+    """
+    product_ref = db.collection('products').document(product_id)
+    doc = product_ref.get(field_paths=['status', 'price', 'stock_shards'])
+    if not doc.exists:
+        raise StockError("Product not found", 404)
+    product = doc.to_dict() or {}
+    if product.get('status') != 'available':
+        raise StockError("Product is not available")
+    maybe_sweep_reservations()
+    reservations = db.collection('reservations')
+    if STOCK_MAX_HELD and aggregate_count(reservations.where('uid', '==', user.get('uid'))
+                                          .where('status', '==', 'held')) >= STOCK_MAX_HELD:
+        raise StockError(f"At most {STOCK_MAX_HELD} reservations can be held at once")
+    shards = int(product.get('stock_shards') or 0)
+    reservation_ref = reservations.document()
+    reservation = {
+        'product_id': product_id,
+        'uid': user.get('uid'),
+        'quantity': quantity,
+        'status': 'held',
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'expires_at': datetime.now(timezone.utc) + timedelta(seconds=STOCK_HOLD_SECONDS),
+    }
+    for _ in range(3):
+        try:
+            if not shards:
+                _reserve_unsharded(db.transaction(max_attempts=STOCK_TX_ATTEMPTS),
+                                   product_ref, quantity, reservation_ref, reservation)
+            else:
+                shard_refs = stock_shard_refs(product_ref, shards)
+                start = random.randrange(shards)
+                if not _reserve_from_shard(db.transaction(max_attempts=STOCK_TX_ATTEMPTS),
+                                           shard_refs[start], quantity, reservation_ref, reservation):
+                    _reserve_across_shards(db.transaction(max_attempts=STOCK_TX_ATTEMPTS),
+                                           shard_refs, quantity, reservation_ref, reservation)
+                schedule_stock_sync(product_id)
+            stock_cache.invalidate(product_id)
+            apply_rollup(stock_rollup_delta(product, -quantity))
+            return reservation_ref.id
+        except StockLayoutChanged:
+            doc = product_ref.get(field_paths=['stock_shards'])
+            if not doc.exists:
+                raise StockError("Product not found", 404)
+            shards = int((doc.to_dict() or {}).get('stock_shards') or 0)
+    raise ValueError("Stock layout kept changing")
+
+@firestore.transactional
+def _release_reservation(transaction, reservation_ref, product_id, user, is_admin, status='released'):
+    snapshot = reservation_ref.get(transaction=transaction)
+    reservation = snapshot.to_dict() or {}
+    if not snapshot.exists or reservation.get('product_id') != product_id:
+        raise StockError("Reservation not found", 404)
+    if not is_admin and reservation.get('uid') != user.get('uid'):
+        raise StockError("Forbidden", 403)
+    if reservation.get('status') == 'expired':
+        raise StockError("Reservation expired")
+    if reservation.get('status') != 'held':
+        raise StockError("Reservation already released")
+    product_ref = db.collection('products').document(product_id)
+    # read the layout in the transaction so a concurrent (un)sharding cannot strand the units
+    product = product_ref.get(transaction=transaction)
+    quantity = int(reservation.get('quantity') or 0)
+    if product.exists:
+        reservation['price'] = (product.to_dict() or {}).get('price')
+        shards = int((product.to_dict() or {}).get('stock_shards') or 0)
+        if shards:
+            target = stock_shard_refs(product_ref, shards)[random.randrange(shards)]
+        else:
+            target = product_ref
+        transaction.update(target, {'quantity': firestore.Increment(quantity)})
+    transaction.update(reservation_ref, {'status': status, 'released_at': firestore.SERVER_TIMESTAMP})
+    return reservation
+
+def _after_release(product_id, reservation):
+    if reservation.get('shards'):
+        schedule_stock_sync(product_id)
+    stock_cache.invalidate(product_id)
+    apply_rollup(stock_rollup_delta(reservation, reservation.get('quantity') or 0))
+
+def release_stock(product_id, reservation_id, user, is_admin):
+    """Return a held reservation's units to stock; returns the reservation."""
+    reservation_ref = db.collection('reservations').document(reservation_id)
+    reservation = _release_reservation(db.transaction(max_attempts=STOCK_TX_ATTEMPTS),
+                                       reservation_ref, product_id, user, is_admin)
+    _after_release(product_id, reservation)
+    return reservation
+
+def maybe_sweep_reservations():
+    """Start a sweep of expired reservations in the background, at most every STOCK_SWEEP_SECONDS per worker."""
+    if STOCK_SWEEP_SECONDS <= 0 or time.monotonic() < _stock_sweep_due[0]:
+        return
+    _stock_sweep_due[0] = time.monotonic() + STOCK_SWEEP_SECONDS
+    stock_executor.submit(sweep_expired_reservations)
+
+def sweep_expired_reservations():
+    """Release up to STOCK_SWEEP_BATCH held reservations past expires_at; returns how many."""
+    released = 0
+    try:
+        query = db.collection('reservations').where('status', '==', 'held') \
+            .where('expires_at', '<=', datetime.now(timezone.utc)).limit(STOCK_SWEEP_BATCH)
+        for doc in query.stream():
+            product_id = (doc.to_dict() or {}).get('product_id')
+            try:
+                reservation = _release_reservation(db.transaction(max_attempts=STOCK_TX_ATTEMPTS),
+                                                   doc.reference, product_id, None, True, 'expired')
+            except StockError:
+                continue   # released meanwhile
+            _after_release(product_id, reservation)
+            released += 1
+    except Exception:
+        logger.exception("Failed to sweep expired reservations")
+    if released:
+        logger.info("released %s expired reservations", released)
+    return released
+
+@firestore.transactional
+def _set_stock_shards(transaction, product_ref, shards):
+    snapshot = product_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise StockError("Product not found", 404)
+    current = int((snapshot.to_dict() or {}).get('stock_shards') or 0)
+    old_refs = stock_shard_refs(product_ref, current)
+    if current:
+        total = sum(snapshot_quantity(s) for s in db.get_all(old_refs, transaction=transaction))
+    else:
+        total = snapshot_quantity(snapshot)
+    new_refs = stock_shard_refs(product_ref, shards)
+    for ref, quantity in zip(new_refs, split_stock(total, shards) if shards else []):
+        transaction.set(ref, {'quantity': quantity})
+    for ref in old_refs[shards:]:
+        transaction.delete(ref)
+    transaction.update(product_ref, {'stock_shards': shards, 'quantity': total})
+    return total
+
+def set_stock_shards(product_id, shards):
+    """Move a product's stock into `shards` counters (0: back into the product); returns the total."""
+    total = _set_stock_shards(db.transaction(max_attempts=STOCK_TX_ATTEMPTS),
+                              db.collection('products').document(product_id), shards)
+    stock_cache.set(product_id, (total, shards))
+    return total
+
+def stock_level(product_id):
+    """(quantity, shards) for a product, summing its shards when sharded; cached briefly."""
+    maybe_sweep_reservations()
+    found, cached = stock_cache.get(product_id)
+    if found:
+        return cached
+    product_ref = db.collection('products').document(product_id)
+    doc = product_ref.get(field_paths=['quantity', 'stock_shards'])
+    if not doc.exists:
+        raise StockError("Product not found", 404)
+    shards = int((doc.to_dict() or {}).get('stock_shards') or 0)
+    if shards:
+        quantity = sum(snapshot_quantity(s) for s in db.get_all(stock_shard_refs(product_ref, shards)))
+    else:
+        quantity = snapshot_quantity(doc)
+    stock_cache.set(product_id, (quantity, shards))
+    return quantity, shards
+
+def schedule_stock_sync(product_id):
+    """Write the shard total back into the product's quantity after STOCK_SYNC_DELAY (coalesced)."""
+    with _stock_sync_lock:
+        if product_id in _stock_sync_pending:
+            return
+        _stock_sync_pending.add(product_id)
+    timer = threading.Timer(STOCK_SYNC_DELAY, stock_executor.submit, args=(sync_stock_quantity, product_id))
+    timer.daemon = True
+    timer.start()
+
+def sync_stock_quantity(product_id):
+    with _stock_sync_lock:
+        _stock_sync_pending.discard(product_id)
+    try:
+        product_ref = db.collection('products').document(product_id)
+        doc = product_ref.get(field_paths=['quantity', 'stock_shards'])
+        shards = int((doc.to_dict() or {}).get('stock_shards') or 0) if doc.exists else 0
+        if not shards:
+            return
+        quantity = sum(snapshot_quantity(s) for s in db.get_all(stock_shard_refs(product_ref, shards)))
+        stock_cache.set(product_id, (quantity, shards))
+        # skipped if the product changed meanwhile (e.g. resharded); the next reservation syncs again
+        product_ref.update({'quantity': quantity}, option=db.write_option(last_update_time=doc.update_time))
+    except (FailedPrecondition, NotFound):
+        pass
+    except Exception:
+        logger.exception("Failed to sync stock of %s", product_id)
+
+def delete_stock_shards(product_id, shards):
+    try:
+        batch = db.batch()
+        for ref in stock_shard_refs(db.collection('products').document(product_id), shards):
+            batch.delete(ref)
+        batch.commit()
+    except Exception:
+        logger.exception("Failed to delete stock shards of %s", product_id)
+
+def sharded_quantity_error(product, update_data):
+    """PUT may not overwrite the quantity of a sharded product; returns an error response or None."""
+    if 'quantity' in update_data and product.get('stock_shards'):
+        return jsonify({"msg":"Stock is sharded; use the reserve/release endpoints"}), 409
+    return None
+
+# ---------------- Background jobs ----------------
+# Bulk maintenance on products runs outside the request: the endpoint stores a
+# jobs/{id} document and returns its id, a worker thread pages through the
+# target query in document-id order, commits batched writes with bounded
+# concurrency and checkpoints the last processed id after every page. An
+# interrupted job (its worker died) is resumed from that checkpoint. Jobs
+# that are not a pass over products (JOB_TASKS, e.g. the analytics rebuild)
+# run one function, heartbeat while it runs and store what it returns.
+JOB_PAGE_SIZE = int(os.getenv("JOB_PAGE_SIZE", "2000"))
+JOB_BATCH_SIZE = min(int(os.getenv("JOB_BATCH_SIZE", "500")), 500)   # Firestore batch limit
+JOB_WRITE_CONCURRENCY = int(os.getenv("JOB_WRITE_CONCURRENCY", "4"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_MAX_ERRORS = 20
+JOB_HEARTBEAT_SECONDS = 10
+job_executor = ThreadPoolExecutor(max_workers=int(os.getenv("JOB_WORKERS", "2")), thread_name_prefix="job")
+job_write_executor = ThreadPoolExecutor(max_workers=JOB_WRITE_CONCURRENCY, thread_name_prefix="job-write")
+
+# action name -> fn(params) returning (query, apply); apply(batch, doc) stages
+# the write for one document and may return an analytics rollup delta
+BULK_ACTIONS = {}
+
+def bulk_action(name):
+    def register(fn):
+        BULK_ACTIONS[name] = fn
+        return fn
+    return register
+
+@bulk_action('cleanup_ownerless_products')
+def _cleanup_ownerless_products(params):
+    """Delete products that have no creator_uid."""
+    def apply(batch, doc):
+        batch.delete(doc.reference)
+        return product_rollup_delta(doc.to_dict() or {}, -1)
+    return db.collection('products').where('creator_uid', '==', None), apply
+
+@bulk_action('mark_out_of_stock_unavailable')
+def _mark_out_of_stock_unavailable(params):
+    """Set status 'unavailable' on available products whose quantity is 0."""
+    def apply(batch, doc):
+        product = doc.to_dict() or {}
+        batch.update(doc.reference, {'status': 'unavailable'})
+        return merge_rollup_deltas([product_rollup_delta(product, -1),
+                                    product_rollup_delta({**product, 'status': 'unavailable'})])
+    query = db.collection('products').where('status', '==', 'available').where('quantity', '==', 0)
+    return query, apply
+
+# action name -> fn(params, heartbeat) returning the job result; heartbeat()
+# must be called regularly (it writes at most every JOB_HEARTBEAT_SECONDS)
+JOB_TASKS = {}
+
+def job_task(name):
+    def register(fn):
+        JOB_TASKS[name] = fn
+        return fn
+    return register
+
+@job_task('rebuild_analytics')
+def _rebuild_analytics(params, heartbeat):
+    """Recount the analytics rollup; started through start_rollup_rebuild()."""
+    if params.get('bootstrap'):
+        time.sleep(ROLLUP_STATE_TTL)
+    rollup = rebuild_rollups(heartbeat=heartbeat)
+    return {'total_products': rollup['total']}
+
+def jobs_ref():
+    return db.collection('jobs')
+
+def start_job(action, params, user, ref=None):
+    ref = ref or jobs_ref().document()
+    ref.set({
+        'action': action,
+        'params': params,
+        'status': 'queued',
+        'created_by': user.get('uid') if user else None,
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'heartbeat_at': firestore.SERVER_TIMESTAMP,
+        'processed': 0,
+        'failed': 0,
+        'elapsed': 0.0,
+        'checkpoint': None,
+        'errors': [],
+    })
+    job_executor.submit(run_job, ref.id)
+    return ref.id
+
+def _commit_batch(docs, apply):
+    batch = db.batch()
+    deltas = []
+    for doc in docs:
+        delta = apply(batch, doc)
+        if delta:
+            deltas.append(delta)
+    batch.commit()
+    return deltas
+
+def run_job(job_id):
+    ref = jobs_ref().document(job_id)
+    try:
+        snapshot = ref.get()
+        if not snapshot.exists:
+            logger.warning("job %s not found", job_id)
+            return
+        job = snapshot.to_dict() or {}
+        if job.get('action') in JOB_TASKS:
+            return run_task_job(ref, job)
+        query, apply = BULK_ACTIONS[job['action']](job.get('params') or {})
+    except Exception as e:
+        logger.exception("job %s could not start", job_id)
+        ref.update({'status': 'failed', 'errors': [str(e)], 'finished_at': firestore.SERVER_TIMESTAMP})
+        return
+    processed = job.get('processed', 0)
+    failed = job.get('failed', 0)
+    elapsed = job.get('elapsed', 0.0)
+    errors = list(job.get('errors') or [])
+    checkpoint = job.get('checkpoint')
+    ref.update({'status': 'running', 'pid': os.getpid(), 'heartbeat_at': firestore.SERVER_TIMESTAMP})
+    logger.info("job %s (%s) running from checkpoint %s", job_id, job['action'], checkpoint)
+    try:
+        while True:
+            started = time.monotonic()
+            page = query.order_by('__name__').limit(JOB_PAGE_SIZE)
+            if checkpoint:
+                page = page.start_after({'__name__': checkpoint})
+            docs = list(page.stream())
+            if not docs:
+                break
+            chunks = [docs[i:i + JOB_BATCH_SIZE] for i in range(0, len(docs), JOB_BATCH_SIZE)]
+            futures = {job_write_executor.submit(_commit_batch, chunk, apply): chunk for chunk in chunks}
+            wait(futures)
+            deltas = []
+            for future, chunk in futures.items():
+                try:
+                    deltas.extend(future.result())
+                    processed += len(chunk)
+                except Exception as e:
+                    failed += len(chunk)
+                    if len(errors) < JOB_MAX_ERRORS:
+                        errors.append(f"{chunk[0].id}..{chunk[-1].id}: {e}")
+            apply_rollup(*deltas)
+            checkpoint = docs[-1].id
+            elapsed += time.monotonic() - started
+            ref.update({
+                'processed': processed,
+                'failed': failed,
+                'elapsed': elapsed,
+                'errors': errors,
+                'checkpoint': checkpoint,
+                'heartbeat_at': firestore.SERVER_TIMESTAMP,
+            })
+        ref.update({'status': 'done', 'finished_at': firestore.SERVER_TIMESTAMP})
+        logger.info("job %s done: %s processed, %s failed", job_id, processed, failed)
+    except Exception as e:
+        logger.exception("job %s failed", job_id)
+        errors.append(str(e))
+        ref.update({'status': 'failed', 'errors': errors[-JOB_MAX_ERRORS:], 'finished_at': firestore.SERVER_TIMESTAMP})
+
+def run_task_job(ref, job):
+    started = time.monotonic()
+    last_beat = [started]
+
+    def heartbeat():
+        if time.monotonic() - last_beat[0] >= JOB_HEARTBEAT_SECONDS:
+            last_beat[0] = time.monotonic()
+            ref.update({'elapsed': last_beat[0] - started, 'heartbeat_at': firestore.SERVER_TIMESTAMP})
+
+    ref.update({'status': 'running', 'pid': os.getpid(), 'heartbeat_at': firestore.SERVER_TIMESTAMP})
+    logger.info("job %s (%s) running", ref.id, job['action'])
+    try:
+        result = JOB_TASKS[job['action']](job.get('params') or {}, heartbeat)
+        ref.update({'status': 'done', 'result': result, 'elapsed': time.monotonic() - started,
+                    'finished_at': firestore.SERVER_TIMESTAMP})
+        logger.info("job %s done", ref.id)
+    except Exception as e:
+        logger.exception("job %s failed", ref.id)
+        ref.update({'status': 'failed', 'errors': [str(e)], 'elapsed': time.monotonic() - started,
+                    'finished_at': firestore.SERVER_TIMESTAMP})
+
+def job_is_stale(job):
+    heartbeat = job.get('heartbeat_at')
+    if job.get('status') not in ('queued', 'running') or not isinstance(heartbeat, datetime):
+        return False
+    return (datetime.now(timezone.utc) - heartbeat).total_seconds() > JOB_STALE_SECONDS
+
+def job_to_json(job_id, job):
+    out = dict(job)
+    out['id'] = job_id
+    elapsed = job.get('elapsed') or 0.0
+    out['throughput'] = round(job.get('processed', 0) / elapsed, 2) if elapsed else 0.0
+    out['stale'] = job_is_stale(job)
+    return out
+
 # ---------------- Auth middleware ----------------
-@app.before_request
+@api.before_app_request
 def verify_token():
     # allow CORS preflight
     if request.method == 'OPTIONS':
@@ -165,6 +1807,10 @@ def verify_token():
     if request.path == '/api/products' and request.method == 'GET':
         return
 
+    # the change stream is public too, but applies the caller's visibility when a token is sent
+    if request.path == '/api/products/changes' and request.method == 'GET' and not request.headers.get('Authorization'):
+        return
+
     # require token for other /api endpoints
     if request.path.startswith('/api'):
         auth_header = request.headers.get('Authorization')
@@ -173,22 +1819,22 @@ def verify_token():
             return jsonify({"msg": "Missing or invalid authorization token"}), 401
         try:
             id_token = auth_header.split('Bearer ')[1]
-            decoded = firebase_auth.verify_id_token(id_token)
+            decoded = verify_id_token_cached(id_token)
             request.user = decoded
         except Exception as e:
             logger.warning("Token verify failed: %s", e)
             return jsonify({"msg": f"Invalid token: {e}"}), 401
 
 # ---------------- Routes: Static ----------------
-@app.route("/")
+@api.route("/")
 def index():
     try:
-        return app.send_static_file('index.html')
+        return current_app.send_static_file('index.html')
     except Exception:
         return jsonify({"msg": "API ready"}), 200
 
 # ---------------- Products endpoints ----------------
-@app.route("/api/products", methods=['GET', 'POST'])
+@api.route("/api/products", methods=['GET', 'POST'])
 def handle_products():
     products_ref = db.collection('products')
 
@@ -200,37 +1846,19 @@ def handle_products():
                 return jsonify({"msg":"Unauthorized"}), 401
 
             data = request.get_json() or {}
-            name = data.get('name')
-            if not name:
-                return jsonify({"msg":"Product name required"}), 400
-
             try:
-                quantity = int(data.get('quantity', 0))
-            except Exception:
-                quantity = 0
-            try:
-                price = float(data.get('price', 0.0))
-            except Exception:
-                price = 0.0
-
-            doc_data = {
-                'name': name,
-                'price': price,
-                'quantity': quantity,
-                'image_url': data.get('image_url', ''),
-                'description': data.get('description', ''),
-                'creator_uid': user.get('uid'),
-                'added_by': user.get('email'),
-                'status': 'available',    # available immediately
-                'created_at': firestore.SERVER_TIMESTAMP
-            }
+                doc_data = build_product_doc(data, user)
+            except ValueError as e:
+                return jsonify({"msg": str(e)}), 400
 
-            added = products_ref.add(doc_data)
-            ref = added[1] if isinstance(added, (list,tuple)) else added
-            new_product = ref.get().to_dict() or {}
-            new_product['id'] = ref.id
+            update_time, ref = products_ref.add(doc_data)
+            apply_rollup(product_rollup_delta(doc_data))
+            # SERVER_TIMESTAMP resolves to the commit time, so echo the payload instead of re-reading it
+            new_product = doc_to_json({**doc_data, 'created_at': update_time}, ref.id)
 
-            return jsonify({"msg":"Product created","product": new_product}), 201
+            response = jsonify({"msg":"Product created","product": new_product})
+            response.set_etag(version_tag(update_time))
+            return response, 201
 
         except Exception as e:
             tb = traceback.format_exc()
@@ -238,38 +1866,35 @@ def handle_products():
             return jsonify({"msg":"Failed to create product","error": str(e)}), 500
 
     # GET: public & authenticated behavior
+    try:
+        limit, cursor = parse_page_args()
+        fields = parse_fields(SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
     try:
         user = get_request_user()
         if not user:
-            # unauthenticated: return only available products
-            docs = products_ref.where('status', '==', 'available').order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-        else:
-            if has_role(user, 'admin'):
-                docs = products_ref.order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-            else:
-                # normal user: return only their own products
-                docs = products_ref.where('creator_uid', '==', user.get('uid')).order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-
-        products = []
-        for doc in docs:
-            p = doc.to_dict()
-            p['id'] = doc.id
-            if 'created_at' in p and p['created_at']:
-                try:
-                    p['created_at'] = p['created_at'].timestamp()
-                except Exception:
-                    pass
-            products.append(p)
-        return jsonify(products), 200
+            cached = public_catalog_response(limit, cursor, fields)
+            if cached is not None:
+                return cached
+        query = product_list_query(db, user, user is not None and has_role(user, 'admin'))
+        docs, next_cursor = fetch_page(select_fields(query, fields), limit, cursor)
+        return stream_json_list(docs, next_cursor, fields=fields)
     except Exception as e:
         tb = traceback.format_exc()
         logger.error("Failed to fetch products: %s\n%s", e, tb)
         return jsonify({"msg":"Failed to fetch products","error":str(e)}), 500
 
-@app.route("/api/products/<string:product_id>", methods=['GET', 'PUT', 'DELETE'])
+@api.route("/api/products/<string:product_id>", methods=['GET', 'PUT', 'DELETE'])
 def product_detail(product_id):
+    fields = None
+    if request.method == 'GET':
+        try:
+            fields = parse_fields()
+        except ValueError as e:
+            return jsonify({"msg": str(e)}), 400
     ref = db.collection('products').document(product_id)
-    doc = ref.get()
+    doc = ref.get(field_paths=field_paths(fields))
     if not doc.exists:
         return jsonify({"msg":"Product not found"}), 404
     product = doc.to_dict()
@@ -277,11 +1902,9 @@ def product_detail(product_id):
 
     # GET
     if request.method == 'GET':
-        product['id'] = doc.id
-        if 'created_at' in product and product['created_at']:
-            try: product['created_at'] = product['created_at'].timestamp()
-            except Exception: pass
-        return jsonify(product), 200
+        response = jsonify(doc_to_json(product, doc.id, fields=fields))
+        response.set_etag(version_tag(doc.update_time))
+        return response, 200
 
     # subsequent methods require owner or admin
     if not user:
@@ -291,100 +1914,303 @@ def product_detail(product_id):
     if not (is_owner or has_role(user, 'admin')):
         return jsonify({"msg":"Forbidden"}), 403
 
+    option, error = check_if_match(doc)
+    if error:
+        return error
+
     if request.method == 'PUT':
-        update_data = request.get_json() or {}
-        if 'quantity' in update_data:
-            try:
-                update_data['quantity'] = int(update_data['quantity'])
-            except:
-                update_data['quantity'] = 0
-        ref.update(update_data)
-        updated = ref.get().to_dict()
-        updated['id'] = ref.id
-        return jsonify(updated), 200
+        update_data = coerce_product_update(request.get_json() or {})
+        if not update_data:
+            return jsonify({"msg":"No updates provided"}), 400
+        error = sharded_quantity_error(product, update_data)
+        if error:
+            return error
+        try:
+            product, result = guarded_product_write(
+                ref, doc, option, lambda current, write_option: ref.update(update_data, option=write_option))
+        except FailedPrecondition:
+            return jsonify({"msg":"Product was modified"}), 412
+        except NotFound:
+            return jsonify({"msg":"Product not found"}), 404
+        except ProductWriteConflict:
+            return jsonify({"msg":"Product was modified, retry"}), 409
+        updated = {**product, **update_data}
+        apply_rollup(product_rollup_delta(product, -1), product_rollup_delta(updated))
+        response = jsonify(doc_to_json(updated, ref.id))
+        response.set_etag(version_tag(result.update_time))
+        return response, 200
 
     if request.method == 'DELETE':
-        ref.delete()
+        try:
+            product, _ = guarded_product_write(
+                ref, doc, option, lambda current, write_option: ref.delete(option=write_option))
+        except FailedPrecondition:
+            return jsonify({"msg":"Product was modified"}), 412
+        except NotFound:
+            return jsonify({"msg":"Product not found"}), 404
+        except ProductWriteConflict:
+            return jsonify({"msg":"Product was modified, retry"}), 409
+        apply_rollup(product_rollup_delta(product, -1))
+        if product.get('stock_shards'):
+            stock_executor.submit(delete_stock_shards, product_id, int(product['stock_shards']))
         return '', 204
 
+# Several products in one request and one get_all round trip (product pages,
+# carts, widgets). Each product follows the same rule as the listings and
+# search: available products for everyone, the rest for their owner and
+# admins. Products the caller may not see are reported as missing, exactly
+# like ids that do not exist.
+BATCH_GET_MAX = int(os.getenv("BATCH_GET_MAX", "100"))
+
+def parse_batch_ids():
+    """Requested ids from ?ids=a,b (repeatable) or a JSON body {"ids": [...]}; raises ValueError."""
+    if request.method == 'POST':
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            raise ValueError("ids must be a list of strings")
+    else:
+        ids = [i for value in request.args.getlist('ids') for i in value.split(',')]
+    ids = list(dict.fromkeys(i.strip() for i in ids if i.strip()))
+    if not ids:
+        raise ValueError("ids required")
+    if len(ids) > BATCH_GET_MAX:
+        raise ValueError(f"At most {BATCH_GET_MAX} ids per request")
+    return ids
+
+@api.route("/api/products:batchGet", methods=['GET', 'POST'])
+def batch_get_products():
+    user = get_request_user()
+    try:
+        ids = parse_batch_ids()
+        fields = parse_fields()
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    # ids that cannot name a document are simply missing
+    valid = [i for i in ids if '/' not in i and i not in ('.', '..') and len(i.encode()) <= 1500]
+    paths = field_paths(fields)
+    if paths is not None:
+        # needed for the visibility check even when not requested
+        paths = list(dict.fromkeys(paths + ['status', 'creator_uid']))
+    try:
+        products_ref = db.collection('products')
+        docs = db.get_all([products_ref.document(i) for i in valid], field_paths=paths) if valid else []
+        found = {doc.id: doc.to_dict() or {} for doc in docs if doc.exists}
+    except Exception as e:
+        logger.exception("Failed to batch get products")
+        return jsonify({"msg":"Failed to fetch products","error":str(e)}), 500
+
+    uid = user.get('uid') if user else None
+    is_admin = None   # looked up only if a product needs it
+    products, missing = [], []
+    for product_id in ids:
+        product = found.get(product_id)
+        if product is not None and product.get('status') != 'available' and not (uid and product.get('creator_uid') == uid):
+            if is_admin is None:
+                is_admin = has_role(user, 'admin')
+            if not is_admin:
+                product = None
+        if product is None:
+            missing.append(product_id)
+        else:
+            products.append(doc_to_json(product, product_id, fields=fields))
+    return jsonify({"products": products, "missing": missing}), 200
+
+def set_product_status(product_id, status, fields, msg):
+    """
+    One merged update guarded by the update_time we read, so the analytics
+    delta is computed from exactly the version being replaced.
+    """
+    ref = db.collection('products').document(product_id)
+    rollup_fields = ['status', 'creator_uid', 'price', 'quantity', 'created_at']
+    doc = ref.get(field_paths=rollup_fields)
+    if not doc.exists:
+        return jsonify({"msg":"Product not found"}), 404
+    option, error = check_if_match(doc)
+    if error:
+        return error
+    try:
+        product, _ = guarded_product_write(
+            ref, doc, option, lambda current, write_option: ref.update({'status': status, **fields}, option=write_option),
+            field_paths=rollup_fields)
+    except NotFound:
+        return jsonify({"msg":"Product not found"}), 404
+    except FailedPrecondition:
+        return jsonify({"msg":"Product was modified"}), 412
+    except ProductWriteConflict:
+        return jsonify({"msg":"Product was modified, retry"}), 409
+    apply_rollup(product_rollup_delta(product, -1), product_rollup_delta({**product, 'status': status}))
+    return jsonify({"msg": msg}), 200
+
 # Approve / Reject remain for admin if you still want them (not used if auto-available)
-@app.route("/api/products/<string:product_id>/approve", methods=['POST'])
+@api.route("/api/products/<string:product_id>/approve", methods=['POST'])
 def approve_product(product_id):
     user = get_request_user()
     if not user or not has_role(user, 'admin'):
         return jsonify({"msg":"Forbidden"}), 403
-    ref = db.collection('products').document(product_id)
-    if not ref.get().exists:
-        return jsonify({"msg":"Product not found"}), 404
-    ref.update({
-        'status': 'available',
+    return set_product_status(product_id, 'available', {
         'approved_by': user.get('uid'),
         'approved_at': firestore.SERVER_TIMESTAMP
-    })
-    return jsonify({"msg":"Product approved"}), 200
+    }, "Product approved")
 
-@app.route("/api/products/<string:product_id>/reject", methods=['POST'])
+@api.route("/api/products/<string:product_id>/reject", methods=['POST'])
 def reject_product(product_id):
     user = get_request_user()
     if not user or not has_role(user, 'admin'):
         return jsonify({"msg":"Forbidden"}), 403
     data = request.get_json() or {}
-    reason = data.get('reason')
-    ref = db.collection('products').document(product_id)
-    if not ref.get().exists:
-        return jsonify({"msg":"Product not found"}), 404
-    ref.update({
-        'status': 'rejected',
+    fields = {
         'rejected_by': user.get('uid'),
         'rejected_at': firestore.SERVER_TIMESTAMP
-    })
-    # optionally store rejection reason in document
-    if reason:
-        ref.update({'rejection_reason': reason})
-    return jsonify({"msg":"Product rejected"}), 200
+    }
+    # optionally store rejection reason in document (same write)
+    if data.get('reason'):
+        fields['rejection_reason'] = data['reason']
+    return set_product_status(product_id, 'rejected', fields, "Product rejected")
+
+# Stock reservations
+def parse_reserve_quantity(data):
+    try:
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid quantity")
+    if not 1 <= quantity <= STOCK_MAX_RESERVE:
+        raise ValueError(f"quantity must be between 1 and {STOCK_MAX_RESERVE}")
+    return quantity
+
+def stock_contention_response():
+    response = jsonify({"msg":"Too many concurrent updates, retry"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@api.route("/api/products/<string:product_id>/stock", methods=['GET'])
+def product_stock(product_id):
+    try:
+        quantity, shards = stock_level(product_id)
+    except StockError as e:
+        return jsonify({"msg": str(e)}), e.status
+    return jsonify({"id": product_id, "quantity": quantity, "shards": shards}), 200
+
+@api.route("/api/products/<string:product_id>/reserve", methods=['POST'])
+def reserve_product(product_id):
+    user = get_request_user()
+    if not user:
+        return jsonify({"msg":"Unauthorized"}), 401
+    try:
+        quantity = parse_reserve_quantity(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    try:
+        reservation_id = reserve_stock(product_id, quantity, user)
+    except StockError as e:
+        return jsonify({"msg": str(e)}), e.status
+    except ValueError:
+        logger.warning("stock reservation for %s kept conflicting", product_id)
+        return stock_contention_response()
+    except Exception as e:
+        logger.exception("reserve failed")
+        return jsonify({"msg":"Failed to reserve stock","error":str(e)}), 500
+    return jsonify({"reservation_id": reservation_id, "product_id": product_id, "quantity": quantity,
+                    "expires_in": STOCK_HOLD_SECONDS}), 201
+
+@api.route("/api/products/<string:product_id>/release", methods=['POST'])
+def release_product(product_id):
+    user = get_request_user()
+    if not user:
+        return jsonify({"msg":"Unauthorized"}), 401
+    reservation_id = (request.get_json(silent=True) or {}).get('reservation_id')
+    if not reservation_id or not isinstance(reservation_id, str):
+        return jsonify({"msg":"reservation_id required"}), 400
+    try:
+        reservation = release_stock(product_id, reservation_id, user, has_role(user, 'admin'))
+    except StockError as e:
+        return jsonify({"msg": str(e)}), e.status
+    except ValueError:
+        return stock_contention_response()
+    except Exception as e:
+        logger.exception("release failed")
+        return jsonify({"msg":"Failed to release stock","error":str(e)}), 500
+    return jsonify({"msg":"Stock released", "reservation_id": reservation_id,
+                    "product_id": product_id, "quantity": reservation.get('quantity')}), 200
+
+@api.route("/api/products/<string:product_id>/stock/shards", methods=['PUT'])
+def product_stock_shards(product_id):
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    try:
+        shards = int((request.get_json(silent=True) or {}).get('shards'))
+    except (TypeError, ValueError):
+        return jsonify({"msg":"Invalid shards"}), 400
+    if not 0 <= shards <= STOCK_MAX_SHARDS:
+        return jsonify({"msg": f"shards must be between 0 and {STOCK_MAX_SHARDS}"}), 400
+    try:
+        quantity = set_stock_shards(product_id, shards)
+    except StockError as e:
+        return jsonify({"msg": str(e)}), e.status
+    except ValueError:
+        return stock_contention_response()
+    except Exception as e:
+        logger.exception("resharding failed")
+        return jsonify({"msg":"Failed to change stock shards","error":str(e)}), 500
+    return jsonify({"id": product_id, "quantity": quantity, "shards": shards}), 200
 
 # My products (for dashboard)
-@app.route("/api/my/products", methods=['GET'])
+@api.route("/api/my/products", methods=['GET'])
 def my_products():
     user = get_request_user()
     if not user:
         return jsonify({"msg":"Unauthorized"}), 401
     try:
-        uid = user.get('uid')
-        docs = db.collection('products').where('creator_uid', '==', uid).order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-        products = []
-        for doc in docs:
-            p = doc.to_dict()
-            p['id'] = doc.id
-            if 'created_at' in p and p['created_at']:
-                try: p['created_at'] = p['created_at'].timestamp()
-                except: pass
-            products.append(p)
-        return jsonify(products), 200
+        limit, cursor = parse_page_args()
+        fields = parse_fields(SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    try:
+        query = product_list_query(db, user)
+        docs, next_cursor = fetch_page(select_fields(query, fields), limit, cursor)
+        return stream_json_list(docs, next_cursor, fields=fields)
     except Exception as e:
         logger.exception("Failed to fetch my products")
         return jsonify({"msg":"Failed to fetch products","error":str(e)}), 500
 
 # Public products endpoint
-@app.route("/api/public/products", methods=['GET'])
+@api.route("/api/public/products", methods=['GET'])
 def public_products():
     try:
-        docs = db.collection('products').where('status', '==', 'available').order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-        products = []
-        for doc in docs:
-            p = doc.to_dict()
-            p['id'] = doc.id
-            if 'created_at' in p and p['created_at']:
-                try: p['created_at'] = p['created_at'].timestamp()
-                except: pass
-            products.append(p)
-        return jsonify(products), 200
+        limit, cursor = parse_page_args()
+        fields = parse_fields(SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    try:
+        cached = public_catalog_response(limit, cursor, fields)
+        if cached is not None:
+            return cached
+        docs, next_cursor = fetch_page(select_fields(product_list_query(db), fields), limit, cursor)
+        return stream_json_list(docs, next_cursor, fields=fields)
     except Exception as e:
         logger.exception("Failed to fetch public products")
         return jsonify({"msg":"Failed to fetch public products","error":str(e)}), 500
 
+# Product search (?q=, same pagination and visibility as the listings)
+@api.route("/api/public/products/search", methods=['GET'])
+def public_search_products():
+    try:
+        return search_response()
+    except Exception as e:
+        logger.exception("Product search failed")
+        return jsonify({"msg":"Search failed","error":str(e)}), 500
+
+@api.route("/api/products/search", methods=['GET'])
+def search_products():
+    user = get_request_user()
+    try:
+        return search_response(user, has_role(user, 'admin'))
+    except Exception as e:
+        logger.exception("Product search failed")
+        return jsonify({"msg":"Search failed","error":str(e)}), 500
+
 # Test route for CORS diagnostics (temporary)
-@app.route("/api/_test_cors", methods=['GET', 'OPTIONS'])
+@api.route("/api/_test_cors", methods=['GET', 'OPTIONS'])
 def test_cors():
     """
     Simple route to check CORS headers and origin detection in browser.
@@ -395,41 +2221,272 @@ def test_cors():
         "origin_received": request.headers.get('Origin')
     }), 200
 
-# Analytics (placeholder)
-@app.route("/api/analytics", methods=['GET'])
+# Analytics (served from the analytics/products rollup)
+@api.route("/api/analytics", methods=['GET'])
 def get_analytics():
     try:
-        total_products = len(list(db.collection('products').stream()))
+        state = rollup_ref().get()
+        state = (state.to_dict() or {}) if state.exists else {}
+        built = isinstance(state.get('rebuilt_at'), datetime)
+        if rollup_needs_rebuild(state):
+            maybe_reconcile_rollups(bootstrap=not built)
+        rollup = read_rollup() if built else None
+        if rollup is None:
+            # rollup not built yet: count with aggregation queries instead of reading documents
+            products_ref = db.collection('products')
+            rollup = {
+                'total': aggregate_count(products_ref),
+                'by_status': {s: aggregate_count(products_ref.where('status', '==', s)) for s in PRODUCT_STATUSES},
+            }
+        created_by_month = rollup.get('created_by_month', {})
         return jsonify({
-            "total_products": total_products,
+            "total_products": int(rollup.get('total', 0)),
             "site_visits": 0,
-            "sales_data": {
-                "labels": ["يناير","فبراير","مارس","أبريل","مايو","يونيو"],
-                "values": [0,0,0,0,0,0]
-            }
+            "by_status": {k: int(v) for k, v in rollup.get('by_status', {}).items() if v},
+            "by_creator": {k: int(v) for k, v in rollup.get('by_creator', {}).items() if v},
+            "inventory_value": round(float(rollup.get('inventory_value', 0.0)), 2),
+            "created_by_month": {k: int(v) for k, v in sorted(created_by_month.items()) if v},
+            # there is no sales data yet; the dashboard chart shows products added per month
+            "sales_data": monthly_series(created_by_month)
         }), 200
     except Exception as e:
         logger.exception("analytics error")
         return jsonify({"msg":"Failed to get analytics","error":str(e)}), 500
 
+@api.route("/api/admin/analytics/rebuild", methods=['POST'])
+def admin_rebuild_analytics():
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    try:
+        job_id = start_rollup_rebuild(user)
+        return jsonify({"msg":"Analytics rebuild started","job_id": job_id}), 202
+    except RuntimeError as e:
+        return jsonify({"msg": str(e)}), 503
+    except Exception as e:
+        logger.exception("analytics rebuild failed")
+        return jsonify({"msg":"Failed to rebuild analytics","error":str(e)}), 500
+
 # AI description (optional)
-@app.route("/api/generate-description", methods=['POST'])
+# Generation runs in a bounded worker pool, never on the request thread.
+# Identical product names (after normalization) share one upstream call. The
+# job id is a cache key that includes AI_PROMPT_VERSION (changing the prompt
+# starts a fresh cache), and ai_descriptions/{key} in Firestore is the job
+# record every worker can poll: "pending" when submitted, then "done" with
+# the description (also cached in memory) or "failed" with the error for
+# AI_FAILURE_TTL. A pending job older than AI_PENDING_TIMEOUT (its worker
+# died) is reported as failed; a job id that was never submitted is a 404.
+AI_PROMPT_VERSION = "v1"
+AI_PROMPT = """Create a compelling Arabic marketing description for the product named "{product_name}". 2-3 paragraphs, call to action at the end."""
+AI_WORKERS = int(os.getenv("AI_WORKERS", "4"))
+AI_MAX_PENDING = int(os.getenv("AI_MAX_PENDING", "32"))
+AI_LONG_POLL_SECONDS = float(os.getenv("AI_LONG_POLL_SECONDS", "25"))
+AI_REMOTE_POLL_SECONDS = float(os.getenv("AI_REMOTE_POLL_SECONDS", "2"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(30 * 24 * 3600)))
+AI_FAILURE_TTL = float(os.getenv("AI_FAILURE_TTL", "600"))
+AI_PENDING_TIMEOUT = float(os.getenv("AI_PENDING_TIMEOUT", "300"))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+AI_CACHE_TRIM_EVERY = 50   # stored results between size checks
+ai_executor = ThreadPoolExecutor(max_workers=AI_WORKERS, thread_name_prefix="ai")
+ai_memory_cache = TTLCache(512, AI_CACHE_TTL)   # key -> "done" record
+_ai_inflight = {}   # cache key -> Future
+_ai_lock = threading.Lock()
+_ai_stored = {"count": 0}
+
+def normalize_product_name(name):
+    return ' '.join(str(name).split()).casefold()
+
+def ai_cache_key(product_name):
+    raw = f"{AI_PROMPT_VERSION}:{normalize_product_name(product_name)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def ai_record_get(key):
+    """The job record for key, or None when it was never submitted or has expired."""
+    found, record = ai_memory_cache.get(key)
+    if not found:
+        try:
+            doc = db.collection('ai_descriptions').document(key).get()
+        except Exception:
+            logger.exception("AI cache read failed")
+            return None
+        if not doc.exists:
+            return None
+        record = doc.to_dict() or {}
+    expires_at = record.get('expires_at')
+    if not isinstance(expires_at, datetime) or expires_at <= datetime.now(timezone.utc):
+        return None
+    if not found and ai_record_status(record) == 'done':
+        ai_memory_cache.set(key, record)
+    return record
+
+def ai_record_status(record):
+    status = record.get('status', 'done')   # entries from before job records have no status
+    if status == 'pending':
+        created_at = record.get('created_at')
+        if isinstance(created_at, datetime) and \
+                (datetime.now(timezone.utc) - created_at).total_seconds() > AI_PENDING_TIMEOUT:
+            return 'failed'
+    return status
+
+def ai_record_put(key, product_name, status, ttl, **fields):
+    now = datetime.now(timezone.utc)
+    record = {
+        'product_name': normalize_product_name(product_name),
+        'prompt_version': AI_PROMPT_VERSION,
+        'status': status,
+        'created_at': now,
+        # expires_at can also back a Firestore TTL policy on ai_descriptions
+        'expires_at': datetime.fromtimestamp(now.timestamp() + ttl, timezone.utc),
+        **fields,
+    }
+    if status == 'done':
+        ai_memory_cache.set(key, record)
+    try:
+        db.collection('ai_descriptions').document(key).set(record)
+    except Exception:
+        logger.exception("AI cache write failed")
+        return
+    with _ai_lock:
+        _ai_stored["count"] += 1
+        trim = _ai_stored["count"] % AI_CACHE_TRIM_EVERY == 0
+    if trim:
+        trim_ai_cache()
+
+def trim_ai_cache():
+    """Evict the oldest stored descriptions beyond AI_CACHE_MAX_ENTRIES."""
+    try:
+        col = db.collection('ai_descriptions')
+        excess = aggregate_count(col) - AI_CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+        batch = db.batch()
+        for i, doc in enumerate(col.order_by('created_at').limit(excess).stream(), start=1):
+            batch.delete(doc.reference)
+            if i % 500 == 0:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+        logger.info("AI cache trimmed %s entries", excess)
+    except Exception:
+        logger.exception("AI cache trim failed")
+
+def _generate_description(key, product_name, future):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = model.get().generate_content(AI_PROMPT.format(product_name=product_name))
+        outcome = "ok"
+        ai_record_put(key, product_name, 'done', AI_CACHE_TTL, description=response.text)
+        future.set_result(response.text)
+    except Exception as e:
+        logger.error("AI generation failed: %s", e)
+        ai_record_put(key, product_name, 'failed', AI_FAILURE_TTL, error=str(e))
+        future.set_exception(e)
+    finally:
+        metrics.record_ai(outcome, time.perf_counter() - start)
+        with _ai_lock:
+            _ai_inflight.pop(key, None)
+
+def submit_description(product_name):
+    """Return (key, future); concurrent requests for the same name share one future."""
+    key = ai_cache_key(product_name)
+    with _ai_lock:
+        future = _ai_inflight.get(key)
+        if future is not None:
+            return key, future
+        if len(_ai_inflight) >= AI_MAX_PENDING:
+            raise OverflowError("Too many pending AI requests")
+        future = Future()
+        _ai_inflight[key] = future
+    # the pending record lands before the job can write its result
+    ai_record_put(key, product_name, 'pending', AI_PENDING_TIMEOUT + AI_FAILURE_TTL)
+    ai_executor.submit(_generate_description, key, product_name, future)
+    return key, future
+
+def pending_response(key):
+    response = jsonify({"job_id": key, "status": "pending"})
+    response.headers['Location'] = f"/api/generate-description/{key}"
+    return response, 202
+
+def failed_response(key, error):
+    return jsonify({"msg":"AI generation failed","job_id": key,"status":"failed","error": error}), 502
+
+def description_response(key, future, wait):
+    try:
+        description = future.result(timeout=wait)
+    except TimeoutError:
+        return pending_response(key)
+    except Exception as e:
+        return failed_response(key, str(e))
+    return jsonify({"description": description, "job_id": key, "status": "done", "cached": False}), 200
+
+def record_response(key, record):
+    """Response for a finished job record, or None while it is pending."""
+    status = ai_record_status(record)
+    if status == 'done':
+        return jsonify({"description": record.get('description'), "job_id": key, "status": "done", "cached": True}), 200
+    if status == 'failed':
+        return failed_response(key, record.get('error') or "Generation did not finish")
+    return None
+
+@api.route("/api/generate-description", methods=['POST'])
 def generate_ai_description():
-    if model is None:
+    if model.get() is None:
         return jsonify({"msg":"AI model not configured"}), 501
-    product_name = (request.json or {}).get('product_name')
+    data = request.get_json(silent=True) or {}
+    product_name = data.get('product_name')
     if not product_name:
         return jsonify({"msg":"Product name required"}), 400
+    # long-poll: wait up to `wait` seconds (0 = return a job id immediately)
     try:
-        prompt = f"""Create a compelling Arabic marketing description for the product named "{product_name}". 2-3 paragraphs, call to action at the end."""
-        response = model.generate_content(prompt)
-        return jsonify({"description": response.text}), 200
-    except Exception as e:
-        logger.exception("AI generation failed")
-        return jsonify({"msg":"AI generation failed","error":str(e)}), 500
+        wait = min(max(float(data.get('wait', AI_LONG_POLL_SECONDS)), 0.0), AI_LONG_POLL_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({"msg":"Invalid wait"}), 400
+    key = ai_cache_key(product_name)
+    with _ai_lock:
+        running_here = key in _ai_inflight
+    record = None if running_here else ai_record_get(key)
+    if record is not None:
+        status = ai_record_status(record)
+        if status == 'done':
+            return record_response(key, record)
+        if status == 'pending':
+            # running in another worker; a failed job is retried below
+            return pending_response(key)
+    try:
+        key, future = submit_description(product_name)
+    except OverflowError as e:
+        return jsonify({"msg": str(e)}), 503
+    return description_response(key, future, wait)
+
+@api.route("/api/generate-description/<string:job_id>", methods=['GET'])
+def ai_description_status(job_id):
+    """Poll a generation job; ?wait= seconds long-polls it until it is done or failed."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), AI_LONG_POLL_SECONDS)
+    except ValueError:
+        return jsonify({"msg":"Invalid wait"}), 400
+    with _ai_lock:
+        future = _ai_inflight.get(job_id)
+    if future is not None:
+        return description_response(job_id, future, wait)
+    # Not running in this worker: follow the shared job record, re-reading it
+    # every AI_REMOTE_POLL_SECONDS for the rest of the wait.
+    deadline = time.monotonic() + wait
+    while True:
+        record = ai_record_get(job_id)
+        if record is None:
+            return jsonify({"msg":"Job not found","job_id": job_id}), 404
+        response = record_response(job_id, record)
+        if response is not None:
+            return response
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return pending_response(job_id)
+        time.sleep(min(AI_REMOTE_POLL_SECONDS, remaining))
 
 # Admin user management
-@app.route("/api/admin/create_user", methods=['POST'])
+@api.route("/api/admin/create_user", methods=['POST'])
 def admin_create_user():
     user = get_request_user()
     if not user or not has_role(user, 'admin'):
@@ -450,24 +2507,283 @@ def admin_create_user():
             "created_by": user.get('uid'),
             "created_at": firestore.SERVER_TIMESTAMP
         })
+        user_cache.invalidate(uid)
         return jsonify({"msg":"User created","uid":uid}), 201
     except Exception as e:
         logger.exception("create user failed")
         return jsonify({"msg":"Failed to create user","error":str(e)}), 500
 
-@app.route("/api/admin/users", methods=['GET'])
+# The user directory is paged by uid (the document id), so equality filters
+# on role/active need no composite index and documents without created_at
+# are still listed.
+def decode_user_cursor(cursor):
+    return {'__name__': decode_cursor(cursor)['__name__']}
+
+def parse_user_filters():
+    """Firestore equality filters from ?role= and ?active=; raises ValueError."""
+    filters = []
+    role = request.args.get('role')
+    if role:
+        if role not in ALLOWED_ROLES:
+            raise ValueError("Invalid role")
+        filters.append(('role', role))
+    active = request.args.get('active', '').lower()
+    if active:
+        if active not in ('1', 'true', 'yes', '0', 'false', 'no'):
+            raise ValueError("Invalid active")
+        filters.append(('active', active in ('1', 'true', 'yes')))
+    return filters
+
+@api.route("/api/admin/users", methods=['GET'])
 def admin_list_users():
     user = get_request_user()
     if not user or not has_role(user, 'admin'):
         return jsonify({"msg":"Forbidden"}), 403
-    docs = db.collection('users').stream()
-    users = []
-    for d in docs:
-        u = d.to_dict(); u['uid'] = d.id
-        users.append(u)
-    return jsonify(users), 200
-
-@app.route("/api/admin/users/<string:uid>", methods=['PUT'])
+    try:
+        limit, cursor = parse_page_args(decode_user_cursor)
+        filters = parse_user_filters()
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    try:
+        query = db.collection('users')
+        for field, value in filters:
+            query = query.where(field, '==', value)
+        query = query.order_by('__name__')
+        if limit is None:
+            return stream_json_list(query.stream(), id_field='uid')
+        if cursor:
+            query = query.start_after(cursor)
+        docs = list(query.limit(limit + 1).stream())
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_cursor(docs[-1].id, None)
+        return stream_json_list(docs, next_cursor, id_field='uid')
+    except Exception as e:
+        logger.exception("Failed to list users")
+        return jsonify({"msg":"Failed to list users","error":str(e)}), 500
+
+# Bulk provisioning: one import_users call (up to 1000 accounts) and batched
+# users/{uid} writes instead of two round trips per user. Accounts are
+# imported without passwords: hashing them here at a cost that resists
+# offline cracking (hundreds of thousands of PBKDF2 rounds) would take
+# minutes of request CPU for a full batch, so each created user gets a
+# password reset link instead (generated USER_LINK_CONCURRENCY at a time) and
+# picks their own password, which Firebase stores with its own scrypt hash.
+#
+# import_users does not check that emails are unique. Existing accounts are
+# looked up first (get_users, 100 emails per call), and every address is
+# claimed in user_emails/{sha256(email)} with batched creates before the
+# import, so two concurrent bulk requests cannot both import it. A claim
+# records the uid once the account exists; a claim left behind by a request
+# that died is taken over after USER_CLAIM_TTL.
+BULK_USERS_MAX = 1000   # import_users limit
+USER_LOOKUP_BATCH_SIZE = 100   # get_users limit
+USER_WRITE_BATCH_SIZE = 500   # Firestore batch limit
+USER_CLAIM_TTL = float(os.getenv("USER_CLAIM_TTL", "600"))
+USER_LINK_CONCURRENCY = int(os.getenv("USER_LINK_CONCURRENCY", "8"))
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+user_link_executor = ThreadPoolExecutor(max_workers=USER_LINK_CONCURRENCY, thread_name_prefix="user-link")
+
+def existing_emails(emails):
+    """The subset of `emails` (lowercase) that already belongs to an Auth account."""
+    found = set()
+    for start in range(0, len(emails), USER_LOOKUP_BATCH_SIZE):
+        identifiers = [firebase_admin.auth.EmailIdentifier(email)
+                       for email in emails[start:start + USER_LOOKUP_BATCH_SIZE]]
+        found.update((record.email or '').lower() for record in firebase_auth.get_users(identifiers).users)
+    return found
+
+def email_claim_ref(email):
+    return db.collection('user_emails').document(hashlib.sha256(email.encode()).hexdigest())
+
+def _claim_is_stale(snapshot):
+    claim = snapshot.to_dict() or {}
+    claimed_at = claim.get('claimed_at')
+    return not claim.get('uid') and isinstance(claimed_at, datetime) and \
+        (datetime.now(timezone.utc) - claimed_at).total_seconds() > USER_CLAIM_TTL
+
+def claim_emails(emails):
+    """Claim `emails` for an import; returns the subset this request now owns."""
+    claimed = set()
+    for start in range(0, len(emails), USER_WRITE_BATCH_SIZE):
+        chunk = emails[start:start + USER_WRITE_BATCH_SIZE]
+        refs = {email: email_claim_ref(email) for email in chunk}
+        snapshots = {snap.id: snap for snap in db.get_all(list(refs.values()))}
+        free = []   # (email, update_time of a stale claim, or None)
+        for email, ref in refs.items():
+            snap = snapshots.get(ref.id)
+            if snap is None or not snap.exists:
+                free.append((email, None))
+            elif _claim_is_stale(snap):
+                free.append((email, snap.update_time))
+        claim = {'claimed_at': datetime.now(timezone.utc), 'uid': None}
+
+        def stage(batch, email, update_time):
+            if update_time is None:
+                batch.create(refs[email], claim)
+            else:
+                batch.update(refs[email], claim, option=db.write_option(last_update_time=update_time))
+
+        batch = db.batch()
+        for email, update_time in free:
+            stage(batch, email, update_time)
+        try:
+            if free:
+                batch.commit()
+            claimed.update(email for email, _ in free)
+        except (AlreadyExists, FailedPrecondition):
+            # another request claimed some of them meanwhile: claim one by one
+            for email, update_time in free:
+                batch = db.batch()
+                stage(batch, email, update_time)
+                try:
+                    batch.commit()
+                    claimed.add(email)
+                except (AlreadyExists, FailedPrecondition):
+                    pass
+    return claimed
+
+def release_email_claims(emails):
+    for start in range(0, len(emails), USER_WRITE_BATCH_SIZE):
+        batch = db.batch()
+        for email in emails[start:start + USER_WRITE_BATCH_SIZE]:
+            batch.delete(email_claim_ref(email))
+        try:
+            batch.commit()
+        except Exception:
+            logger.exception("Failed to release email claims")
+
+def password_reset_link(email):
+    try:
+        return firebase_auth.generate_password_reset_link(email), None
+    except Exception as e:
+        logger.warning("password reset link for %s failed: %s", email, e)
+        return None, str(e)
+
+@api.route("/api/admin/users/bulk", methods=['POST'])
+def admin_bulk_create_users():
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    data = request.get_json(silent=True)
+    entries = data.get('users') if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"msg":"users must be a non-empty list"}), 400
+    if len(entries) > BULK_USERS_MAX:
+        return jsonify({"msg": f"At most {BULK_USERS_MAX} users per request"}), 400
+
+    users_ref = db.collection('users')
+    results = [None] * len(entries)
+    valid = []    # (index, email, role, entry)
+    seen_emails = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results[index] = {"index": index, "error": "User must be a JSON object"}
+            continue
+        email = (entry.get('email') or '').strip().lower()
+        role = entry.get('role', 'publisher')
+        error = None
+        if not EMAIL_RE.match(email):
+            error = "Invalid email"
+        elif email in seen_emails:
+            error = "Duplicate email in request"
+        elif role not in ALLOWED_ROLES:
+            error = "Invalid role"
+        elif entry.get('password') is not None:
+            error = "Passwords are not accepted; users set theirs with the reset link"
+        if error:
+            results[index] = {"index": index, "email": email, "error": error}
+            continue
+        seen_emails.add(email)
+        valid.append((index, email, role, entry))
+
+    try:
+        emails = [email for _, email, _, _ in valid]
+        taken = existing_emails(emails) if valid else set()
+        claimed = claim_emails([email for email in emails if email not in taken])
+    except Exception as e:
+        logger.exception("bulk user lookup failed")
+        return jsonify({"msg":"Failed to create users","error":str(e)}), 500
+
+    staged = []   # (index, ImportUserRecord, users doc)
+    for index, email, role, entry in valid:
+        if email not in claimed:
+            results[index] = {"index": index, "email": email, "error": "Email already exists"}
+            continue
+        uid = users_ref.document().id
+        try:
+            record = firebase_admin.auth.ImportUserRecord(
+                uid, email=email, display_name=entry.get('display_name') or None)
+        except ValueError as e:
+            results[index] = {"index": index, "email": email, "error": str(e)}
+            continue
+        staged.append((index, record, {
+            "email": email,
+            "role": role,
+            "active": True,
+            "created_by": user.get('uid'),
+            "created_at": firestore.SERVER_TIMESTAMP
+        }))
+    unused = claimed - {record.email for _, record, _ in staged}
+
+    imported = []
+    if staged:
+        try:
+            outcome = firebase_auth.import_users([record for _, record, _ in staged])
+        except Exception as e:
+            logger.exception("bulk user import failed")
+            release_email_claims(sorted(claimed))
+            return jsonify({"msg":"Failed to create users","error":str(e)}), 500
+        failed = {err.index: err.reason for err in outcome.errors}
+        for position, (index, record, doc_data) in enumerate(staged):
+            if position in failed:
+                results[index] = {"index": index, "email": record.email, "error": failed[position]}
+                unused.add(record.email)
+            else:
+                imported.append((index, record, doc_data))
+
+    created = []
+    for start in range(0, len(imported), USER_WRITE_BATCH_SIZE):
+        chunk = imported[start:start + USER_WRITE_BATCH_SIZE]
+        batch = db.batch()
+        for _, record, doc_data in chunk:
+            batch.set(users_ref.document(record.uid), doc_data)
+            batch.set(email_claim_ref(record.email), {'uid': record.uid}, merge=True)
+        try:
+            batch.commit()
+            for index, record, doc_data in chunk:
+                user_cache.invalidate(record.uid)
+                results[index] = {"index": index, "email": record.email, "uid": record.uid,
+                                  "role": doc_data['role']}
+                created.append(index)
+        except Exception as e:
+            # without a users doc the account has no role; remove it so the request can be retried
+            logger.exception("bulk user profile write failed")
+            try:
+                firebase_auth.delete_users([record.uid for _, record, _ in chunk])
+            except Exception:
+                logger.exception("rollback of imported users failed")
+            for index, record, _ in chunk:
+                results[index] = {"index": index, "email": record.email, "error": str(e)}
+                unused.add(record.email)
+    if unused:
+        release_email_claims(sorted(unused))
+
+    links = user_link_executor.map(password_reset_link, [results[index]['email'] for index in created])
+    for index, (link, error) in zip(created, links):
+        results[index]['password_reset_link'] = link
+        if error:
+            results[index]['password_reset_error'] = error
+
+    return jsonify({
+        "msg": f"Created {len(created)} users",
+        "created": len(created),
+        "failed": len(results) - len(created),
+        "results": results
+    }), 200
+
+@api.route("/api/admin/users/<string:uid>", methods=['PUT'])
 def admin_update_user(uid):
     user = get_request_user()
     if not user or not has_role(user, 'admin'):
@@ -482,28 +2798,251 @@ def admin_update_user(uid):
         return jsonify({"msg":"No updates provided"}), 400
     try:
         db.collection('users').document(uid).update(update)
+        user_cache.invalidate(uid)
         return jsonify({"msg":"User updated"}), 200
     except Exception as e:
         logger.exception("user update failed")
         return jsonify({"msg":"Failed to update user","error":str(e)}), 500
 
+@api.route("/api/admin/cache_stats", methods=['GET'])
+def admin_cache_stats():
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    return jsonify({"users": user_cache.stats(), "tokens": token_cache.stats()}), 200
+
+# Prometheus metrics for this worker (outside /api, so verify_token does not run)
+@api.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return jsonify({"msg": "Missing or invalid authorization token"}), 401
+    token = auth_header.split('Bearer ')[1]
+    if not (METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())):
+        try:
+            user = verify_id_token_cached(token)
+        except Exception:
+            user = None
+        if not user or not has_role(user, 'admin'):
+            return jsonify({"msg":"Forbidden"}), 403
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 # Cleanup (admin only)
-@app.route("/api/cleanup-old-products", methods=['POST'])
+@api.route("/api/cleanup-old-products", methods=['POST'])
 def cleanup_old_products():
     user = get_request_user()
     if not user or not has_role(user, 'admin'):
         return jsonify({"msg":"Forbidden"}), 403
     try:
-        docs = db.collection('products').where('creator_uid', '==', None).stream()
-        deleted = 0
-        for d in docs:
-            d.reference.delete()
-            deleted += 1
-        return jsonify({"msg": f"Deleted {deleted} ownerless products"}), 200
+        job_id = start_job('cleanup_ownerless_products', {}, user)
+        return jsonify({"msg": "Cleanup of ownerless products started", "job_id": job_id}), 202
     except Exception as e:
         logger.exception("cleanup failed")
         return jsonify({"msg":"Cleanup failed","error":str(e)}), 500
 
+# Bulk NDJSON import / export (admin only)
+IMPORT_BATCH_SIZE = 500   # Firestore batch limit
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+def iter_ndjson_upload():
+    """Yield raw lines from a multipart `file` field or the raw request body, without buffering it whole."""
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    stream = upload.stream if upload else request.stream
+    for line in io.TextIOWrapper(stream, encoding='utf-8', errors='replace'):
+        yield line
+
+@api.route("/api/admin/products/import", methods=['POST'])
+def admin_import_products():
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    products_ref = db.collection('products')
+    results = []
+    pending = []   # (line number, ref, doc) staged in the current batch
+
+    def flush():
+        if not pending:
+            return
+        batch = db.batch()
+        for _, ref, doc_data in pending:
+            batch.set(ref, doc_data)
+        try:
+            batch.commit()
+            apply_rollup(*[product_rollup_delta(doc_data) for _, _, doc_data in pending])
+            results.extend({"line": n, "id": ref.id} for n, ref, _ in pending)
+        except Exception as e:
+            logger.exception("import batch failed")
+            results.extend({"line": n, "error": str(e)} for n, _, _ in pending)
+        pending.clear()
+
+    try:
+        for line_no, line in enumerate(iter_ndjson_upload(), start=1):
+            if not line.strip():
+                continue
+            try:
+                doc_data = build_product_doc(current_app.json.loads(line), user)
+            except ValueError as e:   # includes json.JSONDecodeError
+                results.append({"line": line_no, "error": str(e)})
+                continue
+            pending.append((line_no, products_ref.document(), doc_data))
+            if len(pending) >= IMPORT_BATCH_SIZE:
+                flush()
+        flush()
+    except Exception as e:
+        logger.exception("import failed")
+        return jsonify({"msg":"Import failed","error":str(e),"results": results}), 500
+    results.sort(key=lambda r: r['line'])
+    imported = sum(1 for r in results if 'id' in r)
+    return jsonify({
+        "msg": f"Imported {imported} products",
+        "imported": imported,
+        "failed": len(results) - imported,
+        "results": results
+    }), 200
+
+@api.route("/api/admin/products/export", methods=['GET'])
+def admin_export_products():
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    dumps = current_app.json.dumps
+
+    def generate():
+        # page by document id so only one page is held in memory at a time
+        query = db.collection('products').order_by('__name__').limit(EXPORT_PAGE_SIZE)
+        last_id = None
+        while True:
+            page = query.start_after({'__name__': last_id}) if last_id else query
+            count = 0
+            for doc in page.stream():
+                yield dumps(doc_to_json(doc.to_dict(), doc.id)) + '\n'
+                last_id = doc.id
+                count += 1
+            if count < EXPORT_PAGE_SIZE:
+                break
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=products.ndjson'})
+
+# Bulk maintenance jobs (admin only)
+@api.route("/api/admin/jobs", methods=['POST'])
+def admin_start_job():
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    data = request.get_json() or {}
+    action = data.get('action')
+    if action not in BULK_ACTIONS:
+        return jsonify({"msg":"Unknown action","actions": sorted(BULK_ACTIONS)}), 400
+    try:
+        job_id = start_job(action, data.get('params') or {}, user)
+        return jsonify({"msg":"Job started","job_id": job_id}), 202
+    except Exception as e:
+        logger.exception("job start failed")
+        return jsonify({"msg":"Failed to start job","error":str(e)}), 500
+
+@api.route("/api/admin/jobs/<string:job_id>", methods=['GET'])
+def admin_job_status(job_id):
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    doc = jobs_ref().document(job_id).get()
+    if not doc.exists:
+        return jsonify({"msg":"Job not found"}), 404
+    return jsonify(job_to_json(doc.id, doc.to_dict() or {})), 200
+
+@api.route("/api/admin/jobs/<string:job_id>/resume", methods=['POST'])
+def admin_resume_job(job_id):
+    user = get_request_user()
+    if not user or not has_role(user, 'admin'):
+        return jsonify({"msg":"Forbidden"}), 403
+    ref = jobs_ref().document(job_id)
+    doc = ref.get()
+    if not doc.exists:
+        return jsonify({"msg":"Job not found"}), 404
+    job = doc.to_dict() or {}
+    if job.get('status') == 'done' or (job.get('status') in ('queued', 'running') and not job_is_stale(job)):
+        return jsonify({"msg":"Job is not resumable","status": job.get('status')}), 409
+    try:
+        # claim: fails if anyone (another resume, the old worker's heartbeat) wrote since our read
+        ref.update({'status': 'queued', 'heartbeat_at': firestore.SERVER_TIMESTAMP},
+                   option=db.write_option(last_update_time=doc.update_time))
+    except FailedPrecondition:
+        return jsonify({"msg":"Job changed while resuming, reload it"}), 409
+    job_executor.submit(run_job, job_id)
+    return jsonify({"msg":"Job resumed","job_id": job_id,"checkpoint": job.get('checkpoint')}), 202
+
+# ---------------- Application factory ----------------
+# gunicorn loads "main:create_app()" (see gunicorn.conf.py). Routes are
+# registered at import; create_app() finishes process setup and records
+# startup time. Clients stay lazy either way: with PRELOAD_MODULES (set by
+# gunicorn.conf.py when preload_app is on) the master only imports the heavy
+# client libraries, so forked workers share them, and each worker builds its
+# own clients after the fork (warm_clients).
+PRELOAD_MODULES = os.getenv("PRELOAD_MODULES", "").lower() in ("1", "true", "yes")
+WARM_CLIENTS = os.getenv("WARM_CLIENTS", "1").lower() in ("1", "true", "yes")
+STARTUP_TARGET_SECONDS = float(os.getenv("STARTUP_TARGET_SECONDS", "2"))
+startup_times = {}
+
+def preload_modules():
+    """Import client libraries without creating clients or connections (safe before a fork)."""
+    if GEMINI_API_KEY and not AI_FAKE_MODEL:
+        try:
+            import google.generativeai  # noqa: F401
+        except Exception:
+            logger.warning("google.generativeai not available")
+
+def warm_clients():
+    """Create this process's clients ahead of the first request."""
+    start = time.perf_counter()
+    for client in LAZY_CLIENTS:
+        try:
+            client.get()
+        except Exception:
+            logger.exception("Failed to create %s client", client.name)
+    startup_times['clients'] = time.perf_counter() - start
+    metrics.registry.set("app_startup_seconds", (("phase", "clients"),), startup_times['clients'])
+    logger.info("clients ready in pid %s in %.2fs (%s)", os.getpid(), startup_times['clients'],
+                ", ".join(f"{c.name} {c.init_seconds or 0:.2f}s" for c in LAZY_CLIENTS))
+
+def warm_clients_in_background():
+    """Called in each gunicorn worker after the fork; the worker accepts requests meanwhile."""
+    if WARM_CLIENTS and LAZY_CLIENTS:
+        threading.Thread(target=warm_clients, name="warm-clients", daemon=True).start()
+
+def create_app():
+    """
+    Build the Flask app: the `api` blueprint carries every route and request
+    hook. Clients and caches are module-level and shared by the apps of one
+    process; the one-time startup work below runs on the first call.
+    """
+    boot_started = time.perf_counter()
+    app = Flask(__name__, static_folder=STATIC_FOLDER, static_url_path="/")
+    app.secret_key = SECRET_KEY
+    app.config["JSON_ENCODER"] = JSON_ENCODER
+    app.json = FastJSONProvider(app)
+    # flask-cors runs after the blueprint's hooks and keeps the origin they set
+    CORS(
+        app,
+        resources={r"/api/*": {"origins": [NETLIFY_ORIGIN, "http://localhost:5500", "http://127.0.0.1:5500"]}},
+        supports_credentials=True,
+    )
+    app.register_blueprint(api)
+
+    if not startup_times:
+        if PRELOAD_MODULES:
+            preload_modules()
+        startup_times['import'] = boot_started - IMPORT_STARTED
+        startup_times['boot'] = time.perf_counter() - boot_started
+        for phase in ('import', 'boot'):
+            metrics.registry.set("app_startup_seconds", (("phase", phase),), startup_times[phase])
+        total = startup_times['import'] + startup_times['boot']
+        log = logger.warning if total > STARTUP_TARGET_SECONDS else logger.info
+        log("app ready in %.2fs (import %.2fs, boot %.2fs; target %.1fs)",
+            total, startup_times['import'], startup_times['boot'], STARTUP_TARGET_SECONDS)
+        logger.info(f"CORS enabled for {NETLIFY_ORIGIN}")
+    return app
+
 # Run
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=False)
+    create_app().run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=False)
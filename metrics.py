@@ -0,0 +1,345 @@
+import time
+import bisect
+import threading
+import contextvars
+
+
+# latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text format.
+    Each gunicorn worker keeps its own registry, like TTLCache; a scrape
+    reports the worker that served it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}      # name -> (type, help, buckets)
+        self._series = {}    # name -> {labels tuple: float or Histogram}
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+        self._series[name] = {}
+
+    def gauge(self, name, help_text):
+        self._meta[name] = ("gauge", help_text, None)
+        self._series[name] = {}
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+        self._series[name] = {}
+
+    def inc(self, name, labels=(), amount=1):
+        series = self._series[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self._series[name][labels] = value
+
+    def observe(self, name, labels, value):
+        series = self._series[name]
+        with self._lock:
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = Histogram(self._meta[name][2])
+            hist.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._series[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(value.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+registry.counter("http_requests_total", "HTTP requests by route, method and status.")
+registry.histogram("http_request_duration_seconds", "HTTP request latency, including streamed bodies.")
+registry.histogram("http_request_firestore_seconds", "Firestore time spent per HTTP request.")
+registry.counter("http_request_firestore_reads_total", "Firestore documents read while serving requests.")
+registry.counter("http_request_firestore_writes_total", "Firestore documents written while serving requests.")
+registry.histogram("firestore_rpc_duration_seconds", "Firestore call latency by operation, requests and background work.")
+registry.counter("firestore_documents_read_total", "Firestore documents read by operation.")
+registry.counter("firestore_documents_written_total", "Firestore documents written by operation.")
+registry.histogram("firebase_auth_duration_seconds", "Firebase Auth call latency by operation (token verification misses the cache).")
+registry.histogram("ai_generate_duration_seconds", "AI model call latency by outcome.")
+registry.gauge("app_startup_seconds", "Process startup time by phase (import, boot, clients).")
+
+
+# ---------------- Request traces ----------------
+class RequestTrace:
+    """Per-request totals, plus a span list when the slow-request log is on."""
+    __slots__ = ("start", "firestore_seconds", "reads", "writes", "spans")
+
+    def __init__(self, keep_spans=False):
+        self.start = time.perf_counter()
+        self.firestore_seconds = 0.0
+        self.reads = 0
+        self.writes = 0
+        self.spans = [] if keep_spans else None
+
+    def add_span(self, kind, op, target, seconds, reads=0, writes=0):
+        if self.spans is not None and len(self.spans) < MAX_SPANS:
+            self.spans.append((kind, op, target, seconds, reads, writes))
+
+    def breakdown(self):
+        """One line per span, slowest first."""
+        out = []
+        for kind, op, target, seconds, reads, writes in sorted(self.spans or (), key=lambda s: -s[3]):
+            counts = f" reads={reads}" if reads else ""
+            counts += f" writes={writes}" if writes else ""
+            out.append(f"{kind}.{op} {target or ''} {seconds * 1000:.1f}ms{counts}".replace("  ", " "))
+        return out
+
+
+MAX_SPANS = 200
+_current = contextvars.ContextVar("request_trace", default=None)
+
+
+def start_trace(keep_spans=False):
+    trace = RequestTrace(keep_spans)
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def clear_trace():
+    _current.set(None)
+
+
+def record_firestore(op, target, seconds, reads=0, writes=0):
+    labels = (("op", op),)
+    registry.observe("firestore_rpc_duration_seconds", labels, seconds)
+    if reads:
+        registry.inc("firestore_documents_read_total", labels, reads)
+    if writes:
+        registry.inc("firestore_documents_written_total", labels, writes)
+    trace = _current.get()
+    if trace is not None:
+        trace.firestore_seconds += seconds
+        trace.reads += reads
+        trace.writes += writes
+        trace.add_span("firestore", op, target, seconds, reads, writes)
+
+
+def record_auth(op, seconds):
+    registry.observe("firebase_auth_duration_seconds", (("op", op),), seconds)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span("auth", op, None, seconds)
+
+
+def record_ai(outcome, seconds):
+    registry.observe("ai_generate_duration_seconds", (("outcome", outcome),), seconds)
+
+
+def finish_request(trace, method, route, status, log=None, slow_seconds=0):
+    seconds = time.perf_counter() - trace.start
+    route_labels = (("method", method), ("route", route))
+    registry.inc("http_requests_total", route_labels + (("status", str(status)),))
+    registry.observe("http_request_duration_seconds", route_labels, seconds)
+    registry.observe("http_request_firestore_seconds", route_labels, trace.firestore_seconds)
+    if trace.reads:
+        registry.inc("http_request_firestore_reads_total", route_labels, trace.reads)
+    if trace.writes:
+        registry.inc("http_request_firestore_writes_total", route_labels, trace.writes)
+    if log is not None and slow_seconds and seconds >= slow_seconds:
+        log.warning("Slow request %s %s -> %s in %.1fms (firestore %.1fms, reads=%s, writes=%s)%s",
+                    method, route, status, seconds * 1000, trace.firestore_seconds * 1000,
+                    trace.reads, trace.writes, "".join("\n  " + line for line in trace.breakdown()))
+    return seconds
+
+
+# ---------------- Client wrappers ----------------
+# builder calls return another wrapped object; RPC calls are timed and counted
+_BUILDERS = {"collection", "document", "collection_group", "where", "order_by", "limit", "limit_to_last",
+             "select", "offset", "start_after", "start_at", "end_before", "end_at", "count", "batch",
+             "transaction"}
+# firestore.transactional commits through Transaction._commit
+_RPCS = {"get", "stream", "get_all", "create", "set", "update", "delete", "add", "commit", "_commit",
+         "list_documents"}
+_WRITES = {"create", "set", "update", "delete", "add"}
+
+
+def unwrap(value):
+    """The underlying client object(s) behind TracedFirestore wrappers."""
+    if isinstance(value, TracedFirestore):
+        return value._target
+    if isinstance(value, (list, tuple)) and any(isinstance(v, TracedFirestore) for v in value):
+        return type(value)(unwrap(v) for v in value)
+    return value
+
+
+def _unwrap_kwargs(kwargs):
+    # e.g. ref.get(transaction=...) with a wrapped transaction
+    return {k: unwrap(v) for k, v in kwargs.items()} if kwargs else kwargs
+
+
+def _count(result):
+    try:
+        return len(result)
+    except TypeError:
+        return 1
+
+
+class TracedFirestore:
+    """
+    Thin proxy over a Firestore client and the references,
+    queries and batches built from it. Only calls that reach the server are
+    timed; everything else passes straight through to the wrapped object.
+    """
+    __slots__ = ("_target", "_kind", "_path", "_pending")
+
+    def __init__(self, target, kind="client", path=None):
+        self._target = target
+        self._kind = kind
+        self._path = path
+        self._pending = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _BUILDERS:
+            return self._builder(name, attr)
+        if name in _RPCS:
+            return self._rpc(name, attr)
+        return attr
+
+    def _builder(self, name, method):
+        def call(*args, **kwargs):
+            result = method(*unwrap(args), **_unwrap_kwargs(kwargs))
+            if name in ("collection", "document") and args:
+                path = f"{self._path}/{args[0]}" if self._path else str(args[0])
+            else:
+                path = self._path
+            kind = {"batch": "batch", "transaction": "transaction", "count": "aggregation"}.get(name, "query" if name not in ("collection", "document") else name)
+            return TracedFirestore(result, kind, path)
+        return call
+
+    def _rpc(self, name, method):
+        if self._kind in ("batch", "transaction") and name in _WRITES:
+            # batched and transactional writes are buffered locally and counted on commit
+            def stage(*args, **kwargs):
+                self._pending += 1
+                return method(*unwrap(args), **_unwrap_kwargs(kwargs))
+            return stage
+
+        op = name.lstrip("_") if self._kind == "client" else f"{self._kind}.{name.lstrip('_')}"
+        path = self._path
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*unwrap(args), **_unwrap_kwargs(kwargs))
+            except Exception:
+                if name == "_commit":
+                    # aborted: firestore.transactional stages the writes again on retry
+                    self._pending = 0
+                raise
+            if name in ("stream", "get_all", "list_documents") and hasattr(result, "__next__"):
+                return _traced_iter(op, path, result, time.perf_counter() - start)
+            self._finish(op, path, name, start, result)
+            return result
+        return call
+
+    def _finish(self, op, path, name, start, result):
+        seconds = time.perf_counter() - start
+        if name in ("commit", "_commit"):
+            record_firestore(op, path, seconds, writes=self._pending)
+            self._pending = 0
+        elif name in _WRITES:
+            record_firestore(op, path, seconds, writes=1)
+        elif self._kind == "aggregation":
+            record_firestore(op, path, seconds, reads=1)
+        elif self._kind == "document":
+            record_firestore(op, path, seconds, reads=1)
+        else:
+            record_firestore(op, path, seconds, reads=_count(result))
+
+
+def _traced_iter(op, path, iterator, seconds):
+    # only time spent waiting on the iterator counts, not the caller's work between items
+    reads = 0
+    try:
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - t
+                return
+            seconds += time.perf_counter() - t
+            reads += 1
+            yield item
+    finally:
+        record_firestore(op, path, seconds, reads=reads)
+
+
+class TracedAuth:
+    """Times Firebase Auth calls; exception classes and constants pass through."""
+    _CALLS = {"verify_id_token", "create_user", "get_user", "get_users", "get_user_by_email", "update_user",
+              "delete_user", "delete_users", "import_users", "set_custom_user_claims", "revoke_refresh_tokens",
+              "generate_password_reset_link"}
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._CALLS:
+            return attr
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record_auth(name, time.perf_counter() - start)
+        return call
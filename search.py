@@ -0,0 +1,166 @@
+import re
+import bisect
+import threading
+import unicodedata
+
+
+# harakat, superscript alef, Quranic annotation marks and tatweel
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_LETTERS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",   # alef variants
+    "ى": "ي",                               # alef maksura
+    "ة": "ه",                               # ta marbuta
+    **{chr(0x0660 + i): str(i) for i in range(10)},   # Arabic-Indic digits
+    **{chr(0x06f0 + i): str(i) for i in range(10)},   # Persian digits
+})
+_WORD = re.compile(r"\w+")
+# definite article and its common attached prefixes: ال، وال، بال، كال، فال، لل
+_ARTICLES = ("وال", "بال", "كال", "فال", "ال", "لل")
+
+
+def normalize(text):
+    """Fold text for matching: presentation forms, diacritics, letter variants and case."""
+    text = unicodedata.normalize("NFKC", str(text or ""))
+    return _DIACRITICS.sub("", text).translate(_LETTERS).casefold()
+
+
+def strip_article(word):
+    for prefix in _ARTICLES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            return word[len(prefix):]
+    return word
+
+
+def term_forms(word):
+    """
+    Terms a normalized word is indexed and queried under: without its
+    article, and also as written when an article was removed. The second form
+    lets a query that is still typing the article ("ال", "الم") prefix-match.
+    """
+    stripped = strip_article(word)
+    return (stripped,) if stripped == word else (stripped, word)
+
+
+def words(text):
+    """Normalized words of `text`."""
+    return _WORD.findall(normalize(text))
+
+
+def tokenize(text):
+    """Normalized search terms of `text`, with the definite article removed."""
+    return [strip_article(word) for word in words(text)]
+
+
+class SearchIndex:
+    """
+    Thread-safe in-memory inverted index. `fields` maps document fields to
+    weights; every query word must match (exactly, or as a prefix of an
+    indexed term, with or without its article) and results are ranked by
+    summed field weight, newest first on ties.
+    """
+    PREFIX_FACTOR = 0.5     # a prefix match is worth half an exact one
+    MAX_EXPANSIONS = 200    # indexed terms tried per query prefix
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        self._lock = threading.Lock()
+        self._docs = {}       # id -> (term weights, normalized name, recency, payload)
+        self._postings = {}   # term -> {id: weight}
+        self._terms = []      # sorted vocabulary, for prefix ranges
+
+    def __len__(self):
+        return len(self._docs)
+
+    def put(self, doc_id, doc, payload=None, recency=0.0):
+        weights = {}
+        for field, weight in self.fields.items():
+            for word in words(doc.get(field)):
+                for term in term_forms(word):
+                    weights[term] = weights.get(term, 0.0) + weight
+        title = normalize(doc.get(next(iter(self.fields)))) if self.fields else ""
+        with self._lock:
+            self._unindex(doc_id)
+            self._docs[doc_id] = (weights, title, recency, payload)
+            for term, weight in weights.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._terms, term)
+                postings[doc_id] = weight
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._unindex(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs, self._postings, self._terms = {}, {}, []
+
+    def _unindex(self, doc_id):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        for term in entry[0]:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _matches(self, term):
+        """{id: score} for one query term, exact matches scoring above prefix ones."""
+        scores = dict(self._postings.get(term, ()))
+        start = bisect.bisect_left(self._terms, term)
+        for candidate in self._terms[start:start + self.MAX_EXPANSIONS + 1]:
+            if not candidate.startswith(term):
+                break
+            if candidate == term:
+                continue
+            for doc_id, weight in self._postings[candidate].items():
+                score = weight * self.PREFIX_FACTOR
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+    def _word_matches(self, word):
+        """_matches for the best of the word's forms."""
+        forms = term_forms(word)
+        scores = self._matches(forms[0])
+        for form in forms[1:]:
+            for doc_id, score in self._matches(form).items():
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+    def search(self, query, predicate=None):
+        """
+        Return [(sort key, payload)] for documents matching every term of
+        `query`, best first. The sort key (-score, -recency, id) is stable, so
+        it can be used as a pagination cursor.
+        """
+        query_words = list(dict.fromkeys(words(query)))
+        if not query_words:
+            return []
+        phrase = normalize(query).strip()
+        with self._lock:
+            scores = None
+            for word in sorted(query_words, key=lambda w: len(self._postings.get(strip_article(w), ()))):
+                matches = self._word_matches(word)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {doc_id: s + matches[doc_id] for doc_id, s in scores.items() if doc_id in matches}
+                if not scores:
+                    return []
+            results = []
+            for doc_id, score in scores.items():
+                _, title, recency, payload = self._docs[doc_id]
+                if predicate is not None and not predicate(payload):
+                    continue
+                if phrase and title.startswith(phrase):
+                    score += 1.0
+                results.append(((-score, -recency, doc_id), payload))
+        results.sort(key=lambda item: item[0])
+        return results
@@ -44,7 +44,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const response = await fetch(url, { ...options, headers });
         if (!response.ok) {
             const errorData = await response.json().catch(() => ({ msg: 'An unknown error occurred' }));
-            throw new Error(errorData.msg || `Request failed with status ${response.status}`);
+            const msg = errorData.msg || `Request failed with status ${response.status}`;
+            throw new Error(errorData.error ? `${msg}: ${errorData.error}` : msg);
         }
         return response.json();
     };
@@ -102,6 +103,8 @@ document.addEventListener('DOMContentLoaded', () => {
         document.getElementById('generateAiDescriptionBtn').addEventListener('click', () => generateAiDescription(product.name));
     };
 
+    const AI_MAX_POLLS = 15; // about five minutes of 20 s long-polls
+
     const generateAiDescription = async (productName) => {
         const aiDescriptionContainer = document.getElementById('aiDescription');
         const generateBtn = document.getElementById('generateAiDescriptionBtn');
@@ -115,10 +118,18 @@ document.addEventListener('DOMContentLoaded', () => {
         generateBtn.disabled = true;
 
         try {
-            const result = await fetchWithAuth('/api/generate-description', {
+            let result = await fetchWithAuth('/api/generate-description', {
                 method: 'POST',
                 body: JSON.stringify({ product_name: productName })
             });
+            // still generating (202, status "pending"), maybe in another server
+            // worker: long-poll the job until it is done. A failed job (502) or
+            // an unknown one (404) makes fetchWithAuth throw, which ends the loop.
+            let polls = 0;
+            while (result.status === 'pending') {
+                if (++polls > AI_MAX_POLLS) throw new Error('انتهت مهلة توليد الوصف، حاول مرة أخرى');
+                result = await fetchWithAuth(`/api/generate-description/${result.job_id}?wait=20`);
+            }
             aiDescriptionContainer.style.display = 'block'; // Change to block to remove flex properties
             aiDescriptionContainer.innerHTML = result.description;
         } catch (error) {
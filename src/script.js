@@ -20,6 +20,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const userEmailSpan = document.getElementById('userEmail');
     const searchInput = document.getElementById('searchInput');
     const productGrid = document.getElementById('productGrid');
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
     const productForm = document.getElementById('productForm');
     const productIdField = document.getElementById('productId');
     const productNameField = document.getElementById('productName');
@@ -39,11 +40,27 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Global State ---
     const API_URL = '/api/products';
+    // lists default to summary fields; the cards also show the description
+    const CARD_FIELDS = 'summary,description';
+    const PRODUCTS_PAGE_URL = `${API_URL}?fields=${CARD_FIELDS}`;
     const ANALYTICS_URL = '/api/analytics';
     const CLEANUP_URL = '/api/cleanup-old-products'; 
+    // authenticated search: same product set as the grid (everything for
+    // admins, the caller's own products otherwise)
+    const SEARCH_URL = '/api/products/search';
+    // live added/modified/removed events for the same product set as the grid;
+    // read with fetch so the request carries the token (see connectChanges)
+    const CHANGES_URL = '/api/products/changes';
     let salesChart;
     let allProducts = [];
     let currentUser = null;
+    let changes = null;          // AbortController of the open change stream
+    let changesLive = false;
+    let lastEventId = null;
+    let pendingChanges = null;   // events that arrive while the list is loading
+    let analyticsTimer;
+    let listCursor = null;       // next page of the product list, null when all are loaded
+    let search = null;           // { term, results, cursor } while the search box is in use
 
     // --- Authentication Logic ---
     auth.onAuthStateChanged(user => {
@@ -52,12 +69,16 @@ document.addEventListener('DOMContentLoaded', () => {
             authContainer.style.display = 'none';
             dashboardContainer.style.display = 'block';
             userEmailSpan.textContent = user.email;
+            connectChanges();
             loadDashboardData();
         } else {
             currentUser = null;
+            disconnectChanges();
             authContainer.style.display = 'block';
             dashboardContainer.style.display = 'none';
             allProducts = [];
+            listCursor = null;
+            search = null;
             renderProducts(allProducts);
         }
     });
@@ -98,6 +119,17 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         return response.status === 204 ? null : response.json();
     };
+
+    // Listing endpoints are paginated: one page per call, the next one is
+    // requested with the X-Next-Cursor of the previous (null on the last page).
+    const fetchPage = async (url, cursor = null) => {
+        const separator = url.includes('?') ? '&' : '?';
+        const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+        const idToken = await currentUser.getIdToken();
+        const response = await fetch(pageUrl, { headers: { 'Authorization': `Bearer ${idToken}` } });
+        if (!response.ok) throw new Error(`Request failed with status ${response.status}`);
+        return { items: await response.json(), next: response.headers.get('X-Next-Cursor') };
+    };
     
     const formatDate = (timestamp) => {
         if (!timestamp) return 'تاريخ غير معروف';
@@ -107,18 +139,166 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Data Loading & Rendering ---
     const loadDashboardData = async () => {
+        pendingChanges = pendingChanges || [];
         try {
-            const [products, analytics] = await Promise.all([fetchWithAuth(API_URL), fetchWithAuth(ANALYTICS_URL)]);
-            allProducts = products;
-            const hasOwnerlessProducts = allProducts.some(p => !p.creator_uid);
-            if (cleanupBtn) cleanupBtn.style.display = hasOwnerlessProducts ? 'inline-flex' : 'none';
-            
-            renderProducts(allProducts);
+            // only the first page: older products load on demand ("load more")
+            const [page, analytics] = await Promise.all([fetchPage(PRODUCTS_PAGE_URL), fetchWithAuth(ANALYTICS_URL)]);
+            allProducts = page.items;
+            listCursor = page.next;
+            // replaying events the list already reflects is harmless: each one carries the whole product
+            pendingChanges.forEach(([type, product]) => applyChange(type, product));
+            showProducts();
             updateAnalytics(analytics);
         } catch (error) {
             console.error('Error loading dashboard data:', error);
             productGrid.innerHTML = `<p>خطأ في تحميل البيانات: ${error.message}</p>`;
+        } finally {
+            pendingChanges = null;
+        }
+    };
+
+    const showProducts = () => {
+        const hasOwnerlessProducts = allProducts.some(p => !p.creator_uid);
+        if (cleanupBtn) cleanupBtn.style.display = hasOwnerlessProducts ? 'inline-flex' : 'none';
+        // search results stay on screen until the search box is cleared
+        if (!search) renderProducts(allProducts, listCursor);
+    };
+
+    const loadMore = async () => {
+        loadMoreBtn.disabled = true;
+        try {
+            if (search) {
+                const current = search;
+                const page = await fetchPage(`${SEARCH_URL}?q=${encodeURIComponent(current.term)}&fields=${CARD_FIELDS}`, current.cursor);
+                if (search !== current) return;   // the search changed meanwhile
+                current.results = current.results.concat(page.items);
+                current.cursor = page.next;
+                renderProducts(current.results, current.cursor);
+            } else {
+                const page = await fetchPage(PRODUCTS_PAGE_URL, listCursor);
+                // live events may already have delivered some of these
+                const known = new Set(allProducts.map(p => p.id));
+                allProducts = allProducts.concat(page.items.filter(p => !known.has(p.id)));
+                listCursor = page.next;
+                showProducts();
+            }
+        } catch (error) {
+            console.error('Error loading more products:', error);
+        } finally {
+            loadMoreBtn.disabled = false;
+        }
+    };
+    if (loadMoreBtn) loadMoreBtn.addEventListener('click', loadMore);
+
+    // --- Live Updates ---
+    const applyChange = (type, product) => {
+        const index = allProducts.findIndex(p => p.id === product.id);
+        if (type === 'removed') {
+            if (index !== -1) allProducts.splice(index, 1);
+        } else if (index !== -1) {
+            allProducts[index] = product;
+        } else if (listCursor && allProducts.length &&
+                   (product.created_at || 0) < (allProducts[allProducts.length - 1].created_at || 0)) {
+            // older than everything loaded: it arrives with its own page
+            return;
+        } else {
+            allProducts.push(product);
+            allProducts.sort((a, b) => (b.created_at || 0) - (a.created_at || 0));
+        }
+    };
+
+    const refreshAnalytics = () => {
+        clearTimeout(analyticsTimer);
+        analyticsTimer = setTimeout(async () => {
+            try {
+                updateAnalytics(await fetchWithAuth(ANALYTICS_URL));
+            } catch (error) {
+                console.error('Error refreshing analytics:', error);
+            }
+        }, 1000);
+    };
+
+    const handleChange = (type, product) => {
+        if (pendingChanges) {
+            pendingChanges.push([type, product]);
+            return;
         }
+        applyChange(type, product);
+        showProducts();
+        refreshAnalytics();
+    };
+
+    // One server-sent event block ("field: value" lines); returns its retry: delay, if any.
+    const handleEventBlock = (block) => {
+        let type = 'message';
+        let retry = null;
+        const data = [];
+        block.split('\n').forEach(line => {
+            if (!line || line.startsWith(':')) return;
+            const colon = line.indexOf(':');
+            const field = colon === -1 ? line : line.slice(0, colon);
+            let value = colon === -1 ? '' : line.slice(colon + 1);
+            if (value.startsWith(' ')) value = value.slice(1);
+            if (field === 'event') type = value;
+            else if (field === 'data') data.push(value);
+            else if (field === 'id') lastEventId = value;
+            else if (field === 'retry') retry = parseInt(value, 10);
+        });
+        if (type === 'reset') {
+            // too far behind to replay: reload the list once
+            loadDashboardData();
+        } else if (data.length && ['added', 'modified', 'removed'].includes(type)) {
+            handleChange(type, JSON.parse(data.join('\n')));
+        }
+        return retry;
+    };
+
+    // EventSource cannot send an Authorization header, and without one the
+    // server streams the anonymous view (available products only). The stream
+    // is read with fetch instead, so events follow the signed-in user's own
+    // visibility; reconnecting (with Last-Event-ID) is done here too.
+    const connectChanges = async () => {
+        disconnectChanges();
+        if (!currentUser || !window.ReadableStream || !window.TextDecoder) return;
+        const controller = new AbortController();
+        changes = controller;
+        let retryMs = 3000;
+        try {
+            const idToken = await currentUser.getIdToken();
+            const headers = { 'Authorization': `Bearer ${idToken}`, 'Accept': 'text/event-stream' };
+            if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+            const response = await fetch(CHANGES_URL, { headers, cache: 'no-store', signal: controller.signal });
+            if (!response.ok) throw new Error(`Change stream failed with status ${response.status}`);
+            changesLive = true;
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            for (;;) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                blocks.forEach(block => {
+                    const retry = handleEventBlock(block);
+                    if (retry) retryMs = retry;
+                });
+            }
+        } catch (error) {
+            if (controller.signal.aborted) return;
+            console.error('Change stream error:', error);
+            retryMs = 5000 + Math.random() * 5000;
+        }
+        if (changes !== controller) return;   // disconnected or replaced meanwhile
+        // until the stream is back, actions refetch the list themselves
+        changesLive = false;
+        setTimeout(() => { if (currentUser && changes === controller) connectChanges(); }, retryMs);
+    };
+
+    const disconnectChanges = () => {
+        if (changes) changes.abort();
+        changes = null;
+        changesLive = false;
     };
 
     const updateAnalytics = (analytics) => {
@@ -129,15 +309,36 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const renderChart = (salesData) => {
         if (salesChart) salesChart.destroy();
-        salesChart = new Chart(salesChartCtx, { type: 'line', data: { labels: salesData.labels, datasets: [{ label: 'المبيعات', data: salesData.values, backgroundColor: 'rgba(79, 70, 229, 0.1)', borderColor: '#4F46E5', borderWidth: 2, tension: 0.4, fill: true }] }, options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true } }, plugins: { legend: { display: false } } } });
+        salesChart = new Chart(salesChartCtx, { type: 'line', data: { labels: salesData.labels, datasets: [{ label: 'المنتجات المضافة', data: salesData.values, backgroundColor: 'rgba(79, 70, 229, 0.1)', borderColor: '#4F46E5', borderWidth: 2, tension: 0.4, fill: true }] }, options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true } }, plugins: { legend: { display: false } } } });
     };
 
+    // Search runs on the server (Arabic-aware, ranked); an empty box shows the loaded list again.
+    let searchTimer;
     searchInput.addEventListener('input', (e) => {
-        const searchTerm = e.target.value.toLowerCase();
-        renderProducts(allProducts.filter(p => p.name.toLowerCase().includes(searchTerm)));
+        const searchTerm = e.target.value.trim();
+        clearTimeout(searchTimer);
+        if (!searchTerm) {
+            search = null;
+            renderProducts(allProducts, listCursor);
+            return;
+        }
+        searchTimer = setTimeout(async () => {
+            try {
+                // fetchPage sends the Bearer token, like fetchWithAuth
+                const page = await fetchPage(`${SEARCH_URL}?q=${encodeURIComponent(searchTerm)}&fields=${CARD_FIELDS}`);
+                // ignore responses for a term the user has already changed
+                if (searchInput.value.trim() === searchTerm) {
+                    search = { term: searchTerm, results: page.items, cursor: page.next };
+                    renderProducts(search.results, search.cursor);
+                }
+            } catch (error) {
+                console.error('Search failed:', error);
+            }
+        }, 250);
     });
 
-    const renderProducts = (products) => {
+    const renderProducts = (products, nextCursor = null) => {
+        if (loadMoreBtn) loadMoreBtn.style.display = nextCursor ? 'inline-flex' : 'none';
         productGrid.innerHTML = '';
         if (!products || products.length === 0) {
             productGrid.innerHTML = '<p>لا توجد منتجات لعرضها. ابدأ بإضافة منتج جديد.</p>';
@@ -204,7 +405,14 @@ document.addEventListener('DOMContentLoaded', () => {
         modal.style.display = 'flex';
     };
 
-    const openModalForEdit = (product) => {
+    // Listings carry the summary fields only; load the whole product for the form.
+    const openModalForEdit = async (summary) => {
+        let product = summary;
+        try {
+            product = await fetchWithAuth(`${API_URL}/${summary.id}`);
+        } catch (error) {
+            console.error('Error loading product:', error);
+        }
         productIdField.value = product.id;
         productNameField.value = product.name;
         productPriceField.value = product.price;
@@ -233,7 +441,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const method = id ? 'PUT' : 'POST';
             await fetchWithAuth(url, { method, body: JSON.stringify(productData) });
             closeModal();
-            loadDashboardData();
+            if (!changesLive) loadDashboardData();
         } catch (error) {
             alert(`فشل حفظ المنتج: ${error.message}`);
         }
@@ -244,7 +452,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!confirm('هل أنت متأكد من رغبتك في حذف هذا المنتج؟')) return;
         try {
             await fetchWithAuth(`${API_URL}/${id}`, { method: 'DELETE' });
-            loadDashboardData();
+            if (!changesLive) loadDashboardData();
         } catch (error) {
             alert(`فشل حذف المنتج: ${error.message}`);
         }
@@ -260,7 +468,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!confirm(confirmMsg)) return;
         try {
             await fetchWithAuth(`${API_URL}/${product.id}/status`, { method: 'PUT', body: JSON.stringify({ status: newStatus }) });
-            loadDashboardData();
+            if (!changesLive) loadDashboardData();
         } catch (error) {
             alert(`فشل تحديث الحالة: ${error.message}`);
         }
@@ -273,7 +481,7 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 const result = await fetchWithAuth(CLEANUP_URL, { method: 'POST' }, false); 
                 alert(result.msg);
-                loadDashboardData(); 
+                if (!changesLive) loadDashboardData();
             } catch (error) {
                 alert(`فشل التنظيف: ${error.message}`);
             }
@@ -0,0 +1,7 @@
+import os
+
+# main.py builds its Firestore/Auth clients at import; the unit tests only
+# exercise pure helpers, so point it at the in-memory stand-in.
+os.environ.setdefault("STORE_BACKEND", "memory")
+os.environ.setdefault("ALLOW_MEMORY_BACKEND", "1")
+os.environ.setdefault("ROLLUP_RECONCILE_SECONDS", "0")
@@ -0,0 +1,66 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_returns_stored_value(clock):
+    c = TTLCache(4, ttl=10)
+    c.set("a", 1)
+    assert c.get("a") == (True, 1)
+    assert c.get("b") == (False, None)
+    assert c.stats() == {"size": 1, "maxsize": 4, "hits": 1, "misses": 1}
+
+
+def test_cached_none_is_a_hit(clock):
+    c = TTLCache(4, ttl=10)
+    c.set("a", None)
+    assert c.get("a") == (True, None)
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(4, ttl=10)
+    c.set("a", 1)
+    clock[0] += 9.9
+    assert c.get("a") == (True, 1)
+    clock[0] += 0.1
+    assert c.get("a") == (False, None)
+    assert c.stats()["size"] == 0
+
+
+def test_per_entry_ttl(clock):
+    c = TTLCache(4, ttl=10)
+    c.set("short", 1, ttl=1)
+    c.set("long", 2)
+    clock[0] += 2
+    assert c.get("short") == (False, None)
+    assert c.get("long") == (True, 2)
+
+
+def test_least_recently_used_is_evicted(clock):
+    c = TTLCache(2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")          # a is now the most recently used
+    c.set("c", 3)
+    assert c.get("b") == (False, None)
+    assert c.get("a") == (True, 1)
+    assert c.get("c") == (True, 3)
+
+
+def test_invalidate_and_clear(clock):
+    c = TTLCache(4, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.invalidate("a")
+    c.invalidate("missing")
+    assert c.get("a") == (False, None)
+    c.clear()
+    assert c.get("b") == (False, None)
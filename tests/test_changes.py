@@ -0,0 +1,80 @@
+import threading
+
+from changes import ChangeLog
+
+
+def items(changes):
+    return [change.item for change in changes]
+
+
+def test_read_returns_events_after_position():
+    log = ChangeLog(maxlen=10)
+    log.reset(started_at=0)
+    log.append(1, ["a", "b"])
+    log.append(2, ["c"])
+    assert items(log.read(0, log.generation, timeout=0)) == ["a", "b", "c"]
+    assert items(log.read(2, log.generation, timeout=0)) == ["c"]
+    assert items(log.read(0, log.generation, timeout=0, limit=2)) == ["a", "b"]
+    assert log.read(3, log.generation, timeout=0) == []
+
+
+def test_head_starts_live():
+    log = ChangeLog()
+    log.reset(started_at=5)
+    assert log.head() == (0, 5)
+    log.append(7, ["a"])
+    assert log.head() == (1, 7)
+
+
+def test_position_replays_events_at_since():
+    log = ChangeLog(maxlen=10)
+    log.reset(started_at=0)
+    log.append(1, ["a"])
+    log.append(2, ["b"])
+    log.append(3, ["c"])
+    assert items(log.read(log.position(2), log.generation, timeout=0)) == ["b", "c"]
+    assert log.position(4) == 3
+    assert log.position(0) == 0
+
+
+def test_position_before_the_log_requires_reload():
+    log = ChangeLog(maxlen=2)
+    assert log.position(1) is None          # never started
+    log.reset(started_at=10)
+    assert log.position(9) is None
+    log.append(11, ["a"])
+    log.append(12, ["b"])
+    log.append(13, ["c"])                   # evicts the event at 11
+    assert log.position(11) is None
+    assert log.position(12) == 1
+
+
+def test_subscriber_that_fell_behind_starts_over():
+    log = ChangeLog(maxlen=2)
+    log.reset(started_at=0)
+    log.append(1, ["a", "b", "c"])
+    assert log.read(0, log.generation, timeout=0) is None
+    assert items(log.read(1, log.generation, timeout=0)) == ["b", "c"]
+
+
+def test_reset_invalidates_old_generation():
+    log = ChangeLog()
+    log.reset(started_at=0)
+    generation = log.generation
+    log.append(1, ["a"])
+    log.reset(started_at=5)
+    assert log.read(0, generation, timeout=0) is None
+    assert log.read(0, log.generation, timeout=0) == []
+
+
+def test_read_waits_for_the_next_event():
+    log = ChangeLog()
+    log.reset(started_at=0)
+    position, _ = log.head()
+    timer = threading.Timer(0.05, log.append, (1, ["a"]))
+    timer.start()
+    try:
+        assert items(log.read(position, log.generation, timeout=5)) == ["a"]
+    finally:
+        timer.cancel()
+    assert log.read(1, log.generation, timeout=0.01) == []
@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+from flask import Response
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header, parse_etags
+
+from encoding import compress_response, encoded_etag, etag_variants, matching_etag
+
+
+def accept(value):
+    return parse_accept_header(value, Accept)
+
+
+def test_encoded_etag_is_distinct_per_coding():
+    assert encoded_etag("v1", "gzip") == "v1-gzip"
+    assert encoded_etag("v1", "br") == "v1-br"
+    assert etag_variants("v1") == ["v1", "v1-br", "v1-gzip"]
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('"v1"', "v1"),
+    ('"v1-gzip"', "v1-gzip"),
+    ('"other", "v1-br"', "v1-br"),
+    ("*", "v1"),
+    ('"v2", "v2-gzip"', None),
+    ('W/"v1"', None),        # strong comparison, as If-Match requires
+])
+def test_matching_etag(header, expected):
+    assert matching_etag(parse_etags(header), "v1") == expected
+
+
+def test_compressed_response_gets_its_own_etag():
+    body = b'{"name": "' + b"x" * 2000 + b'"}'
+    response = Response(body, mimetype="application/json")
+    response.set_etag("v1")
+    response = compress_response(response, accept("gzip"), min_size=100)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.get_etag() == ("v1-gzip", False)
+    assert gzip.decompress(response.get_data()) == body
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_weak_etag_and_small_bodies_are_left_alone():
+    small = Response(b"{}", mimetype="application/json")
+    small.set_etag("v1")
+    small = compress_response(small, accept("gzip"), min_size=100)
+    assert "Content-Encoding" not in small.headers
+    assert small.get_etag() == ("v1", False)
+
+    weak = Response(b"x" * 500, mimetype="application/json")
+    weak.set_etag("v1", weak=True)
+    weak = compress_response(weak, accept("gzip"), min_size=100)
+    assert weak.headers["Content-Encoding"] == "gzip"
+    assert weak.get_etag() == ("v1", True)
+
+
+def test_identity_client_gets_plain_body():
+    response = Response(b"x" * 500, mimetype="application/json")
+    response = compress_response(response, accept("identity"), min_size=100)
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == b"x" * 500
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from main import decode_cursor, encode_cursor, split_page
+
+
+class Doc:
+    def __init__(self, doc_id, created_at):
+        self.id = doc_id
+        self._data = {"created_at": created_at}
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+def test_cursor_round_trip():
+    created = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = encode_cursor("abc", created)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == {"created_at": created, "__name__": "abc"}
+
+
+def test_cursor_without_timestamp():
+    assert decode_cursor(encode_cursor("abc", None)) == {"created_at": None, "__name__": "abc"}
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "e30", encode_cursor("x", None)[:-3]])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_split_page_last_page_has_no_cursor():
+    docs = [Doc(str(i), None) for i in range(3)]
+    assert split_page(docs, 3) == (docs, None)
+    assert split_page([], 3) == ([], None)
+
+
+def test_split_page_trims_lookahead_and_points_at_last_doc():
+    created = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    docs = [Doc(str(i), created) for i in range(4)]
+    page, cursor = split_page(docs, 3)
+    assert page == docs[:3]
+    assert decode_cursor(cursor) == {"created_at": created, "__name__": "2"}
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import main
+from main import merge_rollup_deltas, product_rollup_delta, rollup_needs_rebuild
+
+CREATED = datetime(2024, 3, 9, tzinfo=timezone.utc)
+
+
+def product(**fields):
+    return {"price": "2.5", "quantity": 4, "status": "available", "creator_uid": "u1", "created_at": CREATED, **fields}
+
+
+def test_product_delta():
+    assert product_rollup_delta(product()) == {
+        "total": 1,
+        "inventory_value": 10.0,
+        "by_status": {"available": 1},
+        "by_creator": {"u1": 1},
+        "created_by_month": {"2024-03": 1},
+    }
+
+
+def test_removal_delta_is_negated():
+    delta = product_rollup_delta(product(), -1)
+    assert delta["total"] == -1
+    assert delta["inventory_value"] == -10.0
+    assert delta["by_status"] == {"available": -1}
+
+
+def test_bad_price_counts_no_value_and_missing_fields_are_bucketed():
+    delta = product_rollup_delta({"price": "n/a", "quantity": 3, "created_at": CREATED})
+    assert delta["inventory_value"] == 0.0
+    assert delta["by_status"] == {"unknown": 1}
+    assert delta["by_creator"] == {"unknown": 1}
+
+
+def test_pending_timestamp_counts_as_this_month():
+    month = datetime.now(timezone.utc).strftime("%Y-%m")
+    assert product_rollup_delta(product(created_at=object()))["created_by_month"] == {month: 1}
+
+
+def test_merge_sums_scalars_and_buckets():
+    old = product()
+    new = product(status="unavailable", quantity=0)
+    merged = merge_rollup_deltas([product_rollup_delta(old, -1), product_rollup_delta(new)])
+    assert merged == {
+        "total": 0,
+        "inventory_value": -10.0,
+        "by_status": {"available": -1, "unavailable": 1},
+        "by_creator": {"u1": 0},
+        "created_by_month": {"2024-03": 0},
+    }
+    assert merge_rollup_deltas([]) == {}
+
+
+def test_needs_rebuild_until_first_rebuild_finished(monkeypatch):
+    monkeypatch.setattr(main, "ROLLUP_RECONCILE_SECONDS", 0)
+    assert rollup_needs_rebuild({})
+    assert rollup_needs_rebuild({"rebuild_job": "j1"})
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    assert not rollup_needs_rebuild({"rebuilt_at": old})
+
+
+def test_reconcile_interval(monkeypatch):
+    monkeypatch.setattr(main, "ROLLUP_RECONCILE_SECONDS", 3600)
+    now = datetime.now(timezone.utc)
+    assert not rollup_needs_rebuild({"rebuilt_at": now - timedelta(minutes=5)})
+    assert rollup_needs_rebuild({"rebuilt_at": now - timedelta(hours=2)})
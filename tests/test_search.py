@@ -0,0 +1,91 @@
+import pytest
+
+from search import SearchIndex, normalize, strip_article, tokenize
+
+
+@pytest.mark.parametrize("text, folded", [
+    ("أحمد", "احمد"),
+    ("إسلام", "اسلام"),
+    ("آية", "ايه"),
+    ("مستشفى", "مستشفي"),
+    ("مكتبة", "مكتبه"),
+    ("مُنْتَجٌ", "منتج"),
+    ("مـنـتـج", "منتج"),
+    ("٢٠٢٤", "2024"),
+    ("ﻻ", "لا"),
+    ("Café", "café"),
+])
+def test_normalize_folds_letters_diacritics_and_digits(text, folded):
+    assert normalize(text) == folded
+
+
+@pytest.mark.parametrize("word, stripped", [
+    ("المنتج", "منتج"),
+    ("والمنتج", "منتج"),
+    ("بالسعر", "سعر"),
+    ("للبيع", "بيع"),
+    ("الم", "الم"),     # too short to be article + word
+    ("ال", "ال"),
+    ("منتج", "منتج"),
+])
+def test_strip_article(word, stripped):
+    assert strip_article(word) == stripped
+
+
+def test_tokenize():
+    assert tokenize("المُنتج الجديد، Blue") == ["منتج", "جديد", "blue"]
+
+
+@pytest.fixture
+def index():
+    idx = SearchIndex({"name": 2.0, "description": 1.0})
+    idx.put("tea", {"name": "الشاي الأخضر", "description": "شاي طبيعي"}, payload="tea", recency=1)
+    idx.put("coffee", {"name": "قهوة عربية", "description": "مع الهيل"}, payload="coffee", recency=2)
+    idx.put("cup", {"name": "كوب شاي", "description": ""}, payload="cup", recency=3)
+    return idx
+
+
+def ids(results):
+    return [payload for _, payload in results]
+
+
+def test_query_is_normalized_like_the_index(index):
+    assert ids(index.search("قهوه")) == ["coffee"]
+    assert ids(index.search("الأخضر")) == ["tea"]
+    assert ids(index.search("الاخضر")) == ["tea"]
+
+
+@pytest.mark.parametrize("query", ["ال", "الش", "الشا", "الشاي", "شا"])
+def test_partial_article_queries_match(index, query):
+    assert "tea" in ids(index.search(query))
+
+
+def test_every_word_must_match(index):
+    assert ids(index.search("شاي اخضر")) == ["tea"]
+    assert index.search("شاي قهوة") == []
+    assert index.search("   ") == []
+
+
+def test_exact_and_title_matches_rank_first(index):
+    # both mention شاي in the name; the title phrase bonus puts "الشاي ..." first
+    assert ids(index.search("الشاي")) == ["tea", "cup"]
+    # exact term beats prefix: "كوب" only matches cup
+    assert ids(index.search("كو")) == ["cup"]
+
+
+def test_prefix_match_scores_below_exact(index):
+    index.put("shai", {"name": "أكواب شايات"}, payload="shai", recency=9)
+    results = index.search("شاي")
+    assert ids(results)[-1] == "shai"
+
+
+def test_remove_and_reindex(index):
+    index.remove("tea")
+    assert index.search("اخضر") == []
+    index.put("cup", {"name": "كوب قهوة"}, payload="cup", recency=3)
+    assert ids(index.search("شاي")) == []
+    assert sorted(ids(index.search("قهوة"))) == ["coffee", "cup"]
+
+
+def test_predicate_filters(index):
+    assert ids(index.search("شاي", predicate=lambda p: p != "tea")) == ["cup"]